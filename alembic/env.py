@@ -15,7 +15,9 @@ from src.db.config import SQLALCHEMY_DATABASE_URL
 # import needed to run model classes declarations
 # as that adds needed metadata to Base
 from src.db.model.service import DBService  # noqa # type: ignore
+from src.db.model.service import DBServiceEndpoint  # noqa # type: ignore
 from src.db.model.token import DBToken  # noqa # type: ignore
+from src.db.model.version import DBServicesVersion  # noqa # type: ignore
 
 
 # this is the Alembic Config object, which provides
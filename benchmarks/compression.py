@@ -0,0 +1,154 @@
+"""
+Sends requests through the gateway to a service answering with a JSON
+document, accepting each supported encoding, and reports the bytes sent to
+the client and the CPU time spent per request. Responses are first
+buffered, then streamed.
+
+Uses the local database. Run with `python -m benchmarks.compression`
+"""
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, MutableMapping
+
+import uvicorn
+from httpx import AsyncClient
+
+from src.api import proxy
+from src.api.encoding import ENCODINGS, compress
+from src.api.rate_limit import rate_limiter
+from src.auth import get_admin, ignore_auth
+from src.main import app, lifespan
+
+
+PORT = 26417
+REQUESTS = 200
+ITEMS = 500
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+
+DOCUMENT = json.dumps(
+    [
+        {"id": i, "name": f"item {i}", "tags": ["a", "b"], "price": i * 1.5}
+        for i in range(ITEMS)
+    ]
+).encode()
+
+
+async def json_service(
+    scope: Scope,
+    receive: Callable[[], Awaitable[Message]],
+    send: Callable[[Message], Awaitable[None]],
+) -> None:
+    """ASGI app answering with DOCUMENT, in 16 KiB chunks"""
+    if scope["type"] != "http":
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    for start in range(0, len(DOCUMENT), 16384):
+        end = start + 16384
+        chunk = DOCUMENT[start:end]
+        await send(
+            {"type": "http.response.body", "body": chunk, "more_body": True}
+        )
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def measure(client: AsyncClient, encoding: str) -> Dict[str, float]:
+    headers = {"accept-encoding": encoding}
+    sizes: List[int] = []
+    cpu_start = time.process_time()
+    for _ in range(REQUESTS):
+        # NOTE: streamed, so the body isn't decompressed by httpx
+        async with client.stream("GET", "/json", headers=headers) as response:
+            assert response.status_code == 200
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+            sizes.append(len(body))
+    cpu = time.process_time() - cpu_start
+    return {"bytes": sum(sizes) / REQUESTS, "cpu": cpu / REQUESTS}
+
+
+def compression_cpu(encoding: str) -> float:
+    """Returns the CPU time spent compressing the document alone"""
+    start = time.process_time()
+    for _ in range(REQUESTS):
+        compress(DOCUMENT, encoding)
+    return (time.process_time() - start) / REQUESTS
+
+
+def report(mode: str, results: Dict[str, Dict[str, float]]) -> None:
+    baseline = results["identity"]
+    for encoding, result in results.items():
+        ratio = result["bytes"] / baseline["bytes"]
+        extra_cpu = (result["cpu"] - baseline["cpu"]) * 1000
+        print(
+            f"{mode:<9} {encoding:<9} {result['bytes']:>9.0f} B "
+            f"({ratio:6.1%})   cpu {result['cpu'] * 1000:6.2f} ms/req "
+            f"({extra_cpu:+.2f})"
+        )
+
+
+async def run() -> None:
+    server = uvicorn.Server(
+        uvicorn.Config(json_service, port=PORT, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    app.dependency_overrides[get_admin] = ignore_auth
+    # all requests come from the same client
+    rate_limiter.limit = None
+
+    buffered: Dict[str, Dict[str, float]] = {}
+    streamed: Dict[str, Dict[str, float]] = {}
+    async with lifespan(app):
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+            response = await client.post(
+                "/services",
+                json={
+                    "name": "json bench service",
+                    "url": f"http://localhost:{PORT}",
+                    "path": "^/json.*",
+                },
+            )
+            response.raise_for_status()
+            svc_id = response.json()["id"]
+            try:
+                await proxy.refresh_routing_table(None)
+                for encoding in reversed(ENCODINGS):
+                    buffered[encoding] = await measure(client, encoding)
+
+                await client.patch(
+                    f"/services/{svc_id}", json={"stream_threshold": 0}
+                )
+                await proxy.refresh_routing_table(None)
+                for encoding in reversed(ENCODINGS):
+                    streamed[encoding] = await measure(client, encoding)
+            finally:
+                await client.delete(f"/services/{svc_id}")
+
+    server.should_exit = True
+    await server_task
+
+    print(f"requests:  {REQUESTS} per encoding")
+    print(f"document:  {len(DOCUMENT)} B of JSON")
+    report("buffered", buffered)
+    report("streamed", streamed)
+    for encoding in ENCODINGS[:-1]:
+        cpu = compression_cpu(encoding) * 1000
+        print(f"{encoding} alone: {cpu:.3f} ms/req")
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Sends requests through the gateway to a service whose responses are
+sometimes much slower than usual, with and without hedging, and reports
+the latency percentiles seen by the clients.
+
+Uses the local database. Run with `python -m benchmarks.hedging`
+"""
+import asyncio
+import random
+import statistics
+import time
+from typing import Any, Awaitable, Callable, List, MutableMapping
+
+import uvicorn
+from httpx import AsyncClient
+
+from src.api import proxy
+from src.api.hedging import upstream_policies
+from src.api.rate_limit import rate_limiter
+from src.auth import get_admin, ignore_auth
+from src.main import app, lifespan
+
+
+PORT = 26416
+REQUESTS = 600
+CONCURRENCY = 10
+UPSTREAM_DELAY = 0.005  # seconds
+SLOW_DELAY = 0.3  # seconds
+SLOW_RATE = 0.03
+HEDGE_PERCENTILE = 95
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+
+
+async def slow_service(
+    scope: Scope,
+    receive: Callable[[], Awaitable[Message]],
+    send: Callable[[Message], Awaitable[None]],
+) -> None:
+    """ASGI app answering after UPSTREAM_DELAY, or sometimes SLOW_DELAY"""
+    if scope["type"] != "http":
+        return
+    slow = random.random() < SLOW_RATE
+    await asyncio.sleep(SLOW_DELAY if slow else UPSTREAM_DELAY)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-length", b"2")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def measure(client: AsyncClient) -> List[float]:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def request() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/slow")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+
+    await asyncio.gather(*[request() for _ in range(REQUESTS)])
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<12} p50 {percentiles[49] * 1000:7.1f} ms   "
+        f"p99 {percentiles[98] * 1000:7.1f} ms   "
+        f"max {max(latencies) * 1000:7.1f} ms"
+    )
+
+
+async def run() -> None:
+    server = uvicorn.Server(
+        uvicorn.Config(slow_service, port=PORT, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    app.dependency_overrides[get_admin] = ignore_auth
+    # all requests come from the same client
+    rate_limiter.limit = None
+
+    async with lifespan(app):
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+            response = await client.post(
+                "/services",
+                json={
+                    "name": "hedged bench service",
+                    "url": f"http://localhost:{PORT}",
+                    "path": "^/slow.*",
+                },
+            )
+            response.raise_for_status()
+            svc_id = response.json()["id"]
+            try:
+                await proxy.refresh_routing_table(None)
+                without_hedging = await measure(client)
+
+                await client.patch(
+                    f"/services/{svc_id}",
+                    json={"hedge_percentile": HEDGE_PERCENTILE},
+                )
+                await proxy.refresh_routing_table(None)
+                with_hedging = await measure(client)
+                stats = upstream_policies.get(svc_id).stats()
+            finally:
+                await client.delete(f"/services/{svc_id}")
+
+    server.should_exit = True
+    await server_task
+
+    print(f"requests:    {REQUESTS} ({CONCURRENCY} at a time)")
+    print(f"slow rate:   {SLOW_RATE:.0%} take {SLOW_DELAY * 1000:.0f} ms")
+    report("no hedging", without_hedging)
+    report(f"hedging p{HEDGE_PERCENTILE}", with_hedging)
+    print(f"hedges:      {stats.hedges} ({stats.hedges_won} won)")
+    print(f"over budget: {stats.budget_exhausted}")
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Load test of the proxy's hot path. Runs the gateway in its own process, in
+front of the dummy service used by `src/api/proxy_test.py`, and sends it
+requests at fixed concurrency levels: for small, large and streamed
+responses, anonymous and authenticated, with a varying number of services
+registered. Reports the requests per second and latency percentiles of
+each scenario, and writes them to a JSON file, so runs of different
+commits can be compared with `--compare`.
+
+Uses the local database. Run with `python -m benchmarks.load`
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import IO, Any, Dict, List, Optional
+
+from httpx import AsyncClient, Limits
+from jose import jwt
+
+from benchmarks.workers import uvicorn, wait_until_ready
+
+
+GATEWAY_PORT = 26421
+SERVICE_PORT = 26422
+GATEWAY_URL = f"http://localhost:{GATEWAY_PORT}"
+AUTH_SECRET = "load benchmark secret"
+
+# path requested for each payload, and the service's stream threshold
+PAYLOADS = {
+    "small": ("/hello", None),
+    "large": ("/hello/big", None),
+    "streamed": ("/hello/big", 0),
+}
+AUTH_MODES = ["anonymous", "authenticated"]
+
+
+def token(admin: bool) -> str:
+    now = int(time.time())
+    claims = {
+        "email": "load@example.com",
+        "sub": 1 if admin else 2,
+        "admin": admin,
+        "iat": now,
+        "exp": now + 3600,
+    }
+    return str(jwt.encode(claims, AUTH_SECRET, algorithm="HS256"))
+
+
+def commit() -> str:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() or "unknown"
+
+
+async def measure(
+    client: AsyncClient,
+    path: str,
+    headers: Dict[str, str],
+    concurrency: int,
+    duration: float,
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def requests(deadline: float, record: bool) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+    # warm up the connections and caches first
+    warm_up = time.perf_counter() + min(1.0, duration / 4)
+    await asyncio.gather(
+        *[requests(warm_up, False) for _ in range(concurrency)]
+    )
+
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(
+        *[requests(deadline, True) for _ in range(concurrency)]
+    )
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+async def add_service(
+    client: AsyncClient, admin: Dict[str, str], name: str, path: str
+) -> int:
+    response = await client.post(
+        "/services",
+        headers=admin,
+        json={
+            "name": name,
+            "url": f"http://localhost:{SERVICE_PORT}",
+            "path": path,
+        },
+    )
+    response.raise_for_status()
+    return int(response.json()["id"])
+
+
+async def run_scenarios(
+    client: AsyncClient, args: argparse.Namespace, svc_ids: List[int]
+) -> List[Dict[str, Any]]:
+    admin = {"authorization": f"Bearer {token(admin=True)}"}
+    auth_headers = {
+        "anonymous": {},
+        "authenticated": {"authorization": f"Bearer {token(admin=False)}"},
+    }
+    results: List[Dict[str, Any]] = []
+
+    svc_id = await add_service(client, admin, "load bench", "^/hello.*")
+    svc_ids.append(svc_id)
+    for services in args.services:
+        # filler services, so the routing table has `services` routes
+        while len(svc_ids) < services:
+            name = f"load bench filler {len(svc_ids)}"
+            path = f"^/filler-{len(svc_ids)}/.*"
+            svc_ids.append(await add_service(client, admin, name, path))
+
+        for payload, (path, stream_threshold) in PAYLOADS.items():
+            response = await client.patch(
+                f"/services/{svc_id}",
+                headers=admin,
+                json={"stream_threshold": stream_threshold},
+            )
+            response.raise_for_status()
+            for auth in AUTH_MODES:
+                for concurrency in args.concurrency:
+                    result = await measure(
+                        client,
+                        path,
+                        auth_headers[auth],
+                        concurrency,
+                        args.duration,
+                    )
+                    scenario = {
+                        "payload": payload,
+                        "auth": auth,
+                        "services": services,
+                        "concurrency": concurrency,
+                    }
+                    results.append({**scenario, **result})
+                    report(results[-1])
+    return results
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    await wait_until_ready(f"http://localhost:{SERVICE_PORT}/health")
+    await wait_until_ready(f"{GATEWAY_URL}/health")
+
+    limits = Limits(max_connections=None, max_keepalive_connections=None)
+    svc_ids: List[int] = []
+    async with AsyncClient(base_url=GATEWAY_URL, limits=limits) as client:
+        try:
+            return await run_scenarios(client, args, svc_ids)
+        finally:
+            admin = {"authorization": f"Bearer {token(admin=True)}"}
+            for id in svc_ids:
+                await client.delete(f"/services/{id}", headers=admin)
+
+
+def scenario_key(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['payload']:<9} {result['auth']:<13} "
+        f"{result['services']:>4} svcs {result['concurrency']:>4} conc"
+    )
+
+
+def report(
+    result: Dict[str, Any], old: Optional[Dict[str, Any]] = None
+) -> None:
+    line = (
+        f"{scenario_key(result)}  {result['rps']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  "
+        f"p99 {result['p99_ms']:7.1f} ms"
+    )
+    if result["errors"]:
+        line += f"  ({result['errors']} errors)"
+    if old is not None:
+        rps = result["rps"] / old["rps"] - 1
+        p99 = result["p99_ms"] / old["p99_ms"] - 1
+        line += f"  rps {rps:+.1%}  p99 {p99:+.1%}"
+    print(line)
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f"{old['commit']} -> {new['commit']}")
+    old_results = {scenario_key(r): r for r in old["results"]}
+    for result in new["results"]:
+        report(result, old_results.get(scenario_key(result)))
+
+
+def start_servers(log: IO[bytes]) -> List[subprocess.Popen[bytes]]:
+    service = uvicorn("src.api.proxy_test:dummy_app", SERVICE_PORT, 1, {}, log)
+    gateway = uvicorn(
+        "src.main:app",
+        GATEWAY_PORT,
+        1,
+        {"AUTH_SECRET": AUTH_SECRET, "RATE_LIMIT_RATE": "0"},
+        log,
+    )
+    return [service, gateway]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    def int_list(value: str) -> List[int]:
+        return [int(n) for n in value.split(",")]
+
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int_list, default=[1, 16, 64])
+    parser.add_argument("--services", type=int_list, default=[1, 10, 100])
+    parser.add_argument("--output", default="load-results.json")
+    parser.add_argument(
+        "--compare",
+        metavar="OLD_JSON",
+        help="compare the results in --output with an older run",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.compare:
+        compare(args.compare, args.output)
+        return
+
+    # NOTE: the gateway logs each request, so its output is kept aside
+    log = tempfile.NamedTemporaryFile(prefix="kinetix-", suffix=".log")
+    servers = start_servers(log)
+    try:
+        results = asyncio.run(run(args))
+    except Exception:
+        log.seek(0)
+        sys.stderr.buffer.write(log.read())
+        raise
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        log.close()
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "commit": commit(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "duration": args.duration,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
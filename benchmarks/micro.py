@@ -0,0 +1,338 @@
+"""
+Microbenchmarks of the gateway's hot primitives: building and matching
+routing tables, `specificity`, `parse_token`, merging OpenAPI schemas with
+`nested_update` and `Service.from_orm`. Inputs are generated with fixed
+seeds, so every run measures the same work, without any network or DB.
+
+Reports the time per operation and the memory it allocates, measured as
+the peak traced by tracemalloc while it runs. Each benchmark has a
+baseline file in `benchmarks/baselines/`. With `--check`, a benchmark
+slower or allocating more than its baseline, by more than the tolerance,
+fails the run. `--update` rewrites the baselines.
+
+Run with `python -m benchmarks.micro [--check | --update] [names...]`
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple
+
+from jose import jwt
+
+from benchmarks.routing import make_paths, make_routes
+from src.api.model.service import Service
+from src.api.routing import RoutingTable, specificity
+from src.api.schema_updater import nested_update
+from src.auth import AUTH_SECRET, parse_token, token_cache, verify_token
+from src.db.model.service import DBService
+
+
+SEED = 42
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+TIME_TOLERANCE = 0.25
+"""Fraction a benchmark can be slower than its baseline. Timings vary
+between runs, so it's far more lenient than the allocations' one"""
+
+ALLOC_TOLERANCE = 0.05
+"""Fraction a benchmark can allocate over its baseline"""
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # returns the operation to measure, with its inputs already generated
+    setup: Callable[[], Callable[[], Any]]
+
+
+class Result(NamedTuple):
+    ns_per_op: float
+    bytes_per_op: float
+
+
+def routing_build(n: int) -> Callable[[], Any]:
+    routes = make_routes(n, random.Random(SEED))
+    entries = [(route, route) for route in routes]
+
+    def op() -> Any:
+        return RoutingTable(sorted(entries, key=lambda e: specificity(e[0])))
+
+    return op
+
+
+def routing_match(n: int, cached: bool) -> Callable[[], Any]:
+    rng = random.Random(SEED)
+    routes = make_routes(n, rng)
+    paths = itertools.cycle(make_paths(n, rng))
+    table = RoutingTable(
+        [(route, route) for route in routes], cache_size=4096 if cached else 0
+    )
+    return lambda: table.match(next(paths))
+
+
+def specificity_op() -> Callable[[], Any]:
+    routes = itertools.cycle(make_routes(1_000, random.Random(SEED)))
+    return lambda: specificity(next(routes))
+
+
+def token_op(cached: bool) -> Callable[[], Any]:
+    # NOTE: fixed claims, expiring far in the future
+    claims = {
+        "email": "user@example.com",
+        "sub": 42,
+        "admin": False,
+        "iat": 1_700_000_000,
+        "exp": 4_000_000_000,
+    }
+    token = jwt.encode(claims, AUTH_SECRET, algorithm="HS256")
+    token_cache.clear()
+    if cached:
+        parse_token(token)
+        return lambda: parse_token(token)
+    return lambda: verify_token(token)
+
+
+def make_schema(
+    rng: random.Random, prefix: str, paths: int, schemas: int
+) -> Dict[str, Any]:
+    """Generates an OpenAPI schema shaped like FastAPI's"""
+
+    def ref(i: int) -> Dict[str, Any]:
+        return {"$ref": f"#/components/schemas/{prefix}Model{i}"}
+
+    def operation(i: int) -> Dict[str, Any]:
+        return {
+            "summary": f"Operation {i}",
+            "operationId": f"{prefix}_operation_{i}",
+            "parameters": [
+                {
+                    "name": "item_id",
+                    "in": "path",
+                    "required": True,
+                    "schema": {"type": "integer", "title": "Item Id"},
+                }
+            ],
+            "responses": {
+                "200": {
+                    "description": "Successful Response",
+                    "content": {
+                        "application/json": {
+                            "schema": ref(rng.randrange(schemas))
+                        }
+                    },
+                },
+                "422": {
+                    "description": "Validation Error",
+                    "content": {
+                        "application/json": {
+                            "schema": {
+                                "$ref": "#/components/schemas/"
+                                "HTTPValidationError"
+                            }
+                        }
+                    },
+                },
+            },
+        }
+
+    methods = ["get", "put", "post", "delete"]
+    return {
+        "openapi": "3.0.2",
+        "info": {"title": prefix, "version": "0.1.0"},
+        "paths": {
+            f"/{prefix}/items{i}/{{item_id}}": {
+                method: operation(i)
+                for method in rng.sample(methods, rng.randint(1, 4))
+            }
+            for i in range(paths)
+        },
+        "components": {
+            "schemas": {
+                f"{prefix}Model{i}": {
+                    "title": f"{prefix}Model{i}",
+                    "type": "object",
+                    "required": ["id", "name"],
+                    "properties": {
+                        "id": {"title": "Id", "type": "integer"},
+                        "name": {"title": "Name", "type": "string"},
+                        "tags": {
+                            "title": "Tags",
+                            "type": "array",
+                            "items": {"type": "string"},
+                        },
+                        "parent": ref(rng.randrange(schemas)),
+                    },
+                }
+                for i in range(schemas)
+            }
+        },
+    }
+
+
+def schema_merge() -> Callable[[], Any]:
+    rng = random.Random(SEED)
+    base = make_schema(rng, "gateway", 20, 20)
+    children = [make_schema(rng, f"svc{i}", 100, 100) for i in range(5)]
+
+    # NOTE: the same work as SchemaCollector.merge
+    def op() -> Any:
+        schema = copy.deepcopy(base)
+        for child in children:
+            nested_update(schema, child)
+        return schema
+
+    return op
+
+
+def services_from_orm(n: int) -> Callable[[], Any]:
+    rng = random.Random(SEED)
+    db_services = [
+        DBService(
+            id=i,
+            name=f"service {i}",
+            url=f"http://svc{i}.local",
+            path=f"^/svc{i}/.*",
+            blocked=rng.random() < 0.1,
+            apikey="k" * 43,
+            stream_threshold=None,
+            cache_responses=False,
+            coalesce_requests=False,
+            hedge_percentile=None,
+            connect_retries=0,
+            max_in_flight=None,
+            max_queued=100,
+            queue_timeout=1.0,
+            rate_limit=None,
+            rate_limit_burst=None,
+            endpoint_rows=[],
+        )
+        for i in range(n)
+    ]
+    return lambda: list(map(Service.from_orm, db_services))
+
+
+BENCHMARKS = [
+    Benchmark("routing_build_100", lambda: routing_build(100)),
+    Benchmark("routing_build_1000", lambda: routing_build(1_000)),
+    Benchmark("routing_match_100", lambda: routing_match(100, False)),
+    Benchmark("routing_match_1000", lambda: routing_match(1_000, False)),
+    Benchmark("routing_match_cached", lambda: routing_match(1_000, True)),
+    Benchmark("specificity", specificity_op),
+    Benchmark("parse_token_cached", lambda: token_op(True)),
+    Benchmark("verify_token", lambda: token_op(False)),
+    Benchmark("schema_merge", schema_merge),
+    Benchmark("services_from_orm_1000", lambda: services_from_orm(1_000)),
+]
+
+
+def measure(benchmark: Benchmark) -> Result:
+    op = benchmark.setup()
+    # warms up caches, and gets past any lazy initialization
+    number, _ = timeit.Timer(op).autorange()
+    best = min(timeit.Timer(op).repeat(repeat=5, number=number))
+
+    # NOTE: measured apart, as tracing slows down the operation
+    samples = min(number, 50)
+    total = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        op()
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - start
+    tracemalloc.stop()
+
+    return Result(best / number * 1e9, total / samples)
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+
+def load_baseline(name: str) -> Result:
+    with open(baseline_path(name)) as file:
+        return Result(**json.load(file))
+
+
+def save_baseline(name: str, result: Result) -> None:
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    with open(baseline_path(name), "w") as file:
+        json.dump(
+            {
+                "ns_per_op": round(result.ns_per_op, 1),
+                "bytes_per_op": round(result.bytes_per_op),
+            },
+            file,
+            indent=2,
+        )
+        file.write("\n")
+
+
+def check(
+    result: Result, baseline: Result, time_tolerance: float
+) -> List[str]:
+    """Returns the ways the result regressed from its baseline"""
+    failures = []
+    if result.ns_per_op > baseline.ns_per_op * (1 + time_tolerance):
+        failures.append("slower")
+    if result.bytes_per_op > baseline.bytes_per_op * (1 + ALLOC_TOLERANCE):
+        failures.append("allocates more")
+    return failures
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true")
+    mode.add_argument("--update", action="store_true")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("names", nargs="*", help="benchmarks to run")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    benchmarks = [
+        b for b in BENCHMARKS if not args.names or b.name in args.names
+    ]
+
+    print(f"{'benchmark':<24} {'ns/op':>12} {'B/op':>10} {'vs baseline':>22}")
+    failed = []
+    for benchmark in benchmarks:
+        result = measure(benchmark)
+        line = (
+            f"{benchmark.name:<24} {result.ns_per_op:>12.1f}"
+            f" {result.bytes_per_op:>10.0f}"
+        )
+        if args.update:
+            save_baseline(benchmark.name, result)
+        elif os.path.exists(baseline_path(benchmark.name)):
+            baseline = load_baseline(benchmark.name)
+            time_change = result.ns_per_op / baseline.ns_per_op - 1
+            # NOTE: some operations don't allocate at all
+            allocated = max(baseline.bytes_per_op, 1)
+            alloc_change = result.bytes_per_op / allocated - 1
+            line += f" {time_change:>+10.1%} {alloc_change:>+10.1%}"
+            if args.check:
+                failures = check(result, baseline, args.time_tolerance)
+                if failures:
+                    failed.append(benchmark.name)
+                    line += f"  FAILED: {', '.join(failures)}"
+        elif args.check:
+            failed.append(benchmark.name)
+            line += "  FAILED: no baseline"
+        print(line)
+
+    if failed:
+        print(f"{len(failed)} benchmarks regressed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
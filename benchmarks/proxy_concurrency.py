@@ -0,0 +1,110 @@
+"""
+Sends concurrent anonymous requests through the gateway to a slow service,
+and reports how many of them the service saw at once. Proxied requests
+don't hold DB connections, so this isn't capped by the DB pool's size.
+
+Uses the local database. Run with `python -m benchmarks.proxy_concurrency`
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, MutableMapping
+
+import uvicorn
+from httpx import AsyncClient
+
+from src.api import proxy
+from src.auth import get_admin, ignore_auth
+from src.db.session import engine
+from src.main import app, lifespan
+
+
+PORT = 26415
+REQUESTS = 60
+UPSTREAM_DELAY = 0.2  # seconds
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+
+
+class SlowService:
+    """ASGI app answering after UPSTREAM_DELAY, tracking its concurrency"""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Callable[[], Awaitable[Message]],
+        send: Callable[[Message], Awaitable[None]],
+    ) -> None:
+        if scope["type"] != "http":
+            return
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(UPSTREAM_DELAY)
+        finally:
+            self.in_flight -= 1
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-length", b"2")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def run() -> None:
+    service = SlowService()
+    server = uvicorn.Server(
+        uvicorn.Config(service, port=PORT, log_level="warning")
+    )
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    app.dependency_overrides[get_admin] = ignore_auth
+
+    async with lifespan(app):
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+            response = await client.post(
+                "/services",
+                json={
+                    "name": "slow bench service",
+                    "url": f"http://localhost:{PORT}",
+                    "path": "^/slow.*",
+                },
+            )
+            response.raise_for_status()
+            svc_id = response.json()["id"]
+            try:
+                await proxy.refresh_routing_table(None)
+
+                start = time.perf_counter()
+                responses = await asyncio.gather(
+                    *[client.get("/slow") for _ in range(REQUESTS)]
+                )
+                elapsed = time.perf_counter() - start
+                assert all(r.status_code == 200 for r in responses)
+            finally:
+                await client.delete(f"/services/{svc_id}")
+
+    server.should_exit = True
+    await server_task
+
+    print(f"DB pool:                 {engine.pool.status()}")
+    print(f"concurrent requests:     {REQUESTS}")
+    print(f"max upstream in flight:  {service.max_in_flight}")
+    print(f"elapsed (s):             {elapsed:.2f}")
+    print(f"upstream delay (s):      {UPSTREAM_DELAY:.2f}")
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
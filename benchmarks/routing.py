@@ -0,0 +1,93 @@
+"""
+Compares the compiled routing table against a linear regex scan, with and
+without its route cache.
+
+Run with `python -m benchmarks.routing`
+"""
+import random
+import re
+import timeit
+from typing import List, Optional, Tuple
+
+from src.api.routing import RoutingTable, specificity
+
+
+SEED = 42
+SERVICE_COUNTS = [10, 100, 1_000, 10_000]
+LOOKUPS = 2_000
+
+
+def make_routes(n: int, rng: random.Random) -> List[str]:
+    """Generates `n` route regexes with a realistic mix of shapes"""
+    routes = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.6:
+            routes.append(f"^/svc{i}.*")
+        elif kind < 0.9:
+            routes.append(rf"^/svc{i}/items/\d+(/.*)?")
+        elif kind < 0.99:
+            routes.append(f"(/svc{i}|/alias{i})/.*")
+        else:
+            # no literal prefix
+            routes.append(rf"(/v\d+)?/legacy{i}/.*")
+    return sorted(routes, key=specificity)
+
+
+def make_paths(n: int, rng: random.Random) -> List[str]:
+    paths = []
+    for _ in range(LOOKUPS):
+        i = rng.randrange(n)
+        paths.append(
+            rng.choice(
+                [f"/svc{i}/x", f"/alias{i}/y", f"/v1/legacy{i}/z", "/404"]
+            )
+        )
+    return paths
+
+
+def linear_match(
+    table: List[Tuple[re.Pattern[str], str]], path: str
+) -> Optional[str]:
+    return next((v for (regex, v) in table if regex.fullmatch(path)), None)
+
+
+def main() -> None:
+    print(
+        f"{'services':>10} {'linear (us)':>12} {'compiled (us)':>14}"
+        f" {'cached (us)':>12}"
+    )
+
+    for n in SERVICE_COUNTS:
+        rng = random.Random(SEED)
+        routes = make_routes(n, rng)
+        paths = make_paths(n, rng)
+
+        linear = [(re.compile(r), r) for r in routes]
+        compiled = RoutingTable([(r, r) for r in routes], cache_size=0)
+        cached = RoutingTable([(r, r) for r in routes])
+
+        for path in paths:
+            assert linear_match(linear, path) == compiled.match(path)
+            # also warms up the cache
+            assert compiled.match(path) == cached.match(path)
+
+        linear_time = timeit.timeit(
+            lambda: [linear_match(linear, p) for p in paths], number=1
+        )
+        compiled_time = timeit.timeit(
+            lambda: [compiled.match(p) for p in paths], number=1
+        )
+        cached_time = timeit.timeit(
+            lambda: [cached.match(p) for p in paths], number=1
+        )
+
+        print(
+            f"{n:>10} {linear_time / LOOKUPS * 1e6:>12.2f}"
+            f" {compiled_time / LOOKUPS * 1e6:>14.2f}"
+            f" {cached_time / LOOKUPS * 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
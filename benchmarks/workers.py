@@ -0,0 +1,180 @@
+"""
+Runs the gateway with an increasing number of worker processes, in front of
+a service answering right away, and reports the requests per second it
+serves. The workers share the routing table through snapshots, so only the
+leader queries the DB.
+
+Each load generator runs in its own process, so they don't compete with
+the gateway for a single core. Throughput is bounded by the host's cores,
+shared by the gateway, the service and the load generators.
+
+Uses the local database. Run with `python -m benchmarks.workers`
+"""
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import (
+    IO,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    MutableMapping,
+)
+
+from httpx import AsyncClient, HTTPError
+
+
+GATEWAY_PORT = 26418
+SERVICE_PORT = 26419
+DURATION = 5.0  # seconds
+CONCURRENCY = 32  # per load generator
+LOAD_GENERATORS = 2
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+
+
+async def service(
+    scope: Scope,
+    receive: Callable[[], Awaitable[Message]],
+    send: Callable[[Message], Awaitable[None]],
+) -> None:
+    """ASGI app answering right away"""
+    if scope["type"] != "http":
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-length", b"2")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def uvicorn(
+    app: str, port: int, workers: int, env: Dict[str, str], log: IO[bytes]
+) -> Any:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            f"--port={port}",
+            f"--workers={workers}",
+            "--log-level=warning",
+            "--no-access-log",
+        ],
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=log,
+    )
+
+
+async def wait_until_ready(url: str) -> None:
+    async with AsyncClient() as client:
+        for _ in range(600):
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} didn't answer")
+
+
+async def generate_load(deadline: float) -> int:
+    url = f"http://localhost:{GATEWAY_PORT}/bench/hello"
+    completed = 0
+
+    async def requests(client: AsyncClient) -> None:
+        nonlocal completed
+        while time.time() < deadline:
+            response = await client.get(url)
+            assert response.status_code == 200
+            completed += 1
+
+    async with AsyncClient() as client:
+        await asyncio.gather(*[requests(client) for _ in range(CONCURRENCY)])
+    return completed
+
+
+def load_generator(deadline: float) -> int:
+    return asyncio.run(generate_load(deadline))
+
+
+def measure(workers: int, snapshot_dir: str, log: IO[bytes]) -> float:
+    gateway = uvicorn(
+        "src.main:app",
+        GATEWAY_PORT,
+        workers,
+        {
+            "SNAPSHOT_DIR": snapshot_dir,
+            "RATE_LIMIT_RATE": "0",
+            "INITIAL_SERVICES": (
+                f"workers bench,http://localhost:{SERVICE_PORT},^/bench.*"
+            ),
+        },
+        log,
+    )
+    try:
+        url = f"http://localhost:{GATEWAY_PORT}/bench/hello"
+        asyncio.run(wait_until_ready(url))
+        # give every worker time to pick up the routing table
+        time.sleep(1)
+
+        deadline = time.time() + DURATION
+        with multiprocessing.Pool(LOAD_GENERATORS) as pool:
+            completed = pool.map(load_generator, [deadline] * LOAD_GENERATORS)
+        return sum(completed) / DURATION
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+
+def main() -> None:
+    cores = os.cpu_count() or 1
+    worker_counts = [1] + [n for n in [2, 4, 8] if n <= cores]
+    # NOTE: the gateway logs each request, so its output is kept aside
+    log = tempfile.NamedTemporaryFile(prefix="kinetix-", suffix=".log")
+    service_process = uvicorn(
+        "benchmarks.workers:service",
+        SERVICE_PORT,
+        max(1, cores // 4),
+        {},
+        log,
+    )
+    results: List[float] = []
+    try:
+        asyncio.run(wait_until_ready(f"http://localhost:{SERVICE_PORT}"))
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            for workers in worker_counts:
+                results.append(measure(workers, snapshot_dir, log))
+    except Exception:
+        log.seek(0)
+        sys.stderr.buffer.write(log.read())
+        raise
+    finally:
+        service_process.terminate()
+        service_process.wait()
+        log.close()
+
+    print(f"cores:       {cores}")
+    print(f"load:        {LOAD_GENERATORS} x {CONCURRENCY} concurrent clients")
+    for workers, throughput in zip(worker_counts, results):
+        speedup = throughput / results[0]
+        print(
+            f"{workers} workers   {throughput:8.0f} req/s   "
+            f"x{speedup:.2f} ({speedup / workers:.0%} of linear)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import random
+from typing import Sequence
+
+from src.api.circuit_breaker import CircuitState, circuit_breakers
+from src.api.clients import client_pool
+from src.db.status_updater import endpoint_statuses
+
+
+def is_available(id: int, url: str) -> bool:
+    """Returns false if the URL failed its health check or its circuit"""
+    return (
+        endpoint_statuses.get((id, url), True)
+        and circuit_breakers.state(id, url) != CircuitState.OPEN
+    )
+
+
+def choose_endpoint(
+    id: int, urls: Sequence[str], rng: random.Random = random.Random()
+) -> str:
+    """
+    Chooses which of the service's URLs receives a request, using the
+    power of two choices: out of two random available URLs, the one with
+    fewer in-flight requests is picked.
+    """
+    if len(urls) == 1:
+        return urls[0]
+
+    # if none is available, trying any of them is better than failing
+    candidates = [url for url in urls if is_available(id, url)] or urls
+    if len(candidates) == 1:
+        return candidates[0]
+
+    first, second = rng.sample(candidates, 2)
+    if client_pool.in_flight(id, second) < client_pool.in_flight(id, first):
+        return second
+    return first
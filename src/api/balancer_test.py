@@ -0,0 +1,32 @@
+import random
+
+from src.api.balancer import choose_endpoint
+from src.api.clients import client_pool
+from src.db.status_updater import endpoint_statuses
+
+ID = 1_000_000
+URLS = ["http://a", "http://b"]
+
+
+def test_choose_endpoint_prefers_less_loaded_urls() -> None:
+    client_pool.get(ID, "http://a").in_flight = 5
+    client_pool.get(ID, "http://b").in_flight = 1
+    try:
+        for seed in range(10):
+            rng = random.Random(seed)
+            assert choose_endpoint(ID, URLS, rng) == "http://b"
+    finally:
+        client_pool.get(ID, "http://a").in_flight = 0
+        client_pool.get(ID, "http://b").in_flight = 0
+
+
+def test_choose_endpoint_skips_unhealthy_urls() -> None:
+    endpoint_statuses[(ID, "http://b")] = False
+    try:
+        assert {choose_endpoint(ID, URLS) for _ in range(10)} == {"http://a"}
+
+        # if none is healthy, any of them is used
+        endpoint_statuses[(ID, "http://a")] = False
+        assert choose_endpoint(ID, URLS) in URLS
+    finally:
+        endpoint_statuses.clear()
@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class BulkheadFullError(Exception):
+    def __init__(self) -> None:
+        super().__init__("Too many requests to the service")
+
+
+class BulkheadStats(BaseModel):
+    in_flight: int
+    queued: int
+    rejected: int
+    timed_out: int
+
+
+class Bulkhead:
+    """
+    Limits the requests handled at the same time for a single service, so
+    a slow one can't take up the whole gateway.
+
+    Requests over the limit wait in a bounded FIFO queue, for at most
+    `queue_timeout` seconds. Requests that find the queue full, or time
+    out while waiting, are rejected with BulkheadFullError.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        max_queued: int = 0,
+        queue_timeout: float = 0,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: Deque[asyncio.Future[None]] = deque()
+
+    def configure(
+        self, max_in_flight: Optional[int], max_queued: int, timeout: float
+    ) -> None:
+        """Updates the limits, letting waiting requests in if they grew"""
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = timeout
+        self._admit_waiters()
+
+    def _has_room(self) -> bool:
+        return (
+            self.max_in_flight is None or self.in_flight < self.max_in_flight
+        )
+
+    async def acquire(self) -> None:
+        if self._has_room() and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise BulkheadFullError()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # NOTE: asyncio.wait_for can swallow cancellations in python 3.11
+            await asyncio.wait([waiter], timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done():
+                # the slot was already handed over
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            self.timed_out += 1
+            raise BulkheadFullError()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._admit_waiters()
+
+    def _admit_waiters(self) -> None:
+        """Hands over free slots to the oldest waiting requests"""
+        while self._waiters and self._has_room():
+            self.in_flight += 1
+            self._waiters.popleft().set_result(None)
+
+    def stats(self) -> BulkheadStats:
+        return BulkheadStats(
+            in_flight=self.in_flight,
+            queued=len(self._waiters),
+            rejected=self.rejected,
+            timed_out=self.timed_out,
+        )
+
+
+class Bulkheads:
+    """Registry of bulkheads, keyed by service ID"""
+
+    def __init__(self) -> None:
+        self._bulkheads: Dict[int, Bulkhead] = {}
+
+    def get(
+        self,
+        id: int,
+        max_in_flight: Optional[int],
+        max_queued: int,
+        queue_timeout: float,
+    ) -> Bulkhead:
+        """Returns the service's bulkhead, updated with the given limits"""
+        bulkhead = self._bulkheads.get(id)
+        if bulkhead is None:
+            bulkhead = Bulkhead(max_in_flight, max_queued, queue_timeout)
+            self._bulkheads[id] = bulkhead
+        elif (
+            bulkhead.max_in_flight != max_in_flight
+            or bulkhead.max_queued != max_queued
+            or bulkhead.queue_timeout != queue_timeout
+        ):
+            bulkhead.configure(max_in_flight, max_queued, queue_timeout)
+        return bulkhead
+
+    def stats(self, id: int) -> BulkheadStats:
+        bulkhead = self._bulkheads.get(id)
+        return (bulkhead or Bulkhead()).stats()
+
+    def sync(self, ids: List[int]) -> None:
+        """Drops the bulkheads of services that no longer exist"""
+        for id in set(self._bulkheads) - set(ids):
+            del self._bulkheads[id]
+
+
+bulkheads = Bulkheads()
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from src.api.bulkhead import Bulkhead, BulkheadFullError
+
+
+async def test_bulkhead_queues_requests_over_the_limit() -> None:
+    bulkhead = Bulkhead(max_in_flight=1, max_queued=1, queue_timeout=1)
+    await bulkhead.acquire()
+
+    waiter = asyncio.create_task(bulkhead.acquire())
+    await asyncio.sleep(0)
+    assert bulkhead.stats().queued == 1
+
+    # the queue is full
+    with pytest.raises(BulkheadFullError):
+        await bulkhead.acquire()
+
+    # the slot is handed over to the waiting request
+    bulkhead.release()
+    await waiter
+    assert bulkhead.stats().in_flight == 1
+    assert bulkhead.stats().queued == 0
+    assert bulkhead.stats().rejected == 1
+
+
+async def test_bulkhead_queue_times_out() -> None:
+    bulkhead = Bulkhead(max_in_flight=1, max_queued=1, queue_timeout=0.01)
+    await bulkhead.acquire()
+
+    with pytest.raises(BulkheadFullError):
+        await bulkhead.acquire()
+
+    assert bulkhead.stats().timed_out == 1
+    assert bulkhead.stats().queued == 0
+
+
+async def test_bulkhead_cancelled_waiters_leave_the_queue() -> None:
+    bulkhead = Bulkhead(max_in_flight=1, max_queued=1, queue_timeout=1)
+    await bulkhead.acquire()
+
+    waiter = asyncio.create_task(bulkhead.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.wait([waiter])
+
+    assert bulkhead.stats().queued == 0
+    bulkhead.release()
+    assert bulkhead.stats().in_flight == 0
+
+
+async def test_bulkhead_admits_waiters_when_limit_grows() -> None:
+    bulkhead = Bulkhead(max_in_flight=1, max_queued=1, queue_timeout=1)
+    await bulkhead.acquire()
+    waiter = asyncio.create_task(bulkhead.acquire())
+    await asyncio.sleep(0)
+
+    bulkhead.configure(max_in_flight=2, max_queued=1, timeout=1)
+    await waiter
+    assert bulkhead.stats().in_flight == 2
+
+
+async def test_unlimited_bulkhead_counts_requests() -> None:
+    bulkhead = Bulkhead()
+    for _ in range(3):
+        await bulkhead.acquire()
+
+    assert bulkhead.stats().in_flight == 3
@@ -0,0 +1,158 @@
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Mapping, Sequence, Tuple
+
+from src.api.config import (
+    CIRCUIT_ERROR_RATE,
+    CIRCUIT_MIN_REQUESTS,
+    CIRCUIT_OPEN_DURATION,
+    CIRCUIT_SLOW_CALL,
+    CIRCUIT_SLOW_RATE,
+    CIRCUIT_WINDOW,
+)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Circuit is open")
+        # seconds until requests are let through again
+        self.retry_after = max(math.ceil(retry_after), 1)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a service while most of its recent requests
+    fail or are too slow.
+
+    The circuit opens when the rate of failed or slow requests among the
+    last `window` ones reaches its threshold. After `open_duration`
+    seconds, a single request is let through (half-open), and its outcome
+    decides whether the circuit closes or opens again.
+    """
+
+    def __init__(
+        self,
+        window: int = CIRCUIT_WINDOW,
+        min_requests: int = CIRCUIT_MIN_REQUESTS,
+        error_rate: float = CIRCUIT_ERROR_RATE,
+        slow_rate: float = CIRCUIT_SLOW_RATE,
+        slow_call: float = CIRCUIT_SLOW_CALL,
+        open_duration: float = CIRCUIT_OPEN_DURATION,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_call = slow_call
+        self.open_duration = open_duration
+        self.clock = clock
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._errors = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._state = CircuitState.CLOSED
+        self._probing = False
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and self.clock() - self._opened_at >= self.open_duration
+        ):
+            self._state = CircuitState.HALF_OPEN
+        return self._state
+
+    def acquire(self) -> None:
+        """Raises CircuitOpenError if the request must not be sent"""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return
+        if state == CircuitState.HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        raise CircuitOpenError(
+            self._opened_at + self.open_duration - self.clock()
+        )
+
+    def cancel(self) -> None:
+        """Called when a request was cancelled before its outcome was known"""
+        self._probing = False
+
+    def record(self, failed: bool, latency: float) -> None:
+        slow = latency >= self.slow_call
+
+        if self._state == CircuitState.HALF_OPEN and self._probing:
+            self._probing = False
+            if failed or slow:
+                self._open()
+            else:
+                self._reset(CircuitState.CLOSED)
+            return
+
+        if len(self._outcomes) == self._outcomes.maxlen:
+            old_failed, old_slow = self._outcomes[0]
+            self._errors -= old_failed
+            self._slow -= old_slow
+        self._outcomes.append((failed, slow))
+        self._errors += failed
+        self._slow += slow
+
+        count = len(self._outcomes)
+        if self._state == CircuitState.CLOSED and count >= self.min_requests:
+            if (
+                self._errors / count >= self.error_rate
+                or self._slow / count >= self.slow_rate
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        self._reset(CircuitState.OPEN)
+        self._opened_at = self.clock()
+
+    def _reset(self, state: CircuitState) -> None:
+        self._state = state
+        self._outcomes.clear()
+        self._errors = 0
+        self._slow = 0
+
+
+class CircuitBreakers:
+    """Registry of circuit breakers, keyed by service ID and URL"""
+
+    def __init__(self) -> None:
+        self._breakers: Dict[Tuple[int, str], CircuitBreaker] = {}
+
+    def get(self, id: int, url: str) -> CircuitBreaker:
+        breaker = self._breakers.get((id, url))
+        if breaker is None:
+            breaker = self._breakers[(id, url)] = CircuitBreaker()
+        return breaker
+
+    def state(self, id: int, url: str) -> CircuitState:
+        breaker = self._breakers.get((id, url))
+        return CircuitState.CLOSED if breaker is None else breaker.state
+
+    def service_state(self, id: int, urls: Sequence[str]) -> CircuitState:
+        """Returns the least restrictive state among the service's URLs"""
+        states = {self.state(id, url) for url in urls}
+        for state in [CircuitState.CLOSED, CircuitState.HALF_OPEN]:
+            if state in states:
+                return state
+        return CircuitState.OPEN
+
+    def sync(self, services: Mapping[int, Sequence[str]]) -> None:
+        """Drops the breakers of URLs that no longer exist"""
+        for id, url in list(self._breakers):
+            if url not in services.get(id, ()):
+                del self._breakers[(id, url)]
+
+
+circuit_breakers = CircuitBreakers()
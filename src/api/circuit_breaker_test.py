@@ -0,0 +1,92 @@
+import pytest
+
+from src.api.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def state(breaker: CircuitBreaker) -> CircuitState:
+    # NOTE: avoids mypy narrowing the property between checks
+    return breaker.state
+
+
+def make_breaker(clock: Clock) -> CircuitBreaker:
+    return CircuitBreaker(
+        window=4,
+        min_requests=4,
+        error_rate=0.5,
+        slow_rate=0.75,
+        slow_call=1,
+        open_duration=10,
+        clock=clock,
+    )
+
+
+def test_circuit_opens_on_errors() -> None:
+    clock = Clock()
+    breaker = make_breaker(clock)
+
+    for failed in [True, False, True]:
+        breaker.acquire()
+        breaker.record(failed, latency=0.1)
+    # not enough requests yet
+    assert state(breaker) == CircuitState.CLOSED
+
+    breaker.record(False, latency=0.1)
+    assert state(breaker) == CircuitState.OPEN
+
+    clock.now = 4
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.acquire()
+    assert e.value.retry_after == 6
+
+
+def test_circuit_opens_on_slow_requests() -> None:
+    breaker = make_breaker(Clock())
+    for latency in [2, 2, 0.1, 2]:
+        breaker.record(False, latency)
+    assert state(breaker) == CircuitState.OPEN
+
+
+def test_half_open_circuit_lets_one_request_through() -> None:
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record(True, latency=0.1)
+
+    clock.now = 10
+    assert state(breaker) == CircuitState.HALF_OPEN
+    breaker.acquire()
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    # a failed probe opens the circuit again
+    breaker.record(True, latency=0.1)
+    assert state(breaker) == CircuitState.OPEN
+
+    clock.now = 20
+    breaker.acquire()
+    breaker.record(False, latency=0.1)
+    assert state(breaker) == CircuitState.CLOSED
+
+
+def test_cancelled_probe_frees_the_half_open_circuit() -> None:
+    clock = Clock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record(True, latency=0.1)
+
+    clock.now = 10
+    breaker.acquire()
+    breaker.cancel()
+    breaker.acquire()
@@ -0,0 +1,310 @@
+import asyncio
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from urllib.request import Request as UrllibRequest
+
+from httpx import (
+    AsyncByteStream,
+    AsyncClient,
+    AsyncHTTPTransport,
+    Limits,
+    Request,
+    Response,
+    Timeout,
+)
+from httpcore.backends.base import AsyncNetworkBackend, AsyncNetworkStream
+from pydantic import BaseModel
+
+from src.api.config import (
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE,
+    UPSTREAM_TIMEOUT,
+)
+from src.api.metrics import Labels, registry, service_metrics
+
+
+APIKEY_HEADER = "X-Apikey"
+"""Header carrying the service's API key, sent in every request to it"""
+
+
+class ClientStats(BaseModel):
+    url: str
+    requests: int
+    in_flight: int
+    errors: int
+    connections: int
+    idle_connections: int
+
+
+class _RejectCookies(DefaultCookiePolicy):
+    """Clients are shared between users, so they must never store cookies"""
+
+    def set_ok(self, cookie: Any, request: UrllibRequest) -> bool:
+        return False
+
+
+class _TrackedStream(AsyncByteStream):
+    """Response stream that calls `on_close` once it has been closed"""
+
+    def __init__(
+        self, stream: AsyncByteStream, on_close: Callable[[], None]
+    ) -> None:
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _TimedBackend(AsyncNetworkBackend):
+    """Network backend reporting the time taken to open each connection"""
+
+    def __init__(
+        self, backend: AsyncNetworkBackend, on_connect: Callable[[float], None]
+    ) -> None:
+        self._backend = backend
+        self._on_connect = on_connect
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+    ) -> AsyncNetworkStream:
+        start = time.perf_counter()
+        stream = await self._backend.connect_tcp(
+            host, port, timeout, local_address
+        )
+        self._on_connect(time.perf_counter() - start)
+        return stream
+
+    async def connect_unix_socket(
+        self, path: str, timeout: Optional[float] = None
+    ) -> AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def _time_connections(
+    transport: AsyncHTTPTransport, on_connect: Callable[[float], None]
+) -> None:
+    """
+    Reports the time taken by the transport to open each connection.
+
+    NOTE: relies on httpcore internals like `_pool_connections`, and
+    reports nothing if they change.
+    """
+    pool = getattr(transport, "_pool", None)
+    backend = getattr(pool, "_network_backend", None)
+    if isinstance(backend, AsyncNetworkBackend):
+        setattr(pool, "_network_backend", _TimedBackend(backend, on_connect))
+
+
+def _pool_connections(transport: AsyncHTTPTransport) -> List[Any]:
+    """
+    Returns the connections open by the transport.
+
+    NOTE: httpx doesn't expose its connection pool, so this relies on
+    httpcore internals, and reports no connections if they change.
+    """
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return list(connections) if isinstance(connections, list) else []
+
+
+def _is_idle(connection: Any) -> bool:
+    is_idle = getattr(connection, "is_idle", None)
+    return bool(is_idle()) if callable(is_idle) else False
+
+
+class ServiceClient:
+    """Long-lived client for a single service, along with its usage stats"""
+
+    def __init__(
+        self,
+        url: str,
+        limits: Limits,
+        timeout: Timeout,
+        on_connect: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        self.url = url
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+        self._transport = AsyncHTTPTransport(limits=limits)
+        self.client = AsyncClient(
+            base_url=url,
+            transport=self._transport,
+            timeout=timeout,
+            cookies=CookieJar(policy=_RejectCookies()),
+        )
+        if on_connect is not None:
+            _time_connections(self._transport, on_connect)
+
+    async def send(self, request: Request, stream: bool = False) -> Response:
+        """
+        Sends the request through the service's pool, tracking its usage.
+        If `stream` is True, the response must be closed by the caller.
+        """
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            response = await self.client.send(request, stream=stream)
+        except asyncio.CancelledError:
+            self.in_flight -= 1
+            raise
+        except Exception:
+            self.errors += 1
+            self.in_flight -= 1
+            raise
+
+        if stream:
+            assert isinstance(response.stream, AsyncByteStream)  # cannot fail
+            # the request is in flight until its body is fully consumed
+            response.stream = _TrackedStream(response.stream, self._release)
+        else:
+            self._release()
+
+        return response
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    def stats(self) -> ClientStats:
+        connections = _pool_connections(self._transport)
+        return ClientStats(
+            url=self.url,
+            requests=self.requests,
+            in_flight=self.in_flight,
+            errors=self.errors,
+            connections=len(connections),
+            idle_connections=sum(map(_is_idle, connections)),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class ClientPool:
+    """Registry of long-lived upstream clients, keyed by service ID and URL"""
+
+    def __init__(
+        self,
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive: int = UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry: float = UPSTREAM_KEEPALIVE_EXPIRY,
+        timeout: float = UPSTREAM_TIMEOUT,
+    ) -> None:
+        self.limits = Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = Timeout(timeout)
+        self._clients: Dict[Tuple[int, str], ServiceClient] = {}
+        # replaced clients, closed once their in-flight requests finish
+        self._retired: List[ServiceClient] = []
+
+    def get(self, id: int, url: str) -> ServiceClient:
+        """Returns the client for one of the service's URLs, creating it"""
+        svc_client = self._clients.get((id, url))
+
+        if svc_client is None:
+            svc_client = ServiceClient(
+                url,
+                self.limits,
+                self.timeout,
+                on_connect=service_metrics.get(id).connect.observe,
+            )
+            self._clients[(id, url)] = svc_client
+
+        return svc_client
+
+    def in_flight(self, id: int, url: str) -> int:
+        svc_client = self._clients.get((id, url))
+        return 0 if svc_client is None else svc_client.in_flight
+
+    async def sync(self, services: Mapping[int, Sequence[str]]) -> None:
+        """
+        Updates the registry to match the given services (ID -> URLs),
+        closing the clients of URLs that no longer exist.
+        """
+        for id, url in list(self._clients):
+            if url not in services.get(id, ()):
+                self._retired.append(self._clients.pop((id, url)))
+
+        await self._close_retired()
+
+    def stats(self) -> Dict[Tuple[int, str], ClientStats]:
+        return {key: c.stats() for key, c in self._clients.items()}
+
+    async def aclose(self) -> None:
+        """Closes all clients. The pool can still be used afterwards"""
+        self._retired.extend(self._clients.values())
+        self._clients.clear()
+        await self._close_retired(force=True)
+
+    async def _close_retired(self, force: bool = False) -> None:
+        still_used = []
+        for svc_client in self._retired:
+            if force or svc_client.in_flight == 0:
+                await svc_client.aclose()
+            else:
+                still_used.append(svc_client)
+        self._retired = still_used
+
+
+client_pool = ClientPool()
+
+
+def _pool_usage() -> Iterator[Tuple[Labels, float]]:
+    for (id, url), stats in client_pool.stats().items():
+        idle = stats.idle_connections
+        yield (str(id), url, "active"), stats.connections - idle
+        yield (str(id), url, "idle"), idle
+
+
+def _pool_in_flight() -> Iterator[Tuple[Labels, float]]:
+    for (id, url), stats in client_pool.stats().items():
+        yield (str(id), url), stats.in_flight
+
+
+registry.collected_gauge(
+    "kinetix_upstream_connections",
+    "Connections open to each service URL, by state",
+    ["service", "url", "state"],
+    _pool_usage,
+)
+registry.collected_gauge(
+    "kinetix_upstream_in_flight",
+    "Requests sent to each service URL, waiting for their response's end",
+    ["service", "url"],
+    _pool_in_flight,
+)
+registry.gauge(
+    "kinetix_upstream_max_connections",
+    "Connections each service URL's pool can open",
+).labels().set(client_pool.limits.max_connections or 0)
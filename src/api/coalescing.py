@@ -0,0 +1,71 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional
+from typing import Tuple, TypeVar
+
+from pydantic import BaseModel
+
+
+T = TypeVar("T")
+
+
+class SingleFlightStats(BaseModel):
+    in_flight: int
+    leaders: int
+    deduplicated: int
+
+
+class SingleFlight(Generic[T]):
+    """
+    Shares the result of a call between identical concurrent calls, so only
+    the first one (the leader) actually runs.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, asyncio.Future[Optional[T]]] = {}
+        self.leaders = 0
+        self.deduplicated = 0
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[T]]
+    ) -> Tuple[Optional[T], bool]:
+        """
+        Runs `fn`, unless a call with the same key is already running, in
+        which case its result is awaited instead.
+
+        Returns the result, and whether it came from another call. The
+        result is None if the call it waited for was cancelled.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            # NOTE: shielded so cancelling a follower doesn't affect others
+            result = await asyncio.shield(flight)
+            if result is not None:
+                self.deduplicated += 1
+            return result, True
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # followers must make the call themselves
+            flight.set_result(None)
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # marks the exception as retrieved, even if nobody waited for it
+            flight.exception()
+            raise
+        finally:
+            del self._flights[key]
+
+        flight.set_result(result)
+        return result, False
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            in_flight=len(self._flights),
+            leaders=self.leaders,
+            deduplicated=self.deduplicated,
+        )
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from src.api.coalescing import SingleFlight
+
+
+async def test_single_flight_shares_results() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+    calls = 0
+
+    async def call() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*[flight.do("key", call) for _ in range(3)])
+
+    assert [result for result, _ in results] == [1, 1, 1]
+    assert [is_follower for _, is_follower in results] == [False, True, True]
+    assert flight.stats().deduplicated == 2
+    assert flight.stats().in_flight == 0
+
+
+async def test_single_flight_shares_errors() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+
+    async def call() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    results = await asyncio.gather(
+        *[flight.do("key", call) for _ in range(2)], return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_single_flight_leader_cancellation() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+
+    async def call() -> int:
+        await asyncio.sleep(10)
+        return 1
+
+    leader = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    # the follower must make the call itself
+    assert await follower == (None, True)
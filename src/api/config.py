@@ -0,0 +1,142 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+UPSTREAM_MAX_CONNECTIONS = _env_int("UPSTREAM_MAX_CONNECTIONS", 100)
+"""Maximum number of open connections to a single service"""
+
+UPSTREAM_MAX_KEEPALIVE = _env_int("UPSTREAM_MAX_KEEPALIVE", 20)
+"""Maximum number of idle connections kept open to a single service"""
+
+UPSTREAM_KEEPALIVE_EXPIRY = _env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)
+"""Seconds an idle connection is kept open before being closed"""
+
+UPSTREAM_TIMEOUT = _env_float("UPSTREAM_TIMEOUT", 5.0)
+"""Seconds to wait on upstream network operations"""
+
+ROUTE_CACHE_SIZE = _env_int("ROUTE_CACHE_SIZE", 4096)
+"""Maximum number of paths whose route is cached. 0 disables the cache"""
+
+RESPONSE_CACHE_SIZE = _env_int("RESPONSE_CACHE_SIZE", 64 * 1024 * 1024)
+"""Maximum bytes of responses kept by the response cache"""
+
+RESPONSE_CACHE_MAX_ENTRY = _env_int("RESPONSE_CACHE_MAX_ENTRY", 1024 * 1024)
+"""Maximum bytes of a single response kept by the response cache"""
+
+HEALTH_CHECK_INTERVAL = _env_float("HEALTH_CHECK_INTERVAL", 5.0)
+"""Seconds between health checks of the services"""
+
+HEALTH_CHECK_JITTER = _env_float("HEALTH_CHECK_JITTER", 0.2)
+"""Fraction of the interval randomly added or removed between checks"""
+
+HEALTH_CHECK_TIMEOUT = _env_float("HEALTH_CHECK_TIMEOUT", 2.0)
+"""Seconds to wait for a service's health check"""
+
+HEALTH_CHECK_CONCURRENCY = _env_int("HEALTH_CHECK_CONCURRENCY", 16)
+"""Maximum number of services checked at the same time"""
+
+CIRCUIT_WINDOW = _env_int("CIRCUIT_WINDOW", 20)
+"""Number of recent requests to a service considered by its circuit"""
+
+CIRCUIT_MIN_REQUESTS = _env_int("CIRCUIT_MIN_REQUESTS", 10)
+"""Minimum number of recent requests needed to open a circuit"""
+
+CIRCUIT_ERROR_RATE = _env_float("CIRCUIT_ERROR_RATE", 0.5)
+"""Fraction of recent requests failing that opens the circuit"""
+
+CIRCUIT_SLOW_CALL = _env_float("CIRCUIT_SLOW_CALL", 3.0)
+"""Seconds after which a request to a service is considered slow"""
+
+CIRCUIT_SLOW_RATE = _env_float("CIRCUIT_SLOW_RATE", 0.8)
+"""Fraction of recent requests being slow that opens the circuit"""
+
+CIRCUIT_OPEN_DURATION = _env_float("CIRCUIT_OPEN_DURATION", 30.0)
+"""Seconds a circuit stays open before letting a request through"""
+
+LATENCY_WINDOW = _env_int("LATENCY_WINDOW", 200)
+"""Number of recent requests to a service whose latency is tracked"""
+
+HEDGE_MIN_SAMPLES = _env_int("HEDGE_MIN_SAMPLES", 20)
+"""Minimum number of tracked latencies needed before hedging requests"""
+
+RETRY_BUDGET_RATIO = _env_float("RETRY_BUDGET_RATIO", 0.1)
+"""Extra requests (retries and hedges) allowed per request to a service"""
+
+RETRY_BUDGET_MAX = _env_float("RETRY_BUDGET_MAX", 10.0)
+"""Maximum number of extra requests a service's budget can accumulate"""
+
+OPENAPI_REFRESH_INTERVAL = _env_float("OPENAPI_REFRESH_INTERVAL", 8.0)
+"""Seconds between checks for changes to the services' OpenAPI schemas"""
+
+SCHEMA_FETCH_TIMEOUT = _env_float("SCHEMA_FETCH_TIMEOUT", 5.0)
+"""Seconds to wait for a service's OpenAPI schema"""
+
+SCHEMA_FETCH_CONCURRENCY = _env_int("SCHEMA_FETCH_CONCURRENCY", 8)
+"""Maximum number of OpenAPI schemas downloaded at the same time"""
+
+SCHEMA_BACKOFF_MAX = _env_float("SCHEMA_BACKOFF_MAX", 300.0)
+"""Maximum seconds before retrying a service whose schema couldn't be read"""
+
+COMPRESSION_MIN_SIZE = _env_int("COMPRESSION_MIN_SIZE", 1024)
+"""Minimum bytes of a proxied response for it to be compressed"""
+
+COMPRESSION_TYPES = os.environ.get(
+    "COMPRESSION_TYPES",
+    "application/json,application/javascript,application/xml,"
+    "image/svg+xml,text/css,text/csv,text/html,text/javascript,text/plain,"
+    "text/xml",
+)
+"""Comma-separated media types of the proxied responses that are compressed.
+Types ending in +json or +xml are also compressed. Empty disables it"""
+
+COMPRESSION_GZIP_LEVEL = _env_int("COMPRESSION_GZIP_LEVEL", 6)
+"""Level (1-9) of the gzip compression of proxied responses"""
+
+COMPRESSION_BROTLI_QUALITY = _env_int("COMPRESSION_BROTLI_QUALITY", 4)
+"""Quality (0-11) of the brotli compression of proxied responses"""
+
+RATE_LIMIT_RATE = _env_float("RATE_LIMIT_RATE", 100.0)
+"""Requests per second allowed to each client through the proxy. 0 disables
+the limit, though per-service limits still apply"""
+
+RATE_LIMIT_BURST = _env_int("RATE_LIMIT_BURST", 200)
+"""Requests a client can send at once, after being idle"""
+
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+"""Where rate limits are kept: "memory" (per process), "shared" (shared
+memory, for workers of the same host) or "redis" (across hosts)"""
+
+RATE_LIMIT_MAX_KEYS = _env_int("RATE_LIMIT_MAX_KEYS", 100_000)
+"""Maximum number of clients tracked by the in-memory rate limiter"""
+
+RATE_LIMIT_SHM_NAME = os.environ.get("RATE_LIMIT_SHM_NAME", "kinetix-limits")
+"""Name of the shared memory block used by the "shared" backend"""
+
+RATE_LIMIT_SHM_SLOTS = _env_int("RATE_LIMIT_SHM_SLOTS", 65536)
+"""Number of clients tracked by the "shared" backend"""
+
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "")
+"""URL of the Redis server used by the "redis" backend"""
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "")
+"""Directory shared by the workers of a host, where the leader worker
+publishes the routing table and OpenAPI schema. Empty runs every worker on
+its own, each one querying the DB"""
+
+SNAPSHOT_POLL_INTERVAL = _env_float("SNAPSHOT_POLL_INTERVAL", 0.1)
+"""Seconds between checks for new snapshots by the other workers"""
+
+PROFILER_INTERVAL = _env_float("PROFILER_INTERVAL", 0.01)
+"""Default seconds between samples of the sampling profiler"""
+
+PROFILER_MAX_DURATION = _env_float("PROFILER_MAX_DURATION", 60.0)
+"""Maximum seconds a single profiling session can run for"""
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import zlib
+from http import HTTPStatus
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+from src.api.config import (
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_TYPES,
+)
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional, responses are only gzipped without it
+    brotli = None
+
+
+# supported content codings, from most to least preferred
+ENCODINGS = ["br", "gzip", "identity"] if brotli else ["gzip", "identity"]
+
+COMPRESSIBLE_TYPES = {
+    media_type.strip().lower()
+    for media_type in COMPRESSION_TYPES.split(",")
+    if media_type.strip()
+}
+
+
+def parse_accept_encoding(value: Optional[str]) -> Dict[str, float]:
+    """Parses an Accept-Encoding header into each coding's q-value"""
+    codings: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, arg = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(arg)
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+
+def choose_encoding(
+    accept_encoding: Optional[str], available: Iterable[str]
+) -> str:
+    """
+    Returns the preferred available coding accepted by the client, or
+    "identity" if there's none.
+    """
+    codings = parse_accept_encoding(accept_encoding)
+    default = codings.get("*", 0.0)
+    best, best_q = "identity", 0.0
+    for coding in ENCODINGS:
+        q = codings.get(coding, default)
+        if coding in available and q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """Returns true if responses of the content type should be compressed"""
+    if not COMPRESSIBLE_TYPES or content_type is None:
+        return False
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type in COMPRESSIBLE_TYPES or media_type.endswith(
+        ("+json", "+xml")
+    )
+
+
+class StreamCompressor:
+    """Compresses a body chunk by chunk, with gzip or brotli"""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        self._compressor: Any
+        if encoding == "br":
+            self._compressor = brotli.Compressor(
+                quality=COMPRESSION_BROTLI_QUALITY
+            )
+        elif encoding == "gzip":
+            # NOTE: wbits of 16 + 15 produce the gzip format
+            self._compressor = zlib.compressobj(
+                COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        """
+        Compresses the chunk, flushing it so the client can decompress it
+        without waiting for the next one.
+        """
+        if self.encoding == "br":
+            return bytes(
+                self._compressor.process(chunk) + self._compressor.flush()
+            )
+        return bytes(
+            self._compressor.compress(chunk)
+            + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return bytes(self._compressor.finish())
+        return bytes(self._compressor.flush(zlib.Z_FINISH))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compresses a whole body, with gzip or brotli"""
+    if encoding == "br":
+        return bytes(brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY))
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Returns true if the If-None-Match header matches the ETag"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # NOTE: If-None-Match uses the weak comparison
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+class EncodedBody(NamedTuple):
+    """Body encoded ahead of time with each supported coding"""
+
+    variants: Dict[str, bytes]
+    digest: str
+
+    def etag(self, encoding: str) -> str:
+        """Returns the strong ETag of the body's variant"""
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+
+def encode_body(body: bytes) -> EncodedBody:
+    variants = {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli:
+        variants["br"] = brotli.compress(body)
+    return EncodedBody(
+        variants=variants, digest=hashlib.sha256(body).hexdigest()[:32]
+    )
+
+
+def encoded_response(
+    body: EncodedBody, request: Request, media_type: str
+) -> Response:
+    """
+    Returns the variant of the body accepted by the client, or 304 Not
+    Modified if the client already has it.
+    """
+    encoding = choose_encoding(
+        request.headers.get("accept-encoding"), body.variants
+    )
+    etag = body.etag(encoding)
+    headers = {"etag": etag, "vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["content-encoding"] = encoding
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(
+        body.variants[encoding], media_type=media_type, headers=headers
+    )
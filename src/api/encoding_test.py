@@ -0,0 +1,67 @@
+import gzip
+import zlib
+
+from src.api.encoding import (
+    StreamCompressor,
+    choose_encoding,
+    encode_body,
+    etag_matches,
+    is_compressible,
+    parse_accept_encoding,
+)
+
+
+def test_parse_accept_encoding() -> None:
+    assert parse_accept_encoding("gzip, br;q=0.5, *;q=0") == {
+        "gzip": 1.0,
+        "br": 0.5,
+        "*": 0.0,
+    }
+    assert parse_accept_encoding(None) == {}
+
+
+def test_choose_encoding() -> None:
+    available = ["gzip", "identity"]
+    assert choose_encoding("gzip, deflate", available) == "gzip"
+    assert choose_encoding("deflate", available) == "identity"
+    assert choose_encoding("*", available) == "gzip"
+    assert choose_encoding("gzip;q=0", available) == "identity"
+    assert choose_encoding(None, available) == "identity"
+    assert choose_encoding("br", available) == "identity"
+
+
+def test_etag_matches() -> None:
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+def test_encode_body() -> None:
+    body = encode_body(b"hello" * 100)
+
+    assert body.variants["identity"] == b"hello" * 100
+    assert gzip.decompress(body.variants["gzip"]) == b"hello" * 100
+    # variants have different strong ETags
+    assert body.etag("identity") != body.etag("gzip")
+    assert encode_body(b"hello" * 100) == body
+
+
+def test_is_compressible() -> None:
+    assert is_compressible("application/json")
+    assert is_compressible("text/html; charset=utf-8")
+    assert is_compressible("application/problem+json")
+    assert not is_compressible("image/png")
+    assert not is_compressible(None)
+
+
+def test_stream_compressor_flushes_each_chunk() -> None:
+    compressor = StreamCompressor("gzip")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    for chunk in [b"hello ", b"world"]:
+        # each chunk can be decompressed as soon as it's received
+        assert decompressor.decompress(compressor.compress(chunk)) == chunk
+    assert decompressor.decompress(compressor.finish()) == b""
+    assert decompressor.eof
@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional
+
+from httpx import ConnectError, ConnectTimeout, Response
+from pydantic import BaseModel
+
+from src.api.config import (
+    HEDGE_MIN_SAMPLES,
+    LATENCY_WINDOW,
+    RETRY_BUDGET_MAX,
+    RETRY_BUDGET_RATIO,
+)
+
+
+# methods whose requests can be sent more than once
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# methods whose requests can be hedged
+HEDGED_METHODS = {"GET", "HEAD"}
+
+# errors raised before the request reached the service
+CONNECTION_ERRORS = (ConnectError, ConnectTimeout)
+
+Attempt = Callable[[], Coroutine[Any, Any, Response]]
+
+
+class LatencyTracker:
+    """Keeps the latencies of the last `window` requests, sorted"""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self._recent: Deque[float] = deque()
+        self._sorted: List[float] = []
+        self.window = window
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def record(self, latency: float) -> None:
+        if len(self._recent) == self.window:
+            oldest = self._recent.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._recent.append(latency)
+        bisect.insort(self._sorted, latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        index = int(len(self._sorted) * percentile / 100)
+        return self._sorted[min(index, len(self._sorted) - 1)]
+
+
+class RetryBudget:
+    """
+    Limits extra requests (retries and hedges) to a fraction of the normal
+    ones, so they can't multiply the load on a service that's struggling.
+    """
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        capacity: float = RETRY_BUDGET_MAX,
+    ) -> None:
+        self.ratio = ratio
+        self.capacity = capacity
+        self.balance = capacity
+
+    def deposit(self) -> None:
+        """Called for every request sent"""
+        self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Returns true if an extra request can be sent"""
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class UpstreamPolicyStats(BaseModel):
+    hedges: int
+    hedges_won: int
+    retries: int
+    budget_exhausted: int
+
+
+class UpstreamPolicy:
+    """Hedging and retry state of a single service"""
+
+    def __init__(self) -> None:
+        self.latencies = LatencyTracker()
+        self.budget = RetryBudget()
+        self.hedges = 0
+        self.hedges_won = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+
+    def hedge_delay(self, percentile: float) -> Optional[float]:
+        """Returns how long to wait before hedging, if enough is known"""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latencies.percentile(percentile)
+
+    def can_send_extra(self) -> bool:
+        if self.budget.withdraw():
+            return True
+        self.budget_exhausted += 1
+        return False
+
+    async def retried(self, attempt: Attempt, retries: int) -> Response:
+        """Retries the request on connection errors, within the budget"""
+        for retry in range(retries + 1):
+            try:
+                return await attempt()
+            except CONNECTION_ERRORS:
+                if retry == retries or not self.can_send_extra():
+                    raise
+            self.retries += 1
+        raise AssertionError("unreachable")
+
+    async def hedged(self, attempt: Attempt, delay: float) -> Response:
+        """
+        Sends a second request if the first one takes more than `delay`
+        seconds, returning the first response received. The other one is
+        cancelled, or closed if it was already received.
+        """
+        tasks: List[asyncio.Task[Response]] = [asyncio.create_task(attempt())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.can_send_extra():
+                self.hedges += 1
+                tasks.append(asyncio.create_task(attempt()))
+
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # a failed request only wins if the other one failed too
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is None and not pending:
+                    winner = done.pop()
+                if winner is not None:
+                    self.hedges_won += winner is not tasks[0]
+                    tasks.remove(winner)
+                    return winner.result()
+        finally:
+            for task in tasks:
+                task.add_done_callback(_close_response)
+                task.cancel()
+
+    def stats(self) -> UpstreamPolicyStats:
+        return UpstreamPolicyStats(
+            hedges=self.hedges,
+            hedges_won=self.hedges_won,
+            retries=self.retries,
+            budget_exhausted=self.budget_exhausted,
+        )
+
+
+def _close_response(task: "asyncio.Task[Response]") -> None:
+    """Closes the response of a hedged request that lost"""
+    if task.cancelled() or task.exception() is not None:
+        return
+    asyncio.create_task(task.result().aclose())
+
+
+class UpstreamPolicies:
+    """Registry of hedging and retry states, keyed by service ID"""
+
+    def __init__(self) -> None:
+        self._policies: Dict[int, UpstreamPolicy] = {}
+
+    def get(self, id: int) -> UpstreamPolicy:
+        policy = self._policies.get(id)
+        if policy is None:
+            policy = self._policies[id] = UpstreamPolicy()
+        return policy
+
+    def sync(self, ids: List[int]) -> None:
+        """Drops the states of services that no longer exist"""
+        for id in set(self._policies) - set(ids):
+            del self._policies[id]
+
+    def stats(self) -> Dict[int, UpstreamPolicyStats]:
+        return {id: policy.stats() for id, policy in self._policies.items()}
+
+
+upstream_policies = UpstreamPolicies()
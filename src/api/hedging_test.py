@@ -0,0 +1,142 @@
+import asyncio
+from typing import List
+
+import pytest
+from httpx import ConnectError, Response
+
+from src.api.hedging import LatencyTracker, RetryBudget, UpstreamPolicy
+
+
+def test_latency_tracker_percentiles() -> None:
+    tracker = LatencyTracker(window=10)
+    for latency in range(20):
+        tracker.record(latency)
+
+    # only the last 10 latencies are kept
+    assert len(tracker) == 10
+    assert tracker.percentile(0) == 10
+    assert tracker.percentile(50) == 15
+    assert tracker.percentile(99) == 19
+
+
+def test_retry_budget_limits_extra_requests() -> None:
+    budget = RetryBudget(ratio=0.5, capacity=2)
+
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+async def test_policy_retries_connection_errors() -> None:
+    policy = UpstreamPolicy()
+    attempts = 0
+
+    async def attempt() -> Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectError("refused")
+        return Response(200)
+
+    response = await policy.retried(attempt, retries=2)
+
+    assert response.status_code == 200
+    assert policy.stats().retries == 2
+
+
+async def test_policy_retries_within_budget() -> None:
+    policy = UpstreamPolicy()
+    policy.budget = RetryBudget(ratio=0, capacity=1)
+    attempts = 0
+
+    async def attempt() -> Response:
+        nonlocal attempts
+        attempts += 1
+        raise ConnectError("refused")
+
+    with pytest.raises(ConnectError):
+        await policy.retried(attempt, retries=3)
+
+    assert attempts == 2
+    assert policy.stats().budget_exhausted == 1
+
+
+async def test_policy_doesnt_retry_other_errors() -> None:
+    policy = UpstreamPolicy()
+    attempts = 0
+
+    async def attempt() -> Response:
+        nonlocal attempts
+        attempts += 1
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        await policy.retried(attempt, retries=3)
+
+    assert attempts == 1
+
+
+async def test_policy_hedges_slow_requests() -> None:
+    policy = UpstreamPolicy()
+    delays = [1.0, 0.01]
+    responses: List[Response] = []
+
+    async def attempt() -> Response:
+        response = Response(200, content=str(len(responses)).encode())
+        responses.append(response)
+        await asyncio.sleep(delays[len(responses) - 1])
+        return response
+
+    response = await policy.hedged(attempt, delay=0.01)
+
+    assert response is responses[1]
+    assert policy.stats().hedges == 1
+    assert policy.stats().hedges_won == 1
+
+
+async def test_policy_doesnt_hedge_fast_requests() -> None:
+    policy = UpstreamPolicy()
+    attempts = 0
+
+    async def attempt() -> Response:
+        nonlocal attempts
+        attempts += 1
+        return Response(200)
+
+    await policy.hedged(attempt, delay=0.1)
+
+    assert attempts == 1
+    assert policy.stats().hedges == 0
+
+
+async def test_policy_hedge_survives_failed_request() -> None:
+    policy = UpstreamPolicy()
+    attempts = 0
+
+    async def attempt() -> Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            await asyncio.sleep(0.02)
+            raise ConnectError("refused")
+        await asyncio.sleep(0.05)
+        return Response(200)
+
+    response = await policy.hedged(attempt, delay=0.01)
+
+    assert response.status_code == 200
+    assert attempts == 2
+
+
+async def test_policy_hedge_delay_needs_samples() -> None:
+    policy = UpstreamPolicy()
+    assert policy.hedge_delay(95) is None
+
+    for _ in range(100):
+        policy.latencies.record(0.5)
+    assert policy.hedge_delay(95) == 0.5
@@ -0,0 +1,299 @@
+import math
+from bisect import bisect_left
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Protocol,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""Media type of the Prometheus text format"""
+
+# seconds, from a cached route to a slow service
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = value.replace("\\", r"\\").replace("\n", r"\n")
+        value = value.replace('"', r"\"")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Gauge:
+    """A value that can go up and down"""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        yield f"{name}{labels} {format_value(self.value)}"
+
+
+class Histogram:
+    """
+    Counts of observed values by bucket, along with their sum. Counts are
+    kept per bucket and only made cumulative when rendered, so observing a
+    value is a binary search and two additions.
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # the last one is the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        # NOTE: labels are rendered as {...}, so "le" is added inside them
+        prefix = labels[:-1] + "," if labels else "{"
+        total = 0
+        for bound, count in zip([*self.buckets, math.inf], self.counts):
+            total += count
+            le = format_value(bound)
+            yield f'{name}_bucket{prefix}le="{le}"}} {total}'
+        yield f"{name}_sum{labels} {format_value(self.sum)}"
+        yield f"{name}_count{labels} {total}"
+
+
+class MetricChild(Protocol):
+    def samples(self, name: str, labels: str) -> Iterator[str]:
+        ...
+
+
+Child = TypeVar("Child", bound=MetricChild)
+
+
+class Metric(Generic[Child]):
+    """
+    A metric and its children, one for each combination of label values.
+    Children should be bound once and kept, so recording a value doesn't
+    look up or allocate labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        kind: str,
+        labelnames: Sequence[str],
+        factory: Callable[[], Child],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self._factory = factory
+        # label values -> (rendered labels, child)
+        self._children: Dict[Labels, Tuple[str, Child]] = {}
+
+    def labels(self, *values: str) -> Child:
+        entry = self._children.get(values)
+        if entry is None:
+            assert len(values) == len(self.labelnames)
+            labels = format_labels(self.labelnames, values)
+            entry = (labels, self._factory())
+            self._children[values] = entry
+        return entry[1]
+
+    def remove(self, *values: str) -> None:
+        self._children.pop(values, None)
+
+    def samples(self) -> Iterator[str]:
+        for labels, child in list(self._children.values()):
+            yield from child.samples(self.name, labels)
+
+
+class Exposed(Protocol):
+    name: str
+    help: str
+    kind: str
+
+    def samples(self) -> Iterator[str]:
+        ...
+
+
+class CollectedGauge:
+    """Gauge whose values are collected when rendered"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._collect = collect
+
+    def samples(self) -> Iterator[str]:
+        for values, value in self._collect():
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[Exposed] = []
+
+    def gauge(
+        self, name: str, help: str, labelnames: Sequence[str] = ()
+    ) -> Metric[Gauge]:
+        metric = Metric(name, help, "gauge", labelnames, Gauge)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = ()
+    ) -> Metric[Histogram]:
+        metric = Metric(name, help, "histogram", labelnames, Histogram)
+        self._metrics.append(metric)
+        return metric
+
+    def collected_gauge(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+    ) -> CollectedGauge:
+        metric = CollectedGauge(name, help, labelnames, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders all the metrics in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "kinetix_request_duration_seconds",
+    "Time to answer proxied requests, by service ID and status code",
+    ["service", "status"],
+)
+upstream_connect = registry.histogram(
+    "kinetix_upstream_connect_seconds",
+    "Time to open a connection to a service",
+    ["service"],
+)
+upstream_ttfb = registry.histogram(
+    "kinetix_upstream_ttfb_seconds",
+    "Time from sending a request to a service to receiving its headers",
+    ["service"],
+)
+auth_duration = registry.histogram(
+    "kinetix_auth_duration_seconds",
+    "Time to authenticate requests, by stage: verifying the token and "
+    "checking whether it was revoked",
+    ["stage"],
+)
+routing_table_routes = registry.gauge(
+    "kinetix_routing_table_routes", "Routes in the current routing table"
+)
+routing_table_rebuild = registry.histogram(
+    "kinetix_routing_table_rebuild_seconds",
+    "Time to rebuild the routing table",
+)
+
+
+class ServiceMetrics:
+    """A service's metrics, with their labels bound in advance"""
+
+    def __init__(self, id: int) -> None:
+        self.label = str(id)
+        self.connect = upstream_connect.labels(self.label)
+        self.ttfb = upstream_ttfb.labels(self.label)
+        # status code -> duration histogram
+        self._durations: Dict[int, Histogram] = {}
+
+    def observe_request(self, status: int, seconds: float) -> None:
+        histogram = self._durations.get(status)
+        if histogram is None:
+            histogram = request_duration.labels(self.label, str(status))
+            self._durations[status] = histogram
+        histogram.observe(seconds)
+
+    def remove(self) -> None:
+        upstream_connect.remove(self.label)
+        upstream_ttfb.remove(self.label)
+        for status in self._durations:
+            request_duration.remove(self.label, str(status))
+
+
+class ServicesMetrics:
+    """Registry of the services' metrics, keyed by service ID"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[int, ServiceMetrics] = {}
+
+    def get(self, id: int) -> ServiceMetrics:
+        metrics = self._metrics.get(id)
+        if metrics is None:
+            metrics = ServiceMetrics(id)
+            self._metrics[id] = metrics
+        return metrics
+
+    def sync(self, ids: List[int]) -> None:
+        """Drops the metrics of services that no longer exist"""
+        for id in set(self._metrics) - set(ids):
+            self._metrics.pop(id).remove()
+
+
+service_metrics = ServicesMetrics()
@@ -0,0 +1,50 @@
+from src.api.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    registry = Registry()
+    metric = registry.histogram("latency_seconds", "Latency", ["service"])
+    histogram = metric.labels("1")
+    for value in [0.0005, 0.003, 0.003, 20]:
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+    ]
+    assert 'latency_seconds_bucket{service="1",le="0.001"} 1' in lines
+    assert 'latency_seconds_bucket{service="1",le="0.0025"} 1' in lines
+    assert 'latency_seconds_bucket{service="1",le="0.005"} 3' in lines
+    assert 'latency_seconds_bucket{service="1",le="10"} 3' in lines
+    assert 'latency_seconds_bucket{service="1",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{service="1"} 20.0065' in lines
+    assert 'latency_seconds_count{service="1"} 4' in lines
+
+
+def test_children_are_bound_once() -> None:
+    registry = Registry()
+    metric = registry.gauge("routes", "Routes", ["table"])
+    assert metric.labels("a") is metric.labels("a")
+
+    metric.labels("a").set(3)
+    metric.labels('say "hi"\n').set(1.5)
+    assert registry.render().splitlines()[2:] == [
+        'routes{table="a"} 3',
+        'routes{table="say \\"hi\\"\\n"} 1.5',
+    ]
+
+    metric.remove("a")
+    assert 'routes{table="a"} 3' not in registry.render()
+
+
+def test_collected_gauge_reads_values_when_rendered() -> None:
+    values = {("1",): 2.0}
+    registry = Registry()
+    registry.collected_gauge(
+        "in_flight", "Requests", ["service"], lambda: values.items()
+    )
+
+    assert 'in_flight{service="1"} 2' in registry.render()
+    values[("1",)] = 5
+    assert 'in_flight{service="1"} 5' in registry.render()
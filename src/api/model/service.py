@@ -1,6 +1,8 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
-from pydantic import Field
+from pydantic import Field, validator
+from src.api.bulkhead import BulkheadStats
+from src.api.circuit_breaker import CircuitState
 from src.api.model.utils import OrmModel, make_all_required
 
 
@@ -26,7 +28,120 @@ class ServiceBase(OrmModel):
     )
 
 
-class PatchService(ServiceBase):
+class ServiceSettings(OrmModel):
+    endpoints: List[str] = Field(
+        title="Additional URLs",
+        description=(
+            "Web addresses of other replicas of the service. Requests are "
+            "balanced between them and the service's URL"
+        ),
+        max_items=32,
+        default_factory=list,
+    )
+    stream_threshold: Optional[int] = Field(
+        title="Streaming threshold",
+        description=(
+            "Responses of at least this many bytes (or of unknown length) "
+            "are streamed to the client. If null, responses are buffered"
+        ),
+        ge=0,
+        default=None,
+    )
+    cache_responses: bool = Field(
+        title="Cache responses?",
+        description=(
+            "True if the gateway may cache the service's responses to GET "
+            "requests, as allowed by their Cache-Control headers"
+        ),
+        default=False,
+    )
+    coalesce_requests: bool = Field(
+        title="Coalesce requests?",
+        description=(
+            "True if identical concurrent GET requests from the same user "
+            "may share a single request to the service"
+        ),
+        default=False,
+    )
+    hedge_percentile: Optional[float] = Field(
+        title="Hedging percentile",
+        description=(
+            "GET requests taking longer than this percentile of the "
+            "service's recent latencies are sent again, and the first "
+            "response is used. If null, requests aren't hedged"
+        ),
+        ge=50,
+        lt=100,
+        default=None,
+    )
+    connect_retries: int = Field(
+        title="Connection retries",
+        description=(
+            "Times idempotent requests without a body are retried when the "
+            "service can't be reached. Retries and hedged requests are "
+            "limited to a fraction of the service's traffic"
+        ),
+        ge=0,
+        le=5,
+        default=0,
+    )
+
+    max_in_flight: Optional[int] = Field(
+        title="Maximum in-flight requests",
+        description=(
+            "Requests to the service handled at the same time, others wait "
+            "in a queue. If null, there's no limit"
+        ),
+        ge=1,
+        default=None,
+    )
+    max_queued: int = Field(
+        title="Maximum queued requests",
+        description=(
+            "Requests waiting for one of the in-flight ones to finish. "
+            "Requests beyond this are rejected with 503"
+        ),
+        ge=0,
+        default=100,
+    )
+    queue_timeout: float = Field(
+        title="Queue timeout",
+        description=(
+            "Seconds a request waits in the queue before being rejected "
+            "with 503"
+        ),
+        ge=0,
+        default=1.0,
+    )
+
+    rate_limit: Optional[float] = Field(
+        title="Rate limit",
+        description=(
+            "Requests per second each user (or IP address, if anonymous) "
+            "can send to the service. If null, only the gateway's limit "
+            "applies"
+        ),
+        gt=0,
+        default=None,
+    )
+    rate_limit_burst: Optional[int] = Field(
+        title="Rate limit burst",
+        description=(
+            "Requests each user can send to the service at once. If null, "
+            "a second's worth of requests"
+        ),
+        ge=1,
+        default=None,
+    )
+
+    @validator("endpoints", each_item=True)
+    def check_endpoint_length(cls, url: str) -> str:
+        if len(url) > 255:
+            raise ValueError("ensure each URL has at most 255 characters")
+        return url
+
+
+class PatchService(ServiceSettings, ServiceBase):
     blocked: Optional[bool] = Field(
         title="Is blocked?",
         description="True if the service is blocked, false if it isn't",
@@ -41,7 +156,7 @@ class AllRequiredServiceBase(ServiceBase):
 make_all_required(AllRequiredServiceBase)
 
 
-class AddService(AllRequiredServiceBase):
+class AddService(ServiceSettings, AllRequiredServiceBase):
     blocked: bool = Field(
         title="Is blocked?",
         description="True if the service is blocked, false if it isn't",
@@ -49,7 +164,7 @@ class AddService(AllRequiredServiceBase):
     )
 
 
-class Service(AllRequiredServiceBase):
+class Service(ServiceSettings, AllRequiredServiceBase):
     id: int = Field(
         title="ID",
         description="The service's unique ID",
@@ -63,6 +178,30 @@ class Service(AllRequiredServiceBase):
         description="True if the service is up, false if it isn't",
         default=False,
     )
+    circuit_state: CircuitState = Field(
+        title="Circuit state",
+        description=(
+            "If open, requests to the service are rejected by the gateway, "
+            "as most of its recent ones failed. If half-open, a request is "
+            "being let through to check if it recovered"
+        ),
+        default=CircuitState.CLOSED,
+    )
+    in_flight: Dict[str, int] = Field(
+        title="In-flight requests",
+        description="Requests being handled by each of the service's URLs",
+        default_factory=dict,
+    )
+    bulkhead: BulkheadStats = Field(
+        title="Concurrency limit usage",
+        description=(
+            "Requests to the service in flight and queued, along with the "
+            "ones rejected for going over its limits"
+        ),
+        default_factory=lambda: BulkheadStats(
+            in_flight=0, queued=0, rejected=0, timed_out=0
+        ),
+    )
 
     def __hash__(self) -> int:
         return hash(self.id)
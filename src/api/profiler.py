@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from types import FrameType
+from typing import Dict, List, Optional
+from weakref import WeakKeyDictionary
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from src.api.config import PROFILER_INTERVAL, PROFILER_MAX_DURATION
+from src.auth import get_admin
+
+
+# deepest stacks kept, the frames closest to the root are dropped
+MAX_STACK_DEPTH = 128
+
+
+class ProfilerBusyError(Exception):
+    def __init__(self) -> None:
+        super().__init__("A profile is already being taken")
+
+
+def frame_name(frame: FrameType) -> str:
+    """Names a frame's function by its file, relative to its package"""
+    filename = frame.f_code.co_filename
+    for root in ["site-packages" + os.sep, os.getcwd() + os.sep]:
+        _, found, relative = filename.rpartition(root)
+        if found:
+            filename = relative
+            break
+    return f"{filename}:{frame.f_code.co_qualname}"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the event loop's thread. While running, a
+    separate thread samples the loop's stack at a fixed interval, and
+    counts each distinct stack, in the collapsed format used to draw
+    flamegraphs.
+
+    Stacks are tagged with the service matched by the request being
+    handled, if any. Requests are only tagged while profiling, so the
+    profiler costs a single check per request while it's idle.
+    """
+
+    def __init__(self) -> None:
+        self.active = False
+        # request's task -> tag, dropped along with the task
+        self._tags: WeakKeyDictionary[asyncio.Task[object], str]
+        self._tags = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def tag(self, tag: str) -> None:
+        """Tags the stacks sampled while the current task runs"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._tags[task] = tag
+
+    def _sample(
+        self, thread_id: int, loop: asyncio.AbstractEventLoop
+    ) -> Optional[str]:
+        frame: Optional[FrameType] = sys._current_frames().get(thread_id)
+        if frame is None:
+            return None
+        stack: List[str] = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+
+        # NOTE: read from another thread, which is safe under the GIL
+        task = asyncio.current_task(loop)
+        tag = None if task is None else self._tags.get(task)
+        if tag is not None:
+            stack.append(tag)
+        stack.reverse()
+        return ";".join(stack)
+
+    def profile(
+        self,
+        thread_id: int,
+        loop: asyncio.AbstractEventLoop,
+        duration: float,
+        interval: float,
+    ) -> Dict[str, int]:
+        """
+        Samples the thread's stack for `duration` seconds, returning how
+        many times each stack was seen. Blocks, so it must run in another
+        thread than the sampled one.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+        stacks: Dict[str, int] = Counter()
+        self.active = True
+        try:
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                stack = self._sample(thread_id, loop)
+                if stack is not None:
+                    stacks[stack] += 1
+                time.sleep(interval)
+        finally:
+            self.active = False
+            self._tags.clear()
+            self._lock.release()
+        return stacks
+
+
+def collapse(stacks: Dict[str, int]) -> str:
+    """Renders the stacks in the collapsed format of flamegraph.pl"""
+    lines = [f"{stack} {count}" for stack, count in stacks.items()]
+    return "\n".join(sorted(lines)) + "\n"
+
+
+profiler = SamplingProfiler()
+
+
+router = APIRouter(
+    prefix="/profile",
+    tags=["Profiling"],
+    dependencies=[Depends(get_admin)],
+)
+
+
+@router.get("", response_class=PlainTextResponse)
+async def take_profile(
+    seconds: float = Query(default=10, gt=0, le=PROFILER_MAX_DURATION),
+    interval: float = Query(default=PROFILER_INTERVAL, ge=0.001, le=1),
+) -> PlainTextResponse:
+    """
+    Samples what this worker's event loop is running for some seconds,
+    and returns the collapsed stacks, ready to be drawn as a flamegraph.
+    Stacks of proxied requests start with the matched service's ID.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        stacks = await asyncio.to_thread(
+            profiler.profile,
+            threading.get_ident(),
+            loop,
+            seconds,
+            interval,
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(HTTPStatus.CONFLICT, str(e))
+    return PlainTextResponse(collapse(stacks))
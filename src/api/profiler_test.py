@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from http import HTTPStatus
+
+import pytest
+from httpx import AsyncClient
+
+from src.api.profiler import ProfilerBusyError, SamplingProfiler
+
+
+def busy_wait(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+async def test_profiler_tags_stacks_of_requests() -> None:
+    profiler = SamplingProfiler()
+    loop = asyncio.get_running_loop()
+
+    async def request() -> None:
+        profiler.tag("service:1")
+        busy_wait(0.3)
+
+    profile = asyncio.create_task(
+        asyncio.to_thread(
+            profiler.profile, threading.get_ident(), loop, 0.2, 0.005
+        )
+    )
+    # let the profiler start before blocking the loop
+    while not profiler.active:
+        await asyncio.sleep(0.001)
+    await asyncio.create_task(request())
+    stacks = await profile
+
+    tagged = [stack for stack in stacks if stack.startswith("service:1;")]
+    assert tagged
+    assert any(stack.endswith(":busy_wait") for stack in tagged)
+    assert not profiler.active
+
+
+async def test_profiler_takes_one_profile_at_a_time() -> None:
+    profiler = SamplingProfiler()
+    loop = asyncio.get_running_loop()
+    thread_id = threading.get_ident()
+
+    profile = asyncio.create_task(
+        asyncio.to_thread(profiler.profile, thread_id, loop, 0.1, 0.01)
+    )
+    while not profiler.active:
+        await asyncio.sleep(0.001)
+
+    with pytest.raises(ProfilerBusyError):
+        profiler.profile(thread_id, loop, 0.1, 0.01)
+    await profile
+
+
+async def test_profile_endpoint_returns_collapsed_stacks(
+    client: AsyncClient,
+) -> None:
+    response = await client.get("/profile", params={"seconds": 0.05})
+
+    assert response.status_code == HTTPStatus.OK
+    lines = response.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+
+async def test_profile_duration_is_bounded(client: AsyncClient) -> None:
+    response = await client.get("/profile", params={"seconds": 3600})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
@@ -1,68 +1,313 @@
 import asyncio
-import re
+import json
+import time
 from http import HTTPStatus
-from typing import Annotated, Any, List, Tuple
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from httpx import URL, AsyncClient, Response as SvcResp
-
-from src.api.aliases import SessionDep
-from src.auth import get_raw_token, optional_token
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.responses import Content
+from httpx import URL, Response as SvcResp
+
+from src.api import routing
+from src.api.balancer import choose_endpoint
+from src.api.bulkhead import Bulkhead, BulkheadFullError, bulkheads
+from src.api.circuit_breaker import CircuitOpenError, circuit_breakers
+from src.api.clients import APIKEY_HEADER, client_pool
+from src.api.coalescing import SingleFlight
+from src.api.config import COMPRESSION_MIN_SIZE
+from src.api.encoding import (
+    ENCODINGS,
+    StreamCompressor,
+    choose_encoding,
+    compress,
+    etag_matches,
+    is_compressible,
+)
+from src.api.hedging import (
+    HEDGED_METHODS,
+    IDEMPOTENT_METHODS,
+    UpstreamPolicy,
+    upstream_policies,
+)
+from src.api.metrics import (
+    routing_table_rebuild,
+    routing_table_routes,
+    service_metrics,
+)
+from src.api.profiler import profiler
+from src.api.rate_limit import (
+    RateLimit,
+    RateLimitResult,
+    rate_limiter,
+    service_limit,
+)
+from src.api.response_cache import (
+    CONDITIONAL_HEADERS,
+    CachedResponse,
+    build_entry,
+    can_serve,
+    parse_cache_control,
+    refreshed_entry,
+    response_cache,
+)
+from src.api.routing import specificity
+from src.auth import User, get_raw_token, optional_token
 from src.db.session import SessionLocal
-from src.logging import info, error
-from src.db.utils import get_session
+from src.logging import debug, info, error
 from src.db import services as services_db
 import src.db.tokens as tokens_db
 
 
-APIKEY_HEADER = "X-Apikey"
+# delay between checks for changes made by other replicas
 REGEN_DELAY = 1  # seconds
 
+# request headers that must match for requests to be coalesced, along with
+# the ones identifying the user
+COALESCING_HEADERS = [
+    "authorization",
+    "cookie",
+    "accept",
+    "accept-encoding",
+    "accept-language",
+    "cache-control",
+    "if-none-match",
+    "if-modified-since",
+    "range",
+]
+
+# responses with these statuses can't have a content-length
+NO_CONTENT_LENGTH_STATUSES = {
+    HTTPStatus.NO_CONTENT,
+    HTTPStatus.NOT_MODIFIED,
+}
+
+# bodies at least this big are compressed in a thread, not blocking others
+COMPRESSION_THREAD_SIZE = 256 * 1024
+
+SKIPPED_RESPONSE_HEADERS = {
+    APIKEY_HEADER.lower().encode(),
+    # content-length is set by the gateway, if known
+    b"content-length",
+    # hop-by-hop headers
+    b"connection",
+    b"keep-alive",
+    b"proxy-authenticate",
+    b"proxy-authorization",
+    b"te",
+    b"trailer",
+    b"transfer-encoding",
+    b"upgrade",
+    # set by the gateway's server
+    b"date",
+    b"server",
+}
+
+
+# NOTE: DB sessions are only opened when needed, and never held while
+# waiting for the services
+router = APIRouter(dependencies=[Depends(optional_token)])
+
+
+class ServiceInfo(NamedTuple):
+    id: int
+    url: str
+    # all the service's URLs, including the main one
+    endpoints: Tuple[str, ...]
+    apikey: str
+    stream_threshold: Optional[int]
+    cache_responses: bool
+    coalesce_requests: bool
+    hedge_percentile: Optional[float]
+    connect_retries: int
+    max_in_flight: Optional[int]
+    max_queued: int
+    queue_timeout: float
+    rate_limit: Optional[RateLimit]
+
+
+RoutingTable = routing.RoutingTable[ServiceInfo]
+
+routing_table: RoutingTable = RoutingTable([])
+
+single_flight: SingleFlight[Response] = SingleFlight()
 
-router = APIRouter(
-    dependencies=[Depends(get_session), Depends(optional_token)],
-)
 
-ServiceInfo = Tuple[str, str]  # (url, apikey)
-RoutingTable = List[Tuple[re.Pattern[str], ServiceInfo]]
-
-routing_table: RoutingTable = []
+async def get_routing_table() -> RoutingTable:
+    return routing_table
 
 
 @router.delete("/tokens", tags=["Auth"])
 async def logout(
-    session: SessionDep,
     response: Response,
     token: Annotated[dict[str, Any], get_raw_token],
     request: Request,
+    table: RoutingTable = Depends(get_routing_table),
 ) -> Response:
-    await tokens_db.invalidate_token(
-        session, token["sub"], token["iat"], token["exp"]
-    )
-    await proxy(session, request.url.path, response, request)
+    async with SessionLocal() as session:
+        async with session.begin():
+            await tokens_db.invalidate_token(
+                session, token["sub"], token["iat"], token["exp"]
+            )
+    user = User(**token)
+    response = await proxy(request.url.path, response, request, table, user)
     response.status_code = HTTPStatus.OK
     return response
 
 
-def specificity(path: str) -> int:
-    return sum(c not in r".\\[]()*?+" for c in path)
+class RoutingSnapshot(NamedTuple):
+    # (path, service) pairs of the services that aren't blocked
+    routes: List[Tuple[str, ServiceInfo]]
+    # URLs of all the services, as blocked ones are still checked
+    urls: Dict[int, List[str]]
 
 
-async def build_routing_table() -> RoutingTable:
+async def load_routing_snapshot() -> RoutingSnapshot:
     async with SessionLocal() as session:
-        svcs = await services_db.get_all_services_inner(session, blocked=False)
+        svcs = await services_db.get_all_services_inner(session, limit=None)
 
     # NOTE: svc.path and url are never None even if mypy says otherwise
-    table = list(map(lambda svc: (svc.path, (svc.url, svc.apikey)), svcs))
-    table.sort(key=lambda pu: specificity(pu[0]))
-    return [(re.compile(path), info) for (path, info) in table]
+    routes = [
+        (
+            svc.path,
+            ServiceInfo(
+                id=svc.id,
+                url=svc.url,
+                endpoints=tuple(svc.urls),
+                apikey=svc.apikey,
+                stream_threshold=svc.stream_threshold,
+                cache_responses=svc.cache_responses,
+                coalesce_requests=svc.coalesce_requests,
+                hedge_percentile=svc.hedge_percentile,
+                connect_retries=svc.connect_retries,
+                max_in_flight=svc.max_in_flight,
+                max_queued=svc.max_queued,
+                queue_timeout=svc.queue_timeout,
+                rate_limit=service_limit(svc.rate_limit, svc.rate_limit_burst),
+            ),
+        )
+        for svc in svcs
+        if not svc.blocked
+    ]
+    routes.sort(key=lambda pu: specificity(pu[0]))
+    return RoutingSnapshot(routes, {svc.id: svc.urls for svc in svcs})
+
+
+async def install_routing_table(snapshot: RoutingSnapshot) -> RoutingTable:
+    """Builds a routing table, syncing the per-service state with it"""
+    # blocked services keep their clients, as their status is still checked
+    await client_pool.sync(snapshot.urls)
+    circuit_breakers.sync(snapshot.urls)
+    upstream_policies.sync(list(snapshot.urls))
+    bulkheads.sync(list(snapshot.urls))
+    service_metrics.sync(list(snapshot.urls))
+    routing_table_routes.labels().set(len(snapshot.routes))
+    return RoutingTable(snapshot.routes)
 
 
-async def regenerate_routing_table() -> None:
+async def build_routing_table() -> RoutingTable:
+    return await install_routing_table(await load_routing_snapshot())
+
+
+def encode_routing_snapshot(snapshot: RoutingSnapshot) -> bytes:
+    routes = [(path, svc_info._asdict()) for path, svc_info in snapshot.routes]
+    return json.dumps({"routes": routes, "urls": snapshot.urls}).encode()
+
+
+def decode_routing_snapshot(payload: bytes) -> RoutingSnapshot:
+    snapshot = json.loads(payload)
+    routes = []
+    for path, fields in snapshot["routes"]:
+        rate_limit = fields["rate_limit"]
+        svc_info = ServiceInfo(
+            **{
+                **fields,
+                "endpoints": tuple(fields["endpoints"]),
+                "rate_limit": None
+                if rate_limit is None
+                else RateLimit(*rate_limit),
+            }
+        )
+        routes.append((path, svc_info))
+    # NOTE: JSON object keys are always strings
+    urls = {int(id): urls for id, urls in snapshot["urls"].items()}
+    return RoutingSnapshot(routes, urls)
+
+
+async def apply_routing_snapshot(payload: bytes) -> None:
+    """Replaces the routing table with one published by another worker"""
+    global routing_table
+    start = time.perf_counter()
+    snapshot = decode_routing_snapshot(payload)
+    routing_table = await install_routing_table(snapshot)
+    routing_table_rebuild.labels().observe(time.perf_counter() - start)
+    debug(f"Installed routing snapshot with {len(snapshot.routes)} routes")
+
+
+async def get_services_version() -> int:
+    async with SessionLocal() as session:
+        return await services_db.get_services_version(session)
+
+
+async def wait_for_changes() -> None:
+    """Waits until this process changes the services, or for REGEN_DELAY"""
+    # NOTE: asyncio.wait_for can swallow cancellations in python 3.11
+    waiter = asyncio.create_task(services_db.services_changed.wait())
+    try:
+        await asyncio.wait([waiter], timeout=REGEN_DELAY)
+    finally:
+        waiter.cancel()
+
+
+async def refresh_routing_table(
+    current_version: Optional[int],
+    publish: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """
+    Rebuilds the routing table if the services' version moved, publishing
+    it to the other workers if given a way to
+    """
     global routing_table
+    # NOTE: version is read first so no change goes unnoticed
+    version = await get_services_version()
+    if version != current_version:
+        stats = routing_table.cache.stats()
+        start = time.perf_counter()
+        snapshot = await load_routing_snapshot()
+        routing_table = await install_routing_table(snapshot)
+        routing_table_rebuild.labels().observe(time.perf_counter() - start)
+        if publish is not None:
+            publish(encode_routing_snapshot(snapshot))
+        debug(f"Route cache of the replaced routing table: {stats}")
+    return version
+
+
+async def regenerate_routing_table(
+    publish: Optional[Callable[[bytes], None]] = None
+) -> None:
+    """Rebuilds the routing table each time the services change"""
+    current_version = None
     try:
         while True:
-            routing_table = await build_routing_table()
-            await asyncio.sleep(REGEN_DELAY)
+            # cleared before reading the version, so no change is missed
+            services_db.services_changed.clear()
+            # NOTE: shielded so cancelling doesn't leave the DB locked
+            current_version = await asyncio.shield(
+                refresh_routing_table(current_version, publish)
+            )
+            await wait_for_changes()
     except asyncio.CancelledError:  # task was cancelled
         return
 
@@ -71,65 +316,497 @@ def launch_routing_table_generator() -> asyncio.Task[Any]:
     return asyncio.create_task(regenerate_routing_table())
 
 
-async def forward_request(svc_info: ServiceInfo, req: Request) -> SvcResp:
-    svc_url, svc_apikey = svc_info
-
+def request_headers(svc_info: ServiceInfo, req: Request) -> Dict[str, str]:
+    """Returns the headers sent to the service"""
     headers = dict(req.headers)
     # content-length should be set according to request length
     headers.pop("content-length", None)
     # host should be set according to requested host
     headers.pop("host", None)
+    # the body is forwarded as-is, so don't let the client add compression
+    headers.setdefault("accept-encoding", "identity")
 
     # add apikey
-    headers[APIKEY_HEADER] = svc_apikey
+    headers[APIKEY_HEADER] = svc_info.apikey
+    return headers
+
+
+def has_body(req: Request) -> bool:
+    return (
+        req.headers.get("content-length", "0") != "0"
+        or "transfer-encoding" in req.headers
+    )
+
+
+async def send_attempt(
+    svc_info: ServiceInfo,
+    policy: UpstreamPolicy,
+    req: Request,
+    headers: Dict[str, str],
+    with_body: bool,
+) -> SvcResp:
+    """Sends the request to one of the service's URLs"""
+    endpoint = choose_endpoint(svc_info.id, svc_info.endpoints)
+    svc_client = client_pool.get(svc_info.id, endpoint)
 
     url = URL(path=req.url.path, query=req.url.query.encode("utf-8"))
-    content = req.stream()
-
-    async with AsyncClient(base_url=svc_url) as client:
-        svc_req = client.build_request(
-            req.method,
-            url=url,
-            headers=headers,
-            cookies=req.cookies,
-            content=content,
-        )
-        svc_response = await client.send(svc_req)
+    content = req.stream() if with_body else None
+
+    svc_req = svc_client.client.build_request(
+        req.method,
+        url=url,
+        headers=headers,
+        cookies=req.cookies,
+        content=content,
+    )
 
-    svc_response.headers.pop(APIKEY_HEADER, None)
+    breaker = circuit_breakers.get(svc_info.id, endpoint)
+    breaker.acquire()
+    start = time.monotonic()
+    try:
+        svc_response = await svc_client.send(svc_req, stream=True)
+    except asyncio.CancelledError:
+        breaker.cancel()
+        raise
+    except Exception:
+        breaker.record(failed=True, latency=time.monotonic() - start)
+        raise
+
+    # NOTE: only the time to get the response's headers is measured
+    latency = time.monotonic() - start
+    breaker.record(svc_response.status_code >= 500, latency)
+    policy.latencies.record(latency)
+    service_metrics.get(svc_info.id).ttfb.observe(latency)
     return svc_response
 
 
-async def get_routing_table() -> RoutingTable:
-    return routing_table
+async def forward_request(
+    svc_info: ServiceInfo,
+    req: Request,
+    headers: Optional[Dict[str, str]] = None,
+) -> SvcResp:
+    sent_headers = (
+        request_headers(svc_info, req) if headers is None else headers
+    )
+    policy = upstream_policies.get(svc_info.id)
+    policy.budget.deposit()
+
+    # the body can only be read once, so those requests are sent only once
+    if req.method not in IDEMPOTENT_METHODS or has_body(req):
+        return await send_attempt(svc_info, policy, req, sent_headers, True)
+
+    def attempt() -> Coroutine[Any, Any, SvcResp]:
+        return send_attempt(svc_info, policy, req, sent_headers, False)
+
+    def retried() -> Coroutine[Any, Any, SvcResp]:
+        return policy.retried(attempt, svc_info.connect_retries)
+
+    delay = None
+    if svc_info.hedge_percentile is not None and req.method in HEDGED_METHODS:
+        delay = policy.hedge_delay(svc_info.hedge_percentile)
+    if delay is None:
+        return await retried()
+    return await policy.hedged(retried, delay)
+
+
+def response_headers(svc_response: SvcResp) -> List[Tuple[bytes, bytes]]:
+    """Returns the upstream response headers that should reach the client"""
+    return [
+        (name.lower(), value)
+        for name, value in svc_response.headers.raw
+        if name.lower() not in SKIPPED_RESPONSE_HEADERS
+    ]
+
+
+def should_stream(svc_info: ServiceInfo, svc_response: SvcResp) -> bool:
+    if svc_info.stream_threshold is None:
+        return False
+
+    length = content_length(svc_response)
+    return length is None or length >= svc_info.stream_threshold
+
+
+def content_length(svc_response: SvcResp) -> Optional[int]:
+    """Returns the response's length, or None if it's unknown or invalid"""
+    try:
+        return int(svc_response.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def buffer_response(
+    svc_response: SvcResp, response: Response
+) -> Response:
+    try:
+        body = b"".join([chunk async for chunk in svc_response.aiter_raw()])
+    finally:
+        await svc_response.aclose()
+
+    response.body = body
+    response.status_code = svc_response.status_code
+    response.raw_headers.extend(response_headers(svc_response))
+    if svc_response.status_code not in NO_CONTENT_LENGTH_STATUSES:
+        length = str(len(body)).encode()
+        response.raw_headers.append((b"content-length", length))
+    return response
+
+
+def stream_response(svc_response: SvcResp) -> StreamingResponse:
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in svc_response.aiter_raw():
+                yield chunk
+        finally:
+            await svc_response.aclose()
+
+    response = StreamingResponse(
+        body(),
+        status_code=svc_response.status_code,
+        # also runs when the client disconnects mid-stream
+        background=BackgroundTask(svc_response.aclose),
+    )
+    response.raw_headers.extend(response_headers(svc_response))
+    return response
+
+
+async def compressed_stream(
+    chunks: AsyncIterable[Content], compressor: StreamCompressor
+) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        data = compressor.compress(
+            chunk if isinstance(chunk, bytes) else chunk.encode()
+        )
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def should_compress(response: Response) -> bool:
+    headers = response.headers
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    return not (
+        response.status_code in NO_CONTENT_LENGTH_STATUSES
+        or response.status_code == HTTPStatus.PARTIAL_CONTENT
+        or headers.get("content-encoding", "identity") != "identity"
+        or "no-transform" in cache_control
+        or not is_compressible(headers.get("content-type"))
+        or (
+            not isinstance(response, StreamingResponse)
+            and len(response.body) < COMPRESSION_MIN_SIZE
+        )
+    )
+
+
+async def compress_response(request: Request, response: Response) -> Response:
+    """Compresses the response, if the client accepts it"""
+    if not should_compress(response):
+        return response
+
+    headers = response.headers
+    vary = ", ".join(headers.getlist("vary"))
+    if "accept-encoding" not in vary.lower():
+        headers["vary"] = (
+            f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        )
+
+    encoding = choose_encoding(
+        request.headers.get("accept-encoding"), ENCODINGS
+    )
+    if encoding == "identity":
+        return response
+
+    headers["content-encoding"] = encoding
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        # the body is no longer byte-for-byte the service's
+        headers["etag"] = f"W/{etag}"
+
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = compressed_stream(
+            response.body_iterator, StreamCompressor(encoding)
+        )
+        return response
+
+    if len(response.body) >= COMPRESSION_THREAD_SIZE:
+        body = await asyncio.to_thread(compress, response.body, encoding)
+    else:
+        body = compress(response.body, encoding)
+    response.body = body
+    headers["content-length"] = str(len(body))
+    return response
+
+
+def request_target(request: Request) -> str:
+    query = request.url.query
+    return f"{request.url.path}?{query}" if query else request.url.path
+
+
+def cached_response(
+    entry: CachedResponse, request: Request, now: float
+) -> Response:
+    headers = [*entry.headers, (b"age", str(int(entry.age(now))).encode())]
+
+    if entry.etag is not None and etag_matches(
+        request.headers.get("if-none-match"), entry.etag
+    ):
+        response = Response(status_code=HTTPStatus.NOT_MODIFIED)
+        response.raw_headers = headers
+        return response
+
+    response = Response(status_code=entry.status_code)
+    response.body = entry.body
+    length = str(len(entry.body)).encode()
+    response.raw_headers = [*headers, (b"content-length", length)]
+    return response
+
+
+async def send_request(
+    svc_info: ServiceInfo,
+    request: Request,
+    headers: Optional[Dict[str, str]] = None,
+) -> SvcResp:
+    try:
+        return await forward_request(svc_info, request, headers)
+    except CircuitOpenError as e:
+        raise HTTPException(
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            "Service is unavailable",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except Exception as e:
+        error(str(e))
+        raise HTTPException(HTTPStatus.NOT_FOUND)
+
+
+async def send_response(
+    svc_info: ServiceInfo, svc_response: SvcResp, response: Response
+) -> Response:
+    try:
+        if should_stream(svc_info, svc_response):
+            return stream_response(svc_response)
+        return await buffer_response(svc_response, response)
+    except Exception as e:
+        error(str(e))
+        await svc_response.aclose()
+        raise HTTPException(HTTPStatus.NOT_FOUND)
+
+
+async def cached_proxy(
+    svc_info: ServiceInfo, request: Request, response: Response
+) -> Response:
+    """Proxies GET requests through the response cache"""
+    now = time.time()
+    key = response_cache.key(
+        svc_info.id, svc_info.url, request_target(request), request.headers
+    )
+    entry = response_cache.get(key, request.headers, now)
+    if entry is not None and can_serve(entry, request.headers, now):
+        return cached_response(entry, request, now)
+
+    # the cache sends its own conditional headers, so it gets full responses
+    headers = request_headers(svc_info, request)
+    for name in CONDITIONAL_HEADERS:
+        headers.pop(name, None)
+    if entry is not None:
+        headers.update(entry.validators())
+
+    svc_response = await send_request(svc_info, request, headers)
+
+    if (
+        entry is not None
+        and svc_response.status_code == HTTPStatus.NOT_MODIFIED
+    ):
+        await svc_response.aclose()
+        entry = refreshed_entry(entry, svc_response.headers, now)
+        response_cache.put(key, entry)
+        return cached_response(entry, request, now)
+
+    response = await send_response(svc_info, svc_response, response)
+    if not isinstance(response, StreamingResponse):
+        new_entry = build_entry(
+            request.headers,
+            response.status_code,
+            svc_response.headers,
+            response_headers(svc_response),
+            response.body,
+            now,
+        )
+        if new_entry is not None:
+            response_cache.put(key, new_entry)
+    return response
+
+
+def can_coalesce(request: Request) -> bool:
+    """Returns true for idempotent requests without a body"""
+    return (
+        request.method == "GET"
+        and request.headers.get("content-length", "0") == "0"
+        and "transfer-encoding" not in request.headers
+    )
+
+
+def copy_response(response: Response) -> Response:
+    copy = Response(status_code=response.status_code)
+    copy.body = response.body
+    copy.raw_headers = list(response.raw_headers)
+    return copy
+
+
+async def proxy_get(
+    svc_info: ServiceInfo, request: Request, response: Response
+) -> Response:
+    if svc_info.cache_responses:
+        return await cached_proxy(svc_info, request, response)
+
+    svc_response = await send_request(svc_info, request)
+    return await send_response(svc_info, svc_response, response)
+
+
+async def coalesced_proxy(
+    svc_info: ServiceInfo, request: Request, response: Response
+) -> Response:
+    """Shares the service's response between identical concurrent GETs"""
+    key = (
+        svc_info.id,
+        svc_info.url,
+        request_target(request),
+        *(request.headers.get(name) for name in COALESCING_HEADERS),
+    )
+    shared, is_follower = await single_flight.do(
+        key, lambda: proxy_get(svc_info, request, response)
+    )
+    if not is_follower and shared is not None:
+        return shared
+
+    # streamed responses can only be sent to a single client
+    if shared is None or isinstance(shared, StreamingResponse):
+        return await proxy_get(svc_info, request, response)
+    return copy_response(shared)
 
 
 async def proxy(
-    session: SessionDep,
     path: str,
     response: Response,
     request: Request,
     table: RoutingTable = Depends(get_routing_table),
+    user: Optional[User] = Depends(optional_token),
 ) -> Response:
     path = request.url.path
-    svc_info = next(
-        (info for (regex, info) in table if regex.fullmatch(path)),
-        None,
-    )
+    svc_info = table.match(path)
     if svc_info is None:
         response.status_code = HTTPStatus.NOT_FOUND
         return response
 
-    info(f"Redirecting request to '{svc_info[0]}{path}'")
+    info(f"Redirecting request to '{svc_info.url}{path}'")
+
+    if profiler.active:
+        profiler.tag(f"service:{svc_info.id}")
+
+    metrics = service_metrics.get(svc_info.id)
+    start = time.perf_counter()
+    try:
+        response = await limit_and_proxy(svc_info, request, response, user)
+    except HTTPException as e:
+        metrics.observe_request(e.status_code, time.perf_counter() - start)
+        raise
+    except Exception:
+        elapsed = time.perf_counter() - start
+        metrics.observe_request(HTTPStatus.INTERNAL_SERVER_ERROR, elapsed)
+        raise
+    metrics.observe_request(response.status_code, time.perf_counter() - start)
+    return response
+
+
+async def limit_and_proxy(
+    svc_info: ServiceInfo,
+    request: Request,
+    response: Response,
+    user: Optional[User],
+) -> Response:
+    """Proxies the request, within the client's and service's limits"""
+    limit = await check_rate_limit(svc_info, request, user)
+    if limit is not None and not limit.allowed:
+        raise HTTPException(
+            HTTPStatus.TOO_MANY_REQUESTS,
+            "Too many requests",
+            headers=limit.headers(),
+        )
+
+    bulkhead = bulkheads.get(
+        svc_info.id,
+        svc_info.max_in_flight,
+        svc_info.max_queued,
+        svc_info.queue_timeout,
+    )
+    try:
+        await bulkhead.acquire()
+    except BulkheadFullError:
+        raise HTTPException(
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            "Service is overloaded",
+            headers={"Retry-After": "1"},
+        )
 
     try:
-        svc_response = await forward_request(svc_info, request)
-        response.body = svc_response.content
-        response.status_code = svc_response.status_code
+        response = await proxy_request(svc_info, request, response)
+    except BaseException:
+        bulkhead.release()
+        raise
+    if limit is not None:
+        response.headers.update(limit.headers())
+    return release_after(response, bulkhead)
+
+
+async def check_rate_limit(
+    svc_info: ServiceInfo, request: Request, user: Optional[User]
+) -> Optional[RateLimitResult]:
+    """Takes a token from the client's buckets"""
+    if user is not None:
+        client = f"user:{user.sub}"
+    else:
+        client = f"ip:{request.client.host if request.client else ''}"
+    return await rate_limiter.check(
+        client, svc_info.id, svc_info.rate_limit, time.time()
+    )
+
+
+async def proxy_request(
+    svc_info: ServiceInfo, request: Request, response: Response
+) -> Response:
+    if svc_info.coalesce_requests and can_coalesce(request):
+        response = await coalesced_proxy(svc_info, request, response)
+    elif request.method == "GET":
+        response = await proxy_get(svc_info, request, response)
+    else:
+        svc_response = await send_request(svc_info, request)
+        response = await send_response(svc_info, svc_response, response)
+
+        if svc_info.cache_responses and response.status_code < 400:
+            # the resource was probably modified
+            response_cache.invalidate(svc_info.id, request_target(request))
+
+    # NOTE: compressed last, so cached and shared responses are never encoded
+    return await compress_response(request, response)
+
+
+def release_after(response: Response, bulkhead: Bulkhead) -> Response:
+    """Releases the bulkhead's slot once the response is sent"""
+    if not isinstance(response, StreamingResponse):
+        bulkhead.release()
         return response
-    except Exception as e:
-        error(str(e))
-        raise HTTPException(HTTPStatus.NOT_FOUND)
+
+    # streamed responses keep their slot until the stream is closed
+    background = response.background
+
+    async def close() -> None:
+        try:
+            if background is not None:
+                await background()
+        finally:
+            bulkhead.release()
+
+    response.background = BackgroundTask(close)
+    return response
 
 
 methods = ["GET", "PUT", "POST", "PATCH", "DELETE"]
@@ -1,17 +1,32 @@
+import asyncio
+import time
 import uvicorn
 import pytest
-from typing import AsyncGenerator, List, Optional
+from typing import Any, AsyncGenerator, List, MutableMapping, Optional
 from fastapi import Depends, FastAPI, Request
-from httpx import AsyncClient, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from httpx import AsyncClient, Response as ClientResponse
 from http import HTTPStatus
 from multiprocessing import Process
+from sqlalchemy import update
 
+from src.api import proxy
+from src.api.clients import APIKEY_HEADER, client_pool
+from src.api.config import CIRCUIT_MIN_REQUESTS
 from src.api.model.service import AddService
-from src.api.proxy import APIKEY_HEADER
+from src.api.response_cache import response_cache
+from src.db import services as services_db
+from src.db.model.service import DBService
+from src.db.model.version import DBServicesVersion
+from src.db.session import SessionLocal
+from src.db.status_updater import check_statuses
+from src.main import app
 
 
 MSG = "hello world!"
+BIG_MSG = MSG * 100_000
 PORT = 26414
+URL = f"http://localhost:{PORT}/"
 
 
 class ServerHandle:
@@ -34,6 +49,11 @@ def check_apikey(req: Request) -> None:
 dummy_app = FastAPI(dependencies=[Depends(check_apikey)])
 
 
+@dummy_app.get("/health")
+async def get_health() -> str:
+    return "ok"
+
+
 @dummy_app.get("/hello")
 async def get_hello() -> str:
     return MSG
@@ -59,6 +79,52 @@ async def delete_hello() -> str:
     return MSG
 
 
+@dummy_app.get("/hello/empty")
+async def get_empty_hello() -> Response:
+    return Response(status_code=HTTPStatus.NO_CONTENT)
+
+
+@dummy_app.get("/hello/big")
+async def get_big_hello() -> PlainTextResponse:
+    return PlainTextResponse(BIG_MSG, headers={"X-Custom": "custom"})
+
+
+@dummy_app.get("/hello/json")
+async def get_json_hello() -> Response:
+    return JSONResponse([MSG] * 1000, headers={"ETag": '"hello"'})
+
+
+responses_sent = 0
+
+
+@dummy_app.get("/hello/cached")
+async def get_cached_hello() -> Response:
+    global responses_sent
+    responses_sent += 1
+    return PlainTextResponse(
+        str(responses_sent), headers={"Cache-Control": "max-age=60"}
+    )
+
+
+@dummy_app.get("/hello/etag")
+async def get_etag_hello(req: Request) -> Response:
+    global responses_sent
+    headers = {"Cache-Control": "no-cache", "ETag": '"v1"'}
+    if req.headers.get("if-none-match") == '"v1"':
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    responses_sent += 1
+    return PlainTextResponse(str(responses_sent), headers=headers)
+
+
+@dummy_app.get("/hello/slow")
+async def get_slow_hello() -> Response:
+    global responses_sent
+    responses_sent += 1
+    sent = responses_sent
+    await asyncio.sleep(0.5)
+    return PlainTextResponse(str(sent))
+
+
 def dummy_run(handle: ServerHandle) -> None:
     def _check_apikey(req: Request) -> None:
         handle.check_apikey(req)
@@ -76,7 +142,7 @@ async def dummy_server() -> AsyncGenerator[ServerHandle, None]:
     proc.kill()
 
 
-def assert_method_works(response: Response) -> None:
+def assert_method_works(response: ClientResponse) -> None:
     assert response.status_code == HTTPStatus.OK
     assert response.json() == MSG
 
@@ -102,3 +168,449 @@ async def test_proxy_various_methods(
     assert_method_works(await client.delete("/hello"))
 
     assert dummy_server.fails == []
+
+
+async def test_proxy_reuses_connections(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello",
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    for _ in range(3):
+        assert_method_works(await client.get("/hello"))
+
+    stats = client_pool.stats()[(id, URL)]
+    assert stats.requests == 3
+    assert stats.in_flight == 0
+    assert stats.connections == 1
+
+
+async def test_proxy_streams_big_responses(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        stream_threshold=len(MSG) + 10,
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    # under the threshold, responses are buffered
+    response = await client.get("/hello")
+    assert_method_works(response)
+    assert response.headers["content-length"] == str(len(response.content))
+
+    response = await client.get("/hello/big")
+    assert response.status_code == HTTPStatus.OK
+    assert response.text == BIG_MSG
+    assert response.headers["x-custom"] == "custom"
+    assert response.headers["content-type"].startswith("text/plain")
+    # streamed responses have no known length
+    assert "content-length" not in response.headers
+
+    assert client_pool.stats()[(id, URL)].in_flight == 0
+
+
+async def test_proxy_compresses_responses(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        stream_threshold=len(BIG_MSG),
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+
+    gzip = {"accept-encoding": "gzip"}
+    response = await client.get("/hello/json", headers=gzip)
+    assert response.json() == [MSG] * 1000
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"hello"'
+    assert int(response.headers["content-length"]) < len(MSG) * 1000
+
+    response = await client.get("/hello/json", headers={"accept-encoding": ""})
+    assert response.json() == [MSG] * 1000
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    # small responses aren't worth compressing
+    response = await client.get("/hello", headers=gzip)
+    assert_method_works(response)
+    assert "content-encoding" not in response.headers
+
+    # streamed responses are compressed chunk by chunk
+    response = await client.get("/hello/big", headers=gzip)
+    assert response.text == BIG_MSG
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+
+
+async def test_proxy_no_content_response(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+
+    response = await client.get("/hello/empty")
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert "content-length" not in response.headers
+
+
+async def test_proxy_caches_responses(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        cache_responses=True,
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    response_cache.clear()
+
+    first = await client.get("/hello/cached")
+    second = await client.get("/hello/cached")
+    assert first.status_code == second.status_code == HTTPStatus.OK
+    assert first.text == second.text
+    assert second.headers["content-length"] == str(len(second.content))
+    assert "age" in second.headers
+
+    # clients can ask for fresh responses
+    third = await client.get(
+        "/hello/cached", headers={"Cache-Control": "no-cache"}
+    )
+    assert third.text != second.text
+
+    # responses that must be revalidated are checked with the service
+    revalidations = response_cache.revalidations
+    first = await client.get("/hello/etag")
+    second = await client.get("/hello/etag")
+    assert first.text == second.text
+    assert response_cache.revalidations == revalidations + 1
+
+    response = await client.get(
+        "/hello/etag", headers={"If-None-Match": '"v1"'}
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+
+
+async def test_proxy_coalesces_requests(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        coalesce_requests=True,
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+
+    deduplicated = proxy.single_flight.deduplicated
+    responses = await asyncio.gather(
+        *[client.get("/hello/slow") for _ in range(5)]
+    )
+
+    assert all(r.status_code == HTTPStatus.OK for r in responses)
+    assert len({r.text for r in responses}) == 1
+    assert proxy.single_flight.deduplicated == deduplicated + 4
+
+    # requests from other users aren't coalesced
+    first, second = await asyncio.gather(
+        client.get("/hello/slow", headers={"Cookie": "user=1"}),
+        client.get("/hello/slow", headers={"Cookie": "user=2"}),
+    )
+    assert first.text != second.text
+
+
+async def test_health_monitor_checks_services(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    services = [
+        AddService(name="up", url=f"http://localhost:{PORT}/", path="^/a"),
+        AddService(name="down", url="http://localhost:1/", path="^/b"),
+    ]
+    for body in services:
+        response = await client.post("/services", json=body.dict())
+        assert response.status_code == HTTPStatus.CREATED
+
+    await check_statuses()
+
+    response = await client.get("/services")
+    assert response.status_code == HTTPStatus.OK
+    statuses = {svc["name"]: svc["up"] for svc in response.json()}
+    assert statuses == {"up": True, "down": False}
+
+    response = await client.get("/services", params={"up": True})
+    assert [svc["name"] for svc in response.json()] == ["up"]
+
+
+async def test_proxy_balances_between_endpoints(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url="http://localhost:1/",
+        path="^/hello.*",
+        endpoints=[URL],
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    # the main URL is down, so it's taken out of rotation
+    await check_statuses()
+    for _ in range(5):
+        assert_method_works(await client.get("/hello"))
+
+    response = await client.get(f"/services/{id}")
+    service = response.json()
+    assert service["up"]
+    assert service["endpoints"] == [URL]
+    assert service["in_flight"] == {"http://localhost:1/": 0, URL: 0}
+
+    response = await client.patch(f"/services/{id}", json={"endpoints": []})
+    assert response.json()["endpoints"] == []
+
+
+async def test_proxy_fails_fast_on_open_circuit(client: AsyncClient) -> None:
+    body = AddService(
+        name="down service", url="http://localhost:1/", path="^/down.*"
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    statuses = []
+    for _ in range(CIRCUIT_MIN_REQUESTS + 1):
+        statuses.append((await client.get("/down")).status_code)
+
+    assert statuses[:-1] == [HTTPStatus.NOT_FOUND] * CIRCUIT_MIN_REQUESTS
+    assert statuses[-1] == HTTPStatus.SERVICE_UNAVAILABLE
+
+    response = await client.get("/down")
+    assert int(response.headers["retry-after"]) > 0
+
+    response = await client.get(f"/services/{id}")
+    assert response.json()["circuit_state"] == "open"
+
+
+async def test_proxy_sheds_load_over_service_limit(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        max_in_flight=1,
+        max_queued=0,
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    responses = await asyncio.gather(
+        client.get("/hello/slow"), client.get("/hello/slow")
+    )
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [HTTPStatus.OK, HTTPStatus.SERVICE_UNAVAILABLE]
+
+    response = await client.get(f"/services/{id}")
+    assert response.json()["bulkhead"] == {
+        "in_flight": 0,
+        "queued": 0,
+        "rejected": 1,
+        "timed_out": 0,
+    }
+
+    # with room in the queue, both requests are handled
+    response = await client.patch(f"/services/{id}", json={"max_queued": 1})
+    assert response.status_code == HTTPStatus.OK
+    responses = await asyncio.gather(
+        client.get("/hello/slow"), client.get("/hello/slow")
+    )
+    assert [r.status_code for r in responses] == [HTTPStatus.OK] * 2
+
+
+async def test_proxy_limits_request_rate(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        rate_limit=0.1,
+        rate_limit_burst=2,
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+
+    responses = [await client.get("/hello") for _ in range(3)]
+
+    assert_method_works(responses[0])
+    assert responses[0].headers["ratelimit-limit"] == "2"
+    assert responses[0].headers["ratelimit-remaining"] == "1"
+    assert responses[1].headers["ratelimit-remaining"] == "0"
+    assert responses[2].status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(responses[2].headers["retry-after"]) > 0
+
+
+async def test_proxy_records_metrics(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+    )
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    assert_method_works(await client.get("/hello"))
+
+    response = await client.get("/metrics")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics = response.text
+    assert (
+        f'kinetix_request_duration_seconds_count{{service="{id}",'
+        'status="200"} 1' in metrics
+    )
+    assert (
+        f'kinetix_upstream_ttfb_seconds_count{{service="{id}"}} 1' in metrics
+    )
+    assert (
+        f'kinetix_upstream_connect_seconds_count{{service="{id}"}}' in metrics
+    )
+    assert (
+        f'kinetix_upstream_in_flight{{service="{id}",url="{URL}"}} 0'
+        in metrics
+    )
+
+
+async def test_proxy_closes_stream_on_disconnect(
+    dummy_server: ServerHandle, client: AsyncClient
+) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello.*",
+        stream_threshold=0,
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    requested = False
+    disconnected = asyncio.Event()
+    chunks: List[bytes] = []
+
+    async def receive() -> MutableMapping[str, Any]:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: MutableMapping[str, Any]) -> None:
+        if message["type"] == "http.response.body":
+            chunks.append(message["body"])
+            # the client goes away after the first chunk
+            disconnected.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/hello/big",
+        "raw_path": b"/hello/big",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"test")],
+        "client": ("test", 1234),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    assert len(b"".join(chunks)) < len(BIG_MSG)
+    assert client_pool.stats()[(id, URL)].in_flight == 0
+
+
+async def wait_until_routed(path: str, routed: bool = True) -> None:
+    """Polls the routing table until `path` is (or isn't) routed"""
+    deadline = time.monotonic() + 10 * proxy.REGEN_DELAY
+    while (proxy.routing_table.match(path) is not None) != routed:
+        assert time.monotonic() < deadline, "routing table wasn't updated"
+        await asyncio.sleep(0.01)
+
+
+async def test_routing_table_updates_on_changes(client: AsyncClient) -> None:
+    body = AddService(
+        name="dummy service",
+        url=f"http://localhost:{PORT}/",
+        path="^/hello",
+    )
+
+    response = await client.post("/services", json=body.dict())
+    assert response.status_code == HTTPStatus.CREATED
+    id = response.json()["id"]
+
+    await wait_until_routed("/hello")
+
+    response = await client.delete(f"/services/{id}")
+    assert response.status_code == HTTPStatus.OK
+
+    await wait_until_routed("/hello", routed=False)
+
+
+async def test_routing_table_updates_on_other_replicas_changes(
+    client: AsyncClient,
+) -> None:
+    # simulate another replica's change, without notifying this process
+    async with SessionLocal() as session:
+        session.add(
+            DBService(
+                name="dummy service",
+                url=f"http://localhost:{PORT}/",
+                path="^/hello",
+                apikey="apikey",
+            )
+        )
+        await session.execute(
+            update(DBServicesVersion).values(
+                version=DBServicesVersion.version + 1
+            )
+        )
+        await session.commit()
+
+    assert not services_db.services_changed.is_set()
+    await wait_until_routed("/hello")
@@ -0,0 +1,303 @@
+import fcntl
+import hashlib
+import math
+import os
+import struct
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol, Tuple
+
+from src.api.config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_RATE,
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMIT_SHM_NAME,
+    RATE_LIMIT_SHM_SLOTS,
+)
+
+
+class RateLimit(NamedTuple):
+    # requests per second, once the burst is used up
+    rate: float
+    # requests allowed at once
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return 1 / self.rate
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # seconds until the bucket is full again
+    reset: int
+    # seconds until a request is allowed, if this one wasn't
+    retry_after: int
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def take_token(
+    tat: Optional[float], limit: RateLimit, now: float
+) -> Tuple[bool, float]:
+    """
+    Token bucket, implemented as the generic cell rate algorithm (GCRA).
+    Each bucket is a single number, its theoretical arrival time (TAT):
+    the time at which it will be full again.
+
+    Returns whether the request is allowed, and the bucket's new TAT.
+    """
+    tat = now if tat is None else max(tat, now)
+    new_tat = tat + limit.interval
+    if now < new_tat - limit.burst * limit.interval:
+        return False, tat
+    return True, new_tat
+
+
+def limit_result(
+    allowed: bool, tat: float, limit: RateLimit, now: float
+) -> RateLimitResult:
+    """Describes the bucket with the given TAT, after the request"""
+    # NOTE: rounded so float errors don't take a token away
+    remaining = round((now - tat) / limit.interval + limit.burst, 6)
+    retry_after = tat + limit.interval - limit.burst * limit.interval - now
+    return RateLimitResult(
+        allowed=allowed,
+        limit=limit.burst,
+        remaining=max(0, math.floor(remaining)),
+        reset=math.ceil(max(0.0, tat - now)),
+        retry_after=0 if allowed else max(1, math.ceil(retry_after)),
+    )
+
+
+class RateLimitBackend(ABC):
+    """Storage of the rate limiter's buckets"""
+
+    @abstractmethod
+    async def take(
+        self, key: str, limit: RateLimit, now: float
+    ) -> RateLimitResult:
+        """Takes a token from the key's bucket, if there's one left"""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryBackend(RateLimitBackend):
+    """
+    Buckets kept by this process, in least recently used order. Full
+    buckets are the same as missing ones, so idle buckets are evicted as
+    soon as they fill up again.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self._tats: OrderedDict[str, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    async def take(
+        self, key: str, limit: RateLimit, now: float
+    ) -> RateLimitResult:
+        allowed, tat = take_token(self._tats.pop(key, None), limit, now)
+        self._tats[key] = tat
+        self._evict(now)
+        return limit_result(allowed, tat, limit, now)
+
+    def _evict(self, now: float) -> None:
+        """Evicts the least recently used buckets, if they are full"""
+        # NOTE: bounded, so each request does O(1) work
+        for _ in range(2):
+            if not self._tats:
+                return
+            key, tat = next(iter(self._tats.items()))
+            if tat > now and len(self._tats) <= self.max_keys:
+                return
+            del self._tats[key]
+
+
+class SharedMemoryBackend(RateLimitBackend):
+    """
+    Buckets shared by the worker processes of a host, in a fixed-size
+    table in shared memory. Each key is mapped to a slot holding its hash
+    and its TAT. A key whose slot was taken by another key starts with a
+    full bucket, so collisions can only make limits more lenient.
+    """
+
+    SLOT = struct.Struct("<Qd")
+
+    def __init__(
+        self,
+        name: str = RATE_LIMIT_SHM_NAME,
+        slots: int = RATE_LIMIT_SHM_SLOTS,
+    ) -> None:
+        self.slots = slots
+        size = slots * self.SLOT.size
+        try:
+            self._shm = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._shm = SharedMemory(name=name)
+        assert self._shm.buf is not None  # cannot fail, the block is open
+        self._buffer = self._shm.buf
+        # NOTE: the block outlives each worker, it's shared between them
+        resource_tracker.unregister(f"/{name}", "shared_memory")
+        lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    async def take(
+        self, key: str, limit: RateLimit, now: float
+    ) -> RateLimitResult:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        # NOTE: 0 marks empty slots
+        fingerprint = int.from_bytes(digest, "little") or 1
+        offset = fingerprint % self.slots * self.SLOT.size
+        buffer = self._buffer
+
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            stored, tat = self.SLOT.unpack_from(buffer, offset)
+            old_tat = tat if stored == fingerprint else None
+            allowed, tat = take_token(old_tat, limit, now)
+            self.SLOT.pack_into(buffer, offset, fingerprint, tat)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        return limit_result(allowed, tat, limit, now)
+
+    async def aclose(self) -> None:
+        os.close(self._lock_fd)
+        self._buffer.release()
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Removes the shared memory block, once no worker uses it"""
+        self._shm.unlink()
+
+
+class RedisLike(Protocol):
+    """The subset of Redis' asyncio client used by the rate limiter"""
+
+    async def eval(self, script: str, numkeys: int, *args: Any) -> Any:
+        ...
+
+    async def aclose(self) -> None:
+        ...
+
+
+# take_token, run atomically by Redis
+TAKE_TOKEN_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local new_tat = tat + interval
+if now < new_tat - burst * interval then
+    return {0, tostring(tat)}
+end
+local ttl = math.ceil((new_tat - now) * 1000)
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', ttl)
+return {1, tostring(new_tat)}
+"""
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    Buckets shared by all the gateway's replicas, kept in Redis. Each one
+    expires once it's full, so idle ones are evicted by Redis itself.
+    """
+
+    def __init__(self, client: RedisLike, prefix: str = "ratelimit:") -> None:
+        self.client = client
+        self.prefix = prefix
+
+    async def take(
+        self, key: str, limit: RateLimit, now: float
+    ) -> RateLimitResult:
+        allowed, tat = await self.client.eval(
+            TAKE_TOKEN_SCRIPT,
+            1,
+            self.prefix + key,
+            repr(now),
+            repr(limit.interval),
+            limit.burst,
+        )
+        return limit_result(bool(allowed), float(tat), limit, now)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def create_backend(kind: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if kind == "shared":
+        return SharedMemoryBackend()
+    if kind == "redis":
+        # NOTE: optional dependency, only needed by this backend
+        from redis.asyncio import from_url  # type: ignore
+
+        return RedisBackend(from_url(RATE_LIMIT_REDIS_URL))
+    if kind != "memory":
+        raise ValueError(f"Unknown rate limit backend: {kind}")
+    return MemoryBackend()
+
+
+class RateLimiter:
+    """
+    Limits the requests of each client, identified by user or IP address,
+    to the gateway as a whole and to each service that sets a limit.
+    """
+
+    def __init__(
+        self, backend: RateLimitBackend, limit: Optional[RateLimit]
+    ) -> None:
+        self.backend = backend
+        self.limit = limit
+
+    async def check(
+        self,
+        client: str,
+        service_id: int,
+        service_limit: Optional[RateLimit],
+        now: float,
+    ) -> Optional[RateLimitResult]:
+        """
+        Takes a token from each of the client's buckets. Returns the most
+        restrictive result, or None if no limit applies.
+        """
+        results: List[RateLimitResult] = []
+        if self.limit is not None:
+            results.append(await self.backend.take(client, self.limit, now))
+        if service_limit is not None:
+            key = f"{service_id}:{client}"
+            results.append(await self.backend.take(key, service_limit, now))
+        if not results:
+            return None
+        return min(results, key=lambda r: (r.allowed, r.remaining))
+
+
+def service_limit(
+    rate: Optional[float], burst: Optional[int]
+) -> Optional[RateLimit]:
+    if rate is None:
+        return None
+    return RateLimit(rate, burst or max(1, math.ceil(rate)))
+
+
+rate_limiter = RateLimiter(
+    create_backend(),
+    RateLimit(RATE_LIMIT_RATE, RATE_LIMIT_BURST) if RATE_LIMIT_RATE else None,
+)
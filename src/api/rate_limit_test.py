@@ -0,0 +1,117 @@
+import uuid
+from typing import Any, Dict, List
+
+from src.api.rate_limit import (
+    TAKE_TOKEN_SCRIPT,
+    MemoryBackend,
+    RateLimit,
+    RateLimitBackend,
+    RateLimiter,
+    RedisBackend,
+    SharedMemoryBackend,
+    take_token,
+)
+
+
+LIMIT = RateLimit(rate=1, burst=3)
+
+
+class LocalRedis:
+    """Stand-in for a Redis client, running the script in Python"""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, str] = {}
+        self.closed = False
+
+    async def eval(self, script: str, numkeys: int, *args: Any) -> Any:
+        assert script == TAKE_TOKEN_SCRIPT and numkeys == 1
+        key, now, interval, burst = args
+        stored = self.values.get(key)
+        allowed, tat = take_token(
+            None if stored is None else float(stored),
+            RateLimit(1 / float(interval), int(burst)),
+            float(now),
+        )
+        if allowed:
+            self.values[key] = repr(tat)
+        return [int(allowed), repr(tat).encode()]
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+async def take_all(backend: RateLimitBackend, now: float) -> List[bool]:
+    results = [await backend.take("key", LIMIT, now) for _ in range(4)]
+    return [result.allowed for result in results]
+
+
+async def test_memory_backend_limits_bursts() -> None:
+    backend = MemoryBackend()
+    results = [await backend.take("key", LIMIT, 100) for _ in range(4)]
+
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert results[-1].retry_after == 1
+    assert results[-1].reset == 3
+
+    # a token is added each second
+    assert (await backend.take("key", LIMIT, 101)).allowed
+    assert not (await backend.take("key", LIMIT, 101)).allowed
+
+
+async def test_memory_backend_evicts_idle_buckets() -> None:
+    backend = MemoryBackend()
+    await backend.take("idle", LIMIT, 100)
+    await backend.take("other", LIMIT, 100)
+    assert len(backend) == 2
+
+    # the idle bucket is full again, so it's no longer needed
+    await backend.take("other", LIMIT, 102)
+    assert len(backend) == 1
+
+
+async def test_memory_backend_is_bounded() -> None:
+    backend = MemoryBackend(max_keys=2)
+    for key in ["a", "b", "c"]:
+        await backend.take(key, LIMIT, 100)
+
+    assert len(backend) == 2
+
+
+async def test_shared_memory_backend_limits_bursts() -> None:
+    name = f"kinetix-test-{uuid.uuid4().hex[:8]}"
+    backend = SharedMemoryBackend(name=name, slots=16)
+    try:
+        assert await take_all(backend, 100) == [True, True, True, False]
+
+        # other workers see the same buckets
+        other = SharedMemoryBackend(name=name, slots=16)
+        assert not (await other.take("key", LIMIT, 100)).allowed
+        await other.aclose()
+    finally:
+        await backend.aclose()
+        backend.unlink()
+
+
+async def test_redis_backend_limits_bursts() -> None:
+    redis = LocalRedis()
+    backend = RedisBackend(redis)
+
+    assert await take_all(backend, 100) == [True, True, True, False]
+    assert list(redis.values) == ["ratelimit:key"]
+
+    await backend.aclose()
+    assert redis.closed
+
+
+async def test_rate_limiter_returns_most_restrictive_limit() -> None:
+    limiter = RateLimiter(MemoryBackend(), RateLimit(rate=10, burst=10))
+
+    result = await limiter.check("user:1", 1, LIMIT, 100)
+    assert result is not None and result.remaining == 2
+
+    result = await limiter.check("user:1", 2, None, 100)
+    assert result is not None and result.remaining == 8
+
+    limiter.limit = None
+    assert await limiter.check("user:1", 2, None, 100) is None
@@ -0,0 +1,301 @@
+import hashlib
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from typing import Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from src.api.config import RESPONSE_CACHE_MAX_ENTRY, RESPONSE_CACHE_SIZE
+
+
+# headers identifying the user, responses are never shared between them
+AUTH_CONTEXT_HEADERS = ["authorization", "cookie"]
+
+# set by the client, but replaced by the cache's own when revalidating
+CONDITIONAL_HEADERS = ["if-none-match", "if-modified-since"]
+
+CacheKey = Tuple[int, str, str, bytes]  # service ID, URL, target, auth
+
+
+def _resource(key: CacheKey) -> Tuple[int, str]:
+    return key[0], key[2]
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parses a Cache-Control header into its directives"""
+    directives: Dict[str, Optional[str]] = {}
+    for directive in (value or "").split(","):
+        name, _, arg = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def _seconds(arg: Optional[str]) -> Optional[int]:
+    try:
+        return max(0, int(arg or ""))
+    except ValueError:
+        return None
+
+
+def _timestamp(date: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(date or "").timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(
+    cache_control: Mapping[str, Optional[str]], headers: Mapping[str, str]
+) -> Optional[float]:
+    """Returns the seconds a response stays fresh, if set by the service"""
+    for directive in ["s-maxage", "max-age"]:
+        if directive in cache_control:
+            return _seconds(cache_control[directive]) or 0
+
+    expires = _timestamp(headers.get("expires"))
+    if "expires" in headers:
+        if expires is None:
+            # invalid dates mean the response has already expired
+            return 0
+        date = _timestamp(headers.get("date")) or time.time()
+        return max(0.0, expires - date)
+
+    return None
+
+
+class CachedResponse(NamedTuple):
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    # request headers the response varies on, with their values
+    vary: Tuple[Tuple[str, Optional[str]], ...]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+    lifetime: float
+    no_cache: bool
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+    def age(self, now: float) -> float:
+        return max(0.0, now - self.stored_at)
+
+    def is_fresh(self, now: float) -> bool:
+        return not self.no_cache and self.age(now) < self.lifetime
+
+    def validators(self) -> Dict[str, str]:
+        """Returns the headers used to revalidate the response"""
+        headers = {}
+        if self.etag is not None:
+            headers["if-none-match"] = self.etag
+        if self.last_modified is not None:
+            headers["if-modified-since"] = self.last_modified
+        return headers
+
+    def matches(self, request_headers: Mapping[str, str]) -> bool:
+        """Returns true if the response can be used for the request"""
+        return all(
+            request_headers.get(name) == value for name, value in self.vary
+        )
+
+
+def build_entry(
+    request_headers: Mapping[str, str],
+    status_code: int,
+    response_headers: Mapping[str, str],
+    raw_headers: List[Tuple[bytes, bytes]],
+    body: bytes,
+    now: float,
+) -> Optional[CachedResponse]:
+    """
+    Returns the cache entry for the response, or None if it can't be stored
+    by a shared cache.
+    """
+    request_cc = parse_cache_control(request_headers.get("cache-control"))
+    cache_control = parse_cache_control(response_headers.get("cache-control"))
+    vary = [
+        name.strip().lower()
+        for name in response_headers.get("vary", "").split(",")
+        if name.strip()
+    ]
+
+    if (
+        status_code != HTTPStatus.OK
+        or "no-store" in request_cc
+        or "no-store" in cache_control
+        or "private" in cache_control
+        or "*" in vary
+        or "set-cookie" in response_headers
+    ):
+        return None
+
+    # authenticated responses are only stored if the service allows it
+    if "authorization" in request_headers and not (
+        {"public", "s-maxage", "must-revalidate"} & cache_control.keys()
+    ):
+        return None
+
+    etag = response_headers.get("etag")
+    last_modified = response_headers.get("last-modified")
+    lifetime = freshness_lifetime(cache_control, response_headers)
+    if lifetime is None and etag is None and last_modified is None:
+        return None
+
+    age = _seconds(response_headers.get("age")) or 0
+    return CachedResponse(
+        status_code=status_code,
+        headers=[(k, v) for k, v in raw_headers if k != b"age"],
+        body=body,
+        vary=tuple((name, request_headers.get(name)) for name in vary),
+        etag=etag,
+        last_modified=last_modified,
+        stored_at=now - age,
+        lifetime=lifetime or 0,
+        no_cache="no-cache" in cache_control,
+    )
+
+
+def refreshed_entry(
+    entry: CachedResponse, response_headers: Mapping[str, str], now: float
+) -> CachedResponse:
+    """Updates the entry with the headers of a 304 Not Modified response"""
+    cache_control = parse_cache_control(response_headers.get("cache-control"))
+    lifetime = freshness_lifetime(cache_control, response_headers)
+    return entry._replace(
+        etag=response_headers.get("etag", entry.etag),
+        stored_at=now,
+        lifetime=entry.lifetime if lifetime is None else lifetime,
+        no_cache="no-cache" in cache_control or entry.no_cache,
+    )
+
+
+def can_serve(
+    entry: CachedResponse, request_headers: Mapping[str, str], now: float
+) -> bool:
+    """Returns true if the entry can be served without revalidating it"""
+    request_cc = parse_cache_control(request_headers.get("cache-control"))
+    if "no-cache" in request_cc:
+        return False
+    max_age = _seconds(request_cc.get("max-age"))
+    if max_age is not None and entry.age(now) > max_age:
+        return False
+    return entry.is_fresh(now)
+
+
+class ResponseCacheStats(BaseModel):
+    entries: int
+    size: int
+    hits: int
+    misses: int
+    revalidations: int
+    evictions: int
+
+
+class ResponseCache:
+    """
+    Shared cache of upstream responses to GET requests, bounded by the
+    total size of the stored responses. Least recently used entries are
+    evicted first.
+
+    Responses are never shared between auth contexts, and only one variant
+    of each resource is kept.
+    """
+
+    def __init__(
+        self,
+        max_size: int = RESPONSE_CACHE_SIZE,
+        max_entry_size: int = RESPONSE_CACHE_MAX_ENTRY,
+    ) -> None:
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        # keys of the entries of each resource, across auth contexts
+        self._resources: Dict[Tuple[int, str], Set[CacheKey]] = {}
+
+    @staticmethod
+    def key(
+        service_id: int,
+        url: str,
+        target: str,
+        request_headers: Mapping[str, str],
+    ) -> CacheKey:
+        auth = hashlib.sha256()
+        for name in AUTH_CONTEXT_HEADERS:
+            auth.update(request_headers.get(name, "").encode() + b"\n")
+        return (service_id, url, target, auth.digest())
+
+    def get(
+        self, key: CacheKey, request_headers: Mapping[str, str], now: float
+    ) -> Optional[CachedResponse]:
+        """
+        Returns the entry for the request, which may need to be revalidated
+        if it can't be served as-is.
+        """
+        entry = self._entries.get(key)
+        if entry is None or not entry.matches(request_headers):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if can_serve(entry, request_headers, now):
+            self.hits += 1
+        else:
+            self.revalidations += 1
+        return entry
+
+    def put(self, key: CacheKey, entry: CachedResponse) -> None:
+        self._remove(key)
+        if entry.size > self.max_entry_size:
+            return
+
+        self._entries[key] = entry
+        self._resources.setdefault(_resource(key), set()).add(key)
+        self.size += entry.size
+
+        while self.size > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, service_id: int, target: str) -> None:
+        """Removes the resource's entries, for all auth contexts"""
+        for key in list(self._resources.get((service_id, target), ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._resources.clear()
+        self.size = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        resource = _resource(key)
+        keys = self._resources[resource]
+        keys.discard(key)
+        if not keys:
+            del self._resources[resource]
+
+    def stats(self) -> ResponseCacheStats:
+        return ResponseCacheStats(
+            entries=len(self._entries),
+            size=self.size,
+            hits=self.hits,
+            misses=self.misses,
+            revalidations=self.revalidations,
+            evictions=self.evictions,
+        )
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,108 @@
+import time
+from typing import Dict, Optional
+
+from src.api.response_cache import (
+    CachedResponse,
+    ResponseCache,
+    build_entry,
+    parse_cache_control,
+)
+
+
+def make_entry(
+    response_headers: Dict[str, str],
+    request_headers: Optional[Dict[str, str]] = None,
+    body: bytes = b"body",
+) -> Optional[CachedResponse]:
+    return build_entry(
+        request_headers or {},
+        200,
+        response_headers,
+        [(k.encode(), v.encode()) for k, v in response_headers.items()],
+        body,
+        time.time(),
+    )
+
+
+def test_parse_cache_control() -> None:
+    assert parse_cache_control('Public, max-age=60, no-cache="x"') == {
+        "public": None,
+        "max-age": "60",
+        "no-cache": "x",
+    }
+    assert parse_cache_control(None) == {}
+
+
+def test_only_shareable_responses_are_stored() -> None:
+    assert make_entry({"cache-control": "max-age=60"}) is not None
+    assert make_entry({"etag": '"a"'}) is not None
+
+    assert make_entry({}) is None
+    assert make_entry({"cache-control": "private, max-age=60"}) is None
+    assert make_entry({"cache-control": "no-store"}) is None
+    assert make_entry({"cache-control": "max-age=60", "vary": "*"}) is None
+
+    auth = {"authorization": "Bearer token"}
+    assert make_entry({"cache-control": "max-age=60"}, auth) is None
+    assert make_entry({"cache-control": "public, max-age=60"}, auth)
+
+
+def test_entries_are_fresh_for_their_lifetime() -> None:
+    now = time.time()
+    entry = make_entry({"cache-control": "max-age=60", "age": "30"})
+    assert entry is not None
+    assert entry.is_fresh(now + 29)
+    assert not entry.is_fresh(now + 31)
+
+    entry = make_entry({"cache-control": "no-cache, max-age=60"})
+    assert entry is not None and not entry.is_fresh(now)
+
+
+def test_response_cache_separates_auth_contexts() -> None:
+    cache = ResponseCache()
+    entry = make_entry({"cache-control": "public, max-age=60"})
+    assert entry is not None
+
+    alice = {"authorization": "Bearer alice"}
+    bob = {"authorization": "Bearer bob"}
+    cache.put(cache.key(1, "url", "/a", alice), entry)
+
+    assert cache.get(cache.key(1, "url", "/a", alice), alice, time.time())
+    assert not cache.get(cache.key(1, "url", "/a", bob), bob, time.time())
+
+    # modifying the resource invalidates it for everyone
+    cache.invalidate(1, "/a")
+    assert not cache.get(cache.key(1, "url", "/a", alice), alice, time.time())
+    assert cache.size == 0
+
+
+def test_response_cache_checks_vary() -> None:
+    cache = ResponseCache()
+    gzip = {"accept-encoding": "gzip"}
+    entry = make_entry(
+        {"cache-control": "max-age=60", "vary": "Accept-Encoding"}, gzip
+    )
+    assert entry is not None
+
+    key = cache.key(1, "url", "/a", {})
+    cache.put(key, entry)
+    assert cache.get(key, gzip, time.time()) is not None
+    assert cache.get(key, {"accept-encoding": "br"}, time.time()) is None
+
+
+def test_response_cache_is_bounded_by_size() -> None:
+    entry = make_entry({"cache-control": "max-age=60"}, body=b"x" * 100)
+    assert entry is not None
+    cache = ResponseCache(max_size=entry.size * 3, max_entry_size=entry.size)
+
+    for target in ["/a", "/b", "/c", "/d"]:
+        cache.put(cache.key(1, "url", target, {}), entry)
+
+    stats = cache.stats()
+    assert (stats.entries, stats.evictions) == (3, 1)
+    assert cache.get(cache.key(1, "url", "/a", {}), {}, time.time()) is None
+
+    big = make_entry({"cache-control": "max-age=60"}, body=b"x" * 200)
+    assert big is not None
+    cache.put(cache.key(1, "url", "/big", {}), big)
+    assert cache.stats().entries == 3
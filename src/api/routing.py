@@ -0,0 +1,316 @@
+import re
+from collections import OrderedDict
+from itertools import chain
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from src.api.config import ROUTE_CACHE_SIZE
+
+
+T = TypeVar("T")
+
+_METACHARS = set(r".^$*+?{}[]\|()")
+_QUANTIFIERS = set("*+?{")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def specificity(path: str) -> int:
+    return sum(c not in r".\\[]()*?+" for c in path)
+
+
+def _structure(pattern: str) -> Iterator[Tuple[int, str, int]]:
+    """
+    Yields the index, character and group depth of each unescaped character
+    outside of character classes.
+    """
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+            # a "]" right at the start of the class is literal
+            i += 1 + pattern.startswith("^", i + 1)
+            i += pattern.startswith("]", i)
+            continue
+        elif c == ")":
+            depth -= 1
+            yield i, c, depth
+        else:
+            yield i, c, depth
+            depth += c == "("
+        i += 1
+
+
+def _split_alternatives(pattern: str) -> List[str]:
+    """Splits the pattern on its top-level `|`"""
+    splits = [
+        i for i, c, depth in _structure(pattern) if c == "|" and not depth
+    ]
+    starts = [0, *(i + 1 for i in splits)]
+    ends = [*splits, len(pattern)]
+    return [pattern[start:end] for start, end in zip(starts, ends)]
+
+
+def _group_end(pattern: str) -> Optional[int]:
+    """Returns the index closing the group `pattern` starts with"""
+    return next(
+        (i for i, c, depth in _structure(pattern) if c == ")" and not depth),
+        None,
+    )
+
+
+def literal_prefixes(pattern: str) -> List[str]:
+    """
+    Returns literal texts such that every string matching `pattern` starts
+    with one of them. Returns an empty list if they can't be determined.
+    """
+    alternatives = _split_alternatives(pattern)
+    if len(alternatives) > 1:
+        prefixes = [literal_prefixes(alt) for alt in alternatives]
+        return list(chain(*prefixes)) if all(prefixes) else []
+
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+
+    if pattern.startswith("("):
+        end = _group_end(pattern)
+        if end is None or pattern.startswith(tuple(_QUANTIFIERS), end + 1):
+            return []
+        if pattern.startswith("(?:"):
+            start = 3
+        elif pattern.startswith("(?P<"):
+            start = pattern.index(">") + 1
+        elif pattern.startswith("(?"):
+            # lookarounds, flags, etc.
+            return []
+        else:
+            start = 1
+        return literal_prefixes(pattern[start:end])
+
+    prefix: List[str] = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            escaped = pattern[i + 1] if i + 1 < len(pattern) else ""
+            # only escaped punctuation is literal (\d, \w, etc. aren't)
+            if escaped == "" or escaped.isalnum():
+                break
+            prefix.append(escaped)
+            i += 2
+        elif c in _METACHARS:
+            if c in _QUANTIFIERS and prefix:
+                # the quantifier applies to the previous character
+                prefix.pop()
+            break
+        else:
+            prefix.append(c)
+            i += 1
+
+    return ["".join(prefix)] if prefix else []
+
+
+def is_fusable(pattern: str) -> bool:
+    """Returns true if the pattern can be part of a bigger alternation"""
+    if _BACKREFERENCE.search(pattern):
+        return False
+    try:
+        return not re.compile(f"(?:{pattern})").groupindex
+    except re.error:
+        return False
+
+
+class _TrieNode:
+    __slots__ = ("children", "routes")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = {}
+        self.routes: List[int] = []
+
+
+class RouteCacheStats(BaseModel):
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class RouteCache(Generic[T]):
+    """
+    Segmented LRU cache of path resolutions, including failed ones.
+
+    New paths enter a probationary segment, and only move to the protected
+    segment when they're hit again. This way, a burst of paths seen once
+    (like `/users/{id}`) can only evict other probationary entries, and
+    never the hot set.
+    """
+
+    PROTECTED_RATIO = 0.8
+
+    def __init__(self, maxsize: int) -> None:
+        self.protected_size = int(maxsize * self.PROTECTED_RATIO)
+        self.probation_size = maxsize - self.protected_size
+        self._probation: OrderedDict[str, Optional[T]] = OrderedDict()
+        self._protected: OrderedDict[str, Optional[T]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._probation) + len(self._protected)
+
+    def get(
+        self, path: str, resolve: Callable[[str], Optional[T]]
+    ) -> Optional[T]:
+        """Returns the cached value for `path`, resolving it on a miss"""
+        if path in self._protected:
+            self.hits += 1
+            self._protected.move_to_end(path)
+            return self._protected[path]
+
+        if path in self._probation:
+            self.hits += 1
+            value = self._probation.pop(path)
+            self._promote(path, value)
+            return value
+
+        self.misses += 1
+        value = resolve(path)
+
+        if self.probation_size > 0:
+            self._probation[path] = value
+            self._trim_probation()
+
+        return value
+
+    def _promote(self, path: str, value: Optional[T]) -> None:
+        self._protected[path] = value
+        if len(self._protected) > self.protected_size:
+            # demoted entries get another chance in the probationary segment
+            demoted, demoted_value = self._protected.popitem(last=False)
+            self._probation[demoted] = demoted_value
+            self._trim_probation()
+
+    def _trim_probation(self) -> None:
+        while len(self._probation) > self.probation_size:
+            self._probation.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> RouteCacheStats:
+        return RouteCacheStats(
+            size=len(self),
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+class RoutingTable(Generic[T]):
+    """
+    Maps paths to the first route whose regex fully matches them.
+
+    Routes starting with literal prefixes are stored in a prefix trie, so
+    only the ones sharing a prefix with the path are checked. The rest are
+    fused into a single alternation, resolved in one pass by the regex
+    engine. Priority between routes is kept in both cases.
+
+    Resolutions are cached, so each table starts with an empty cache.
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[Tuple[str, T]],
+        cache_size: int = ROUTE_CACHE_SIZE,
+    ) -> None:
+        self.routes = [(re.compile(path), value) for path, value in routes]
+        self.cache: RouteCache[T] = RouteCache(cache_size)
+        self._trie = _TrieNode()
+
+        fused: List[str] = []
+        self._fused_routes: Dict[int, int] = {}  # regex group -> route
+        # routes that can't be fused nor put in the trie
+        self._unfusable: List[int] = []
+
+        for i, (path, _) in enumerate(routes):
+            prefixes = literal_prefixes(path)
+            if prefixes:
+                for prefix in prefixes:
+                    self._insert(prefix, i)
+            elif is_fusable(path):
+                fused.append(f"(?P<_{i}>{path})")
+            else:
+                self._unfusable.append(i)
+
+        self._fused: Optional[re.Pattern[str]] = None
+        if fused:
+            self._fused = re.compile("|".join(fused))
+            for name, group in self._fused.groupindex.items():
+                self._fused_routes[group] = int(name[1:])
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def _insert(self, prefix: str, route: int) -> None:
+        node = self._trie
+        for c in prefix:
+            node = node.children.setdefault(c, _TrieNode())
+        node.routes.append(route)
+
+    def _candidates(self, path: str) -> List[int]:
+        """Returns the routes whose literal prefix matches the path"""
+        lists = []
+        node = self._trie
+        for c in path:
+            child = node.children.get(c)
+            if child is None:
+                break
+            node = child
+            if node.routes:
+                lists.append(node.routes)
+
+        if len(lists) == 1:
+            return lists[0]
+        return sorted(chain(*lists))
+
+    def match(self, path: str) -> Optional[T]:
+        """Returns the value of the highest priority route matching `path`"""
+        return self.cache.get(path, self._resolve)
+
+    def _resolve(self, path: str) -> Optional[T]:
+        best: Optional[int] = None
+
+        if self._fused is not None:
+            m = self._fused.fullmatch(path)
+            if m is not None and m.lastindex is not None:
+                best = self._fused_routes[m.lastindex]
+
+        candidates = self._candidates(path)
+        if self._unfusable:
+            candidates = sorted(chain(self._unfusable, candidates))
+
+        for i in candidates:
+            if best is not None and i > best:
+                break
+            if self.routes[i][0].fullmatch(path):
+                best = i
+                break
+
+        return None if best is None else self.routes[best][1]
@@ -0,0 +1,117 @@
+import re
+from typing import List, Optional
+
+from src.api.routing import RoutingTable, literal_prefixes, specificity
+
+
+PATHS = [
+    "^/users.*",
+    "^/users/me",
+    r"^/users/\d+/followers",
+    "^/trainings.*",
+    "/targets(/.*)?",
+    "(/metrics|/reports).*",
+    "(?i)/CASE",
+    "[|(]/odd",
+    "^(?P<name>/named).*",
+    r"^/(a+)\1",
+    ".*",
+]
+
+REQUESTS = [
+    "/users",
+    "/users/me",
+    "/users/12/followers",
+    "/trainings/3",
+    "/targets",
+    "/targets/1",
+    "/metrics/daily",
+    "/reports",
+    "/case",
+    "(/odd",
+    "/named/thing",
+    "/aaaa",
+    "/unknown",
+]
+
+
+def linear_match(routes: List[str], path: str) -> Optional[str]:
+    return next((r for r in routes if re.fullmatch(r, path)), None)
+
+
+def test_literal_prefixes() -> None:
+    assert literal_prefixes("^/users.*") == ["/users"]
+    assert literal_prefixes(r"^\/users\/me") == ["/users/me"]
+    assert literal_prefixes(r"^/users/\d+") == ["/users/"]
+    assert literal_prefixes("/users?") == ["/user"]
+    assert literal_prefixes("(/metrics|/reports).*") == [
+        "/metrics",
+        "/reports",
+    ]
+    assert literal_prefixes("^/a|^(?:/b|/c)") == ["/a", "/b", "/c"]
+    assert literal_prefixes("[|(]/a|/b") == []
+    assert literal_prefixes("(/a|/b)?/c") == []
+    assert literal_prefixes("(?i)/a") == []
+    assert literal_prefixes("/a|.*") == []
+
+
+def test_routing_table_keeps_priority() -> None:
+    routes = sorted(PATHS, key=specificity)
+    table = RoutingTable([(r, r) for r in routes])
+
+    assert len(table) == len(routes)
+
+    for path in REQUESTS:
+        assert table.match(path) == linear_match(routes, path), path
+
+
+def test_routing_table_without_catch_all() -> None:
+    routes = sorted(PATHS[:-1], key=specificity)
+    table = RoutingTable([(r, r) for r in routes])
+
+    for path in REQUESTS:
+        assert table.match(path) == linear_match(routes, path), path
+
+    assert table.match("/unknown") is None
+
+
+def test_empty_routing_table() -> None:
+    assert RoutingTable[str]([]).match("/users") is None
+
+
+def test_route_cache_counts_hits_and_misses() -> None:
+    table = RoutingTable([("^/users.*", "users")], cache_size=10)
+
+    assert table.match("/users/1") == "users"
+    assert table.match("/users/1") == "users"
+    assert table.match("/unknown") is None
+    assert table.match("/unknown") is None
+
+    stats = table.cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (2, 2, 2)
+
+
+def test_route_cache_keeps_hot_paths() -> None:
+    table = RoutingTable([("^/users.*", "users")], cache_size=10)
+    hot = [f"/users/me/{i}" for i in range(5)]
+    for path in hot:
+        table.match(path)
+        table.match(path)
+
+    # a burst of paths only seen once
+    for i in range(1000):
+        table.match(f"/users/{i}")
+
+    stats = table.cache.stats()
+    assert stats.size <= 10
+    assert stats.evictions > 0
+    hits = stats.hits
+    for path in hot:
+        table.match(path)
+    assert table.cache.stats().hits == hits + len(hot)
+
+
+def test_disabled_route_cache() -> None:
+    table = RoutingTable([("^/users.*", "users")], cache_size=0)
+    assert table.match("/users") == table.match("/users") == "users"
+    assert len(table.cache) == 0
@@ -1,30 +1,179 @@
 import asyncio
 import copy
-from typing import Any, Dict
+import hashlib
+import json
+import time
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
 from fastapi import FastAPI
-from httpx import AsyncClient, RequestError
+from httpx import HTTPStatusError, RequestError
+from pydantic import BaseModel
 
+from src.api.config import (
+    OPENAPI_REFRESH_INTERVAL,
+    SCHEMA_BACKOFF_MAX,
+    SCHEMA_FETCH_CONCURRENCY,
+    SCHEMA_FETCH_TIMEOUT,
+)
+from src.api.encoding import EncodedBody, encode_body
 from src.db.model.service import DBService
 from src.db.session import SessionLocal
 from src.db import services as services_db
-from src.logging import warn
-from src.api.proxy import APIKEY_HEADER
+from src.logging import debug, warn
+from src.api.clients import APIKEY_HEADER, ServiceClient, client_pool
 
 
-async def retrieve_schema(service: DBService) -> Dict[str, Any]:
-    headers = {APIKEY_HEADER: service.apikey}
-    try:
-        async with AsyncClient(
-            base_url=service.url or ""
-        ) as client:  # never None
-            response = await client.get("/openapi.json", headers=headers)
+# the app's schema, encoded once each time it changes
+openapi_document: Optional[EncodedBody] = None
+
+
+class ChildSchema(NamedTuple):
+    url: str
+    etag: Optional[str]
+    # hash of the schema as sent by the service
+    digest: bytes
+    schema: Dict[str, Any]
+
+
+class SchemaCollectorStats(BaseModel):
+    schemas: int
+    downloads: int
+    unchanged: int
+    failures: int
+
+
+class SchemaCollector:
+    """
+    Keeps the latest OpenAPI schema of each service, downloading it again
+    only if it changed. The service's ETag is sent with If-None-Match, and
+    the response's hash is compared when it doesn't support them.
+
+    Services failing to send their schema keep their last known one, and
+    are retried with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        timeout: float = SCHEMA_FETCH_TIMEOUT,
+        concurrency: int = SCHEMA_FETCH_CONCURRENCY,
+        backoff: float = OPENAPI_REFRESH_INTERVAL,
+        max_backoff: float = SCHEMA_BACKOFF_MAX,
+        get_client: Callable[[int, str], ServiceClient] = client_pool.get,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.get_client = get_client
+        self.clock = clock
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._schemas: Dict[int, ChildSchema] = {}
+        # consecutive failures of each service, and when to retry it
+        self._failures: Dict[int, int] = {}
+        self._retry_at: Dict[int, float] = {}
+        # IDs of the services, in the order their schemas are merged
+        self._order: List[int] = []
+        self.downloads = 0
+        self.unchanged = 0
+        self.failures = 0
+
+    async def refresh(self, services: Sequence[DBService]) -> bool:
+        """Updates the services' schemas, returns true if any changed"""
+        order = [svc.id for svc in services]
+        changed = order != self._order
+        for id in set(self._schemas) - set(order):
+            del self._schemas[id]
+        for id in set(self._failures) - set(order):
+            del self._failures[id]
+            del self._retry_at[id]
+        self._order = order
+
+        results = await asyncio.gather(*[self._fetch(svc) for svc in services])
+        return changed or any(results)
+
+    def merge(self, base: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the base schema, extended with the services' schemas"""
+        schema = copy.deepcopy(base)
+        for id in self._order:
+            child = self._schemas.get(id)
+            if child is not None:
+                nested_update(schema, child.schema)
+        return schema
+
+    async def _fetch(self, service: DBService) -> bool:
+        """Downloads the service's schema, returns true if it changed"""
+        if self._retry_at.get(service.id, 0) > self.clock():
+            return False
+
+        cached = self._schemas.get(service.id)
+        if cached is not None and cached.url != service.url:
+            cached = None
+
+        headers = {APIKEY_HEADER: service.apikey}
+        if cached is not None and cached.etag is not None:
+            headers["if-none-match"] = cached.etag
 
-        response = response.json()
-        return response if isinstance(response, Dict) else {}
-    except RequestError as e:
-        warn(f"Failed to retrieve schema: {e}")
+        try:
+            async with self._semaphore:
+                svc_client = self.get_client(service.id, service.url)
+                request = svc_client.client.build_request(
+                    "GET",
+                    "/openapi.json",
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+                response = await svc_client.send(request)
 
-    return {}
+            if (
+                cached is not None
+                and response.status_code == HTTPStatus.NOT_MODIFIED
+            ):
+                self._succeeded(service.id)
+                self.unchanged += 1
+                return False
+
+            response.raise_for_status()
+            digest = hashlib.sha256(response.content).digest()
+            etag = response.headers.get("etag")
+            if cached is not None and cached.digest == digest:
+                self._schemas[service.id] = cached._replace(etag=etag)
+                self._succeeded(service.id)
+                self.unchanged += 1
+                return False
+
+            schema = response.json()
+        except (RequestError, HTTPStatusError, ValueError) as e:
+            self._failed(service.id)
+            warn(f"Failed to retrieve schema: {e}")
+            return False
+
+        self._succeeded(service.id)
+        self.downloads += 1
+        self._schemas[service.id] = ChildSchema(
+            url=service.url,
+            etag=etag,
+            digest=digest,
+            schema=schema if isinstance(schema, Dict) else {},
+        )
+        return True
+
+    def _succeeded(self, id: int) -> None:
+        self._failures.pop(id, None)
+        self._retry_at.pop(id, None)
+
+    def _failed(self, id: int) -> None:
+        self.failures += 1
+        failures = self._failures[id] = self._failures.get(id, 0) + 1
+        delay = min(self.max_backoff, self.backoff * 2**failures)
+        self._retry_at[id] = self.clock() + delay
+
+    def stats(self) -> SchemaCollectorStats:
+        return SchemaCollectorStats(
+            schemas=len(self._schemas),
+            downloads=self.downloads,
+            unchanged=self.unchanged,
+            failures=self.failures,
+        )
 
 
 def nested_update(
@@ -32,38 +181,76 @@ def nested_update(
 ) -> Dict[str, Any]:
     for k, v in child_schema.items():
         if k not in app_schema:
-            app_schema[k] = v
+            # copied, so the child's schema isn't changed by later merges
+            app_schema[k] = copy.deepcopy(v)
         elif isinstance(v, Dict):
             nested_update(app_schema[k], v)
 
     return app_schema
 
 
-async def update_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+async def get_schema_services() -> Sequence[DBService]:
     async with SessionLocal() as session:
-        services = await services_db.get_all_services_inner(
-            session, blocked=False
+        return await services_db.get_all_services_inner(
+            session, limit=None, blocked=False
         )
 
-    children_schemas = await asyncio.gather(
-        *[retrieve_schema(svc) for svc in services]
+
+def encode_schema(schema: Dict[str, Any]) -> EncodedBody:
+    # NOTE: serialized like FastAPI's JSONResponse
+    body = json.dumps(
+        schema, ensure_ascii=False, allow_nan=False, separators=(",", ":")
     )
+    return encode_body(body.encode("utf-8"))
+
+
+def set_openapi_schema(app: FastAPI, schema: Dict[str, Any]) -> None:
+    global openapi_document
+    app.openapi_schema = schema
+    openapi_document = encode_schema(schema)
+
+
+def get_openapi_document(app: FastAPI) -> EncodedBody:
+    """Returns the app's encoded schema, encoding it if needed"""
+    if openapi_document is None:
+        set_openapi_schema(app, app.openapi())
+    assert openapi_document is not None  # cannot fail
+    return openapi_document
+
+
+def apply_openapi_snapshot(app: FastAPI, payload: bytes) -> None:
+    """Replaces the app's schema with one published by another worker"""
+    global openapi_document
+    app.openapi_schema = json.loads(payload)
+    openapi_document = encode_body(payload)
 
-    for child_schema in children_schemas:
-        schema = nested_update(schema, child_schema)
 
-    return schema
+async def regenerate_openapi(
+    app: FastAPI, publish: Optional[Callable[[bytes], None]] = None
+) -> None:
+    """
+    Rebuilds the app's schema each time a service's schema changes,
+    publishing it to the other workers if given a way to
+    """
 
+    def update_schema(schema: Dict[str, Any]) -> None:
+        set_openapi_schema(app, schema)
+        if publish is not None:
+            assert openapi_document is not None  # cannot fail
+            publish(openapi_document.variants["identity"])
 
-async def regenerate_openapi(app: FastAPI) -> None:
     try:
         # save app's initial schema to use as base
         initial_schema = copy.deepcopy(app.openapi())
+        update_schema(app.openapi())
+        collector = SchemaCollector()
         while True:
-            cloned = copy.deepcopy(initial_schema)
-            schema = await update_schema(cloned)
-            app.openapi_schema = schema
-            await asyncio.sleep(8)
+            # NOTE: shielded so cancelling doesn't leave the DB locked
+            services = await asyncio.shield(get_schema_services())
+            if await collector.refresh(services):
+                update_schema(collector.merge(initial_schema))
+                debug(f"Rebuilt OpenAPI schema: {collector.stats()}")
+            await asyncio.sleep(OPENAPI_REFRESH_INTERVAL)
     except asyncio.CancelledError:  # task was cancelled
         return
 
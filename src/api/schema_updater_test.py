@@ -0,0 +1,127 @@
+from typing import Any, Dict, List
+
+from httpx import AsyncClient, MockTransport, Request, Response, Timeout
+
+from src.api.clients import ServiceClient, client_pool
+from src.api.schema_updater import SchemaCollector
+from src.db.model.service import DBService
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DummyService:
+    """Serves a schema with an ETag, recording the requests received"""
+
+    def __init__(self, schema: Dict[str, Any], etag: bool = True) -> None:
+        self.schema = schema
+        self.etag = etag
+        self.down = False
+        self.requests: List[Request] = []
+
+    def handle(self, request: Request) -> Response:
+        self.requests.append(request)
+        if self.down:
+            return Response(500)
+
+        etag = f'"{hash(str(self.schema))}"'
+        if self.etag and request.headers.get("if-none-match") == etag:
+            return Response(304)
+        headers = {"etag": etag} if self.etag else {}
+        return Response(200, json=self.schema, headers=headers)
+
+    def client(self, id: int, url: str) -> ServiceClient:
+        svc_client = ServiceClient(url, client_pool.limits, Timeout(1))
+        svc_client.client = AsyncClient(
+            base_url=url, transport=MockTransport(self.handle)
+        )
+        return svc_client
+
+
+def make_service(id: int) -> DBService:
+    return DBService(id=id, url=f"http://svc{id}", apikey="key")
+
+
+async def test_collector_merges_schemas() -> None:
+    service = DummyService({"paths": {"/b": {}}, "info": {"title": "b"}})
+    collector = SchemaCollector(get_client=service.client)
+
+    assert await collector.refresh([make_service(1)])
+
+    base = {"paths": {"/a": {}}, "info": {"title": "a"}}
+    schema = collector.merge(base)
+    assert schema == {"paths": {"/a": {}, "/b": {}}, "info": {"title": "a"}}
+    # the base schema isn't modified
+    assert base == {"paths": {"/a": {}}, "info": {"title": "a"}}
+
+
+async def test_collector_revalidates_with_etag() -> None:
+    service = DummyService({"paths": {"/b": {}}})
+    collector = SchemaCollector(get_client=service.client)
+    services = [make_service(1)]
+
+    assert await collector.refresh(services)
+    assert not await collector.refresh(services)
+    assert "if-none-match" in service.requests[-1].headers
+
+    service.schema = {"paths": {"/c": {}}}
+    assert await collector.refresh(services)
+    assert collector.merge({}) == {"paths": {"/c": {}}}
+    assert collector.stats().downloads == 2
+    assert collector.stats().unchanged == 1
+
+
+async def test_collector_compares_hashes_without_etag() -> None:
+    service = DummyService({"paths": {"/b": {}}}, etag=False)
+    collector = SchemaCollector(get_client=service.client)
+    services = [make_service(1)]
+
+    assert await collector.refresh(services)
+    assert not await collector.refresh(services)
+    assert collector.stats().unchanged == 1
+
+
+async def test_collector_drops_removed_services() -> None:
+    service = DummyService({"paths": {"/b": {}}})
+    collector = SchemaCollector(get_client=service.client)
+
+    assert await collector.refresh([make_service(1)])
+    assert await collector.refresh([])
+    assert collector.merge({}) == {}
+
+
+async def test_collector_backs_off_failing_services() -> None:
+    clock = Clock()
+    service = DummyService({"paths": {"/b": {}}})
+    collector = SchemaCollector(
+        backoff=1, max_backoff=3, get_client=service.client, clock=clock
+    )
+    services = [make_service(1)]
+    assert await collector.refresh(services)
+
+    service.down = True
+    service.schema = {"paths": {"/c": {}}}
+    assert not await collector.refresh(services)
+    assert len(service.requests) == 2
+
+    # retried after 2 seconds, then after 3 (the maximum)
+    clock.now = 1
+    assert not await collector.refresh(services)
+    assert len(service.requests) == 2
+    clock.now = 2
+    assert not await collector.refresh(services)
+    assert len(service.requests) == 3
+
+    # the last known schema is kept meanwhile
+    assert collector.merge({}) == {"paths": {"/b": {}}}
+
+    service.down = False
+    clock.now = 5
+    assert await collector.refresh(services)
+    assert collector.merge({}) == {"paths": {"/c": {}}}
+    assert collector.stats().failures == 2
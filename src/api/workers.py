@@ -0,0 +1,173 @@
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+from typing import Any, Optional
+
+from fastapi import FastAPI
+
+from src.api import proxy, schema_updater
+from src.api.config import SNAPSHOT_DIR, SNAPSHOT_POLL_INTERVAL
+from src.db.tokens import clean_up_tokens_periodically
+from src.logging import info
+
+
+# version and length of the payload that follows
+SNAPSHOT_HEADER = struct.Struct("<QQ")
+
+ROUTING_SNAPSHOT = "routing.snapshot"
+OPENAPI_SNAPSHOT = "openapi.snapshot"
+
+
+def snapshot_version(path: str) -> int:
+    """Returns the version of the published snapshot, or 0 if there's none"""
+    try:
+        with open(path, "rb") as file:
+            header = file.read(SNAPSHOT_HEADER.size)
+    except FileNotFoundError:
+        return 0
+    return int(SNAPSHOT_HEADER.unpack(header)[0])
+
+
+class SnapshotPublisher:
+    """
+    Publishes versions of a snapshot to a file. Each one is written to a
+    temporary file and then renamed over the old one, so readers always
+    map a complete version.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # NOTE: continues from the versions of the previous leader, if any
+        self.version = snapshot_version(path)
+
+    def publish(self, payload: bytes) -> None:
+        self.version += 1
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(SNAPSHOT_HEADER.pack(self.version, len(payload)))
+            file.write(payload)
+        os.replace(temp_path, self.path)
+
+
+class SnapshotReader:
+    """
+    Reads the versions of a snapshot published to a file. Only the header
+    is read to check for new versions, the payload is mapped when needed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.version: Optional[int] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read(self) -> Optional[bytes]:
+        """Returns the snapshot's payload if a new version was published"""
+        try:
+            with open(self.path, "rb") as file:
+                header = os.pread(file.fileno(), SNAPSHOT_HEADER.size, 0)
+                version, length = SNAPSHOT_HEADER.unpack(header)
+                if version == self.version:
+                    return None
+                # NOTE: the file is never written in place, only replaced
+                with mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                ) as view:
+                    start = SNAPSHOT_HEADER.size
+                    end = start + length
+                    payload = view[start:end]
+        except FileNotFoundError:
+            return None
+        self.version = version
+        return payload
+
+
+class WorkerCoordinator:
+    """
+    Coordinates the workers of a host. The one holding the leader lock
+    builds the routing table and OpenAPI schema from the DB and publishes
+    them as snapshots; the others only install new snapshots. When the
+    leader exits, the lock is released and another worker takes over.
+    """
+
+    def __init__(self, directory: str = SNAPSHOT_DIR) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.is_leader = False
+        lock_path = os.path.join(directory, "leader.lock")
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.routing = SnapshotReader(self._path(ROUTING_SNAPSHOT))
+        self.openapi = SnapshotReader(self._path(OPENAPI_SNAPSHOT))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def try_lead(self) -> bool:
+        """Takes the leader lock if no other worker holds it"""
+        if not self.is_leader:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.is_leader = True
+        return True
+
+    def remove_snapshots(self) -> None:
+        """Removes snapshots left over by a previous run"""
+        for name in [ROUTING_SNAPSHOT, OPENAPI_SNAPSHOT]:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    async def wait_for_leader(self) -> bool:
+        """
+        Waits for the leader's first snapshots. Returns true if the leader
+        exited first, leaving this worker as the new leader.
+        """
+        while not (self.routing.exists() and self.openapi.exists()):
+            if self.try_lead():
+                return True
+            await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+        return False
+
+    async def lead(self, app: FastAPI) -> None:
+        info(f"Worker {os.getpid()} is leading the workers")
+        routing = SnapshotPublisher(self._path(ROUTING_SNAPSHOT))
+        openapi = SnapshotPublisher(self._path(OPENAPI_SNAPSHOT))
+        await asyncio.gather(
+            proxy.regenerate_routing_table(routing.publish),
+            schema_updater.regenerate_openapi(app, openapi.publish),
+            clean_up_tokens_periodically(),
+        )
+
+    async def follow(self, app: FastAPI) -> None:
+        """Installs the snapshots published since the last call"""
+        payload = self.routing.read()
+        if payload is not None:
+            await proxy.apply_routing_snapshot(payload)
+        payload = self.openapi.read()
+        if payload is not None:
+            schema_updater.apply_openapi_snapshot(app, payload)
+
+    async def coordinate(self, app: FastAPI) -> None:
+        try:
+            while not self.try_lead():
+                await self.follow(app)
+                await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+            await self.lead(app)
+        except asyncio.CancelledError:  # task was cancelled
+            return
+
+    def close(self) -> None:
+        # NOTE: releases the leader lock, if held
+        os.close(self._lock_fd)
+
+
+def launch_worker_coordinator(
+    app: FastAPI, coordinator: WorkerCoordinator
+) -> asyncio.Task[Any]:
+    return asyncio.create_task(coordinator.coordinate(app))
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+from src.api.proxy import (
+    RoutingSnapshot,
+    ServiceInfo,
+    decode_routing_snapshot,
+    encode_routing_snapshot,
+)
+from src.api.rate_limit import RateLimit
+from src.api.workers import (
+    SnapshotPublisher,
+    SnapshotReader,
+    WorkerCoordinator,
+)
+
+
+def test_reader_picks_up_new_versions(tmp_path: Path) -> None:
+    path = str(tmp_path / "test.snapshot")
+    reader = SnapshotReader(path)
+    assert reader.read() is None
+
+    publisher = SnapshotPublisher(path)
+    publisher.publish(b"first")
+    assert reader.read() == b"first"
+    # unchanged since the last read
+    assert reader.read() is None
+
+    publisher.publish(b"second")
+    assert reader.read() == b"second"
+    assert reader.version == 2
+
+    # a new leader continues from the published version
+    SnapshotPublisher(path).publish(b"third")
+    assert reader.read() == b"third"
+    assert reader.version == 3
+
+
+async def test_only_one_worker_leads(tmp_path: Path) -> None:
+    leader = WorkerCoordinator(str(tmp_path))
+    follower = WorkerCoordinator(str(tmp_path))
+    try:
+        assert leader.try_lead()
+        assert not follower.try_lead()
+
+        # the follower takes over once the leader exits
+        leader.close()
+        assert await follower.wait_for_leader()
+    finally:
+        follower.close()
+
+
+def test_routing_snapshot_round_trip() -> None:
+    svc_info = ServiceInfo(
+        id=3,
+        url="http://svc",
+        endpoints=("http://svc", "http://svc-2"),
+        apikey="key",
+        stream_threshold=None,
+        cache_responses=True,
+        coalesce_requests=False,
+        hedge_percentile=95.0,
+        connect_retries=1,
+        max_in_flight=10,
+        max_queued=100,
+        queue_timeout=1.0,
+        rate_limit=RateLimit(rate=5.0, burst=10),
+    )
+    snapshot = RoutingSnapshot(
+        routes=[("^/svc.*", svc_info)],
+        urls={3: ["http://svc", "http://svc-2"], 4: ["http://blocked"]},
+    )
+
+    decoded = decode_routing_snapshot(encode_routing_snapshot(snapshot))
+    assert decoded == snapshot
+    assert decoded.routes[0][1].rate_limit == RateLimit(rate=5.0, burst=10)
@@ -1,20 +1,28 @@
+import hashlib
 import os
 import secrets
+import time
 from http import HTTPStatus
 from typing import Annotated, Any, Optional
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from jose import jwt
 from jose.exceptions import JWTError, ExpiredSignatureError, JWTClaimsError
 
+from src.api.metrics import auth_duration
 import src.db.tokens as tokens_db
-from src.api.aliases import SessionDep
 
 _AUTH_SECRET = os.getenv("AUTH_SECRET")
 AUTH_SECRET = _AUTH_SECRET if _AUTH_SECRET is not None else ""
 
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE") or 4096)
+"""Maximum number of verified tokens kept in memory. 0 disables the cache"""
+
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL") or 300)
+"""Maximum seconds a verified token is kept in memory"""
+
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="https://svc-users-fedecolangelo.cloud.okteto.net/tokens",
 )
@@ -31,7 +39,82 @@ class User(BaseModel):
     admin: bool
 
 
+class TokenCacheStats(BaseModel):
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class TokenCache:
+    """
+    Cache of verified token claims, keyed by the token's hash.
+    Entries never outlive the token's expiration date.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # NOTE: exp is a unix timestamp, so entries use wall-clock time
+        self._cache: TLRUCache[bytes, dict[str, Any]] = TLRUCache(
+            maxsize, ttu=self._expiration, timer=time.time
+        )
+
+    def _expiration(
+        self, key: bytes, claims: dict[str, Any], now: float
+    ) -> float:
+        exp = claims.get("exp")
+        expiration = now + self.ttl
+        return min(expiration, exp) if isinstance(exp, int) else expiration
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict[str, Any]]:
+        claims = self._cache.get(self._key(token))
+        if claims is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # callers may modify the claims
+        return dict(claims)
+
+    def add(self, token: str, claims: dict[str, Any]) -> None:
+        if self._cache.maxsize > 0:
+            self._cache[self._key(token)] = dict(claims)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> TokenCacheStats:
+        lookups = self.hits + self.misses
+        return TokenCacheStats(
+            size=len(self._cache),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+        )
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+token_duration = auth_duration.labels("token")
+revocation_duration = auth_duration.labels("revocation")
+
+
 def parse_token(token: str) -> dict[str, Any]:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    user_info = verify_token(token)
+    token_cache.add(token, user_info)
+    return user_info
+
+
+def verify_token(token: str) -> dict[str, Any]:
     try:
         user_info = jwt.decode(
             token,
@@ -46,13 +129,11 @@ def parse_token(token: str) -> dict[str, Any]:
     return user_info
 
 
-async def check_if_token_was_invalidated(
-    session: AsyncSession, parsed_token: dict[str, Any]
-) -> None:
+async def check_if_token_was_invalidated(parsed_token: dict[str, Any]) -> None:
     sub = parsed_token["sub"]
     iat = parsed_token["iat"]
 
-    if await tokens_db.token_was_invalidated(session, sub, iat):
+    if await tokens_db.token_was_invalidated(sub, iat):
         raise HTTPException(
             HTTPStatus.UNAUTHORIZED, "Token is invalid or has expired"
         )
@@ -60,15 +141,18 @@ async def check_if_token_was_invalidated(
 
 async def optional_token(
     token: Annotated[Optional[str], Depends(optional_oauth2_scheme)],
-    session: SessionDep,
 ) -> Optional[User]:
     """Validates token and extracts user information"""
     if token is None:
         return None
 
+    start = time.perf_counter()
     info = parse_token(token)
+    parsed = time.perf_counter()
+    token_duration.observe(parsed - start)
 
-    await check_if_token_was_invalidated(session, info)
+    await check_if_token_was_invalidated(info)
+    revocation_duration.observe(time.perf_counter() - parsed)
 
     return User(**info)
 
@@ -81,11 +165,11 @@ async def get_raw_token(
 
 
 async def get_user(
-    token: Annotated[str, Depends(oauth2_scheme)], session: SessionDep
+    token: Annotated[str, Depends(oauth2_scheme)],
 ) -> User:
     """Validates token and extracts user information"""
     info = parse_token(token)
-    await check_if_token_was_invalidated(session, info)
+    await check_if_token_was_invalidated(info)
     return User(**info)
 
 
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from src.auth import AUTH_SECRET, TokenCache, parse_token, token_cache
+
+
+def make_token(exp: int) -> str:
+    claims = {"email": "a@b.c", "sub": 1, "admin": False, "exp": exp}
+    return jwt.encode(claims, AUTH_SECRET, algorithm="HS256")
+
+
+def test_parse_token_caches_claims() -> None:
+    token_cache.clear()
+    token = make_token(int(time.time()) + 60)
+    hits = token_cache.hits
+
+    claims = parse_token(token)
+    claims["sub"] = 2  # callers can't modify the cached claims
+    assert parse_token(token)["sub"] == 1
+    assert token_cache.hits == hits + 1
+
+
+def test_parse_token_rejects_invalid_tokens() -> None:
+    token = make_token(int(time.time()) + 60)
+    for invalid in [token[:-2], make_token(int(time.time()) - 1)]:
+        with pytest.raises(HTTPException):
+            parse_token(invalid)
+        assert token_cache.get(invalid) is None
+
+
+def test_token_cache_entries_expire_with_the_token() -> None:
+    cache = TokenCache(maxsize=10, ttl=60)
+    cache.add("expiring", {"exp": int(time.time()) - 1})
+    cache.add("long-lived", {"exp": int(time.time()) + 120})
+
+    assert cache.get("expiring") is None
+    assert cache.get("long-lived") is not None
+    assert cache.stats().hit_rate == 0.5
+
+
+def test_disabled_token_cache() -> None:
+    cache = TokenCache(maxsize=0, ttl=60)
+    cache.add("token", {"exp": int(time.time()) + 120})
+    assert cache.get("token") is None
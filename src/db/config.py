@@ -23,3 +23,19 @@ SQLALCHEMY_DATABASE_URL = (
 )
 
 INITIAL_SERVICES = os.environ.get("INITIAL_SERVICES") or ""
+
+REVOCATION_SYNC_INTERVAL = float(
+    os.environ.get("REVOCATION_SYNC_INTERVAL") or 1
+)
+"""Seconds between syncs of the token revocation index with the DB"""
+
+REVOCATION_MAX_STALENESS = float(
+    os.environ.get("REVOCATION_MAX_STALENESS") or 10
+)
+"""Seconds without syncing after which the revocation index isn't used"""
+
+TOKEN_CLEANUP_INTERVAL = float(os.environ.get("TOKEN_CLEANUP_INTERVAL") or 300)
+"""Seconds between deletions of expired invalidated tokens"""
+
+TOKEN_CLEANUP_BATCH = int(os.environ.get("TOKEN_CLEANUP_BATCH") or 1000)
+"""Maximum number of expired tokens deleted per transaction"""
@@ -1,14 +1,29 @@
-from typing import Optional
+from typing import Any, List, Optional
 from sqlalchemy import (
     Boolean,
+    Float,
+    ForeignKey,
     Integer,
     String,
+    false,
 )
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.db.model.base import Base
 
 
+class DBServiceEndpoint(Base):
+    """Additional URL of a service, requests are balanced between them"""
+
+    __tablename__ = "service_endpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    service_id: Mapped[int] = mapped_column(
+        ForeignKey("services.id", ondelete="CASCADE"), index=True
+    )
+    url: Mapped[str] = mapped_column(String(255))
+
+
 class DBService(Base):
     __tablename__ = "services"
 
@@ -18,6 +33,53 @@ class DBService(Base):
     path: Mapped[str] = mapped_column(String(255))
     blocked: Mapped[bool] = mapped_column(Boolean, default=False)
     apikey: Mapped[str] = mapped_column(String(43))
+    stream_threshold: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True, default=None
+    )
+    cache_responses: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false()
+    )
+    coalesce_requests: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false()
+    )
+    hedge_percentile: Mapped[Optional[float]] = mapped_column(
+        Float, nullable=True, default=None
+    )
+    connect_retries: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0"
+    )
+    max_in_flight: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True, default=None
+    )
+    max_queued: Mapped[int] = mapped_column(
+        Integer, default=100, server_default="100"
+    )
+    queue_timeout: Mapped[float] = mapped_column(
+        Float, default=1.0, server_default="1.0"
+    )
+    rate_limit: Mapped[Optional[float]] = mapped_column(
+        Float, nullable=True, default=None
+    )
+    rate_limit_burst: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True, default=None
+    )
+    # NOTE: eagerly loaded, as lazy loading isn't supported by asyncio
+    endpoint_rows: Mapped[List[DBServiceEndpoint]] = relationship(
+        lazy="selectin", cascade="all, delete-orphan"
+    )
+
+    @property
+    def endpoints(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoint_rows]
+
+    @endpoints.setter
+    def endpoints(self, urls: Optional[List[str]]) -> None:
+        self.endpoint_rows = [DBServiceEndpoint(url=url) for url in urls or []]
+
+    @property
+    def urls(self) -> List[str]:
+        """Returns all the service's URLs, starting with the main one"""
+        return [self.url, *self.endpoints]
 
     def update(
         self,
@@ -25,9 +87,13 @@ class DBService(Base):
         url: Optional[str] = None,
         path: Optional[str] = None,
         blocked: Optional[bool] = None,
+        **settings: Any,
     ) -> None:
         self.name = name or self.name
         self.url = url or self.url
         self.path = path or self.path
         if blocked is not None:
             self.blocked = blocked
+        # NOTE: settings can be set to None, so only given ones are updated
+        for setting, value in settings.items():
+            setattr(self, setting, value)
@@ -1,4 +1,5 @@
 from sqlalchemy import (
+    Index,
     Integer,
 )
 from sqlalchemy.orm import Mapped, mapped_column
@@ -8,8 +9,12 @@ from src.db.model.base import Base
 
 class DBToken(Base):
     __tablename__ = "tokens"
+    __table_args__ = (
+        # invalidated tokens are looked up by both fields
+        Index("ix_tokens_sub_iat", "sub", "iat"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    sub: Mapped[int] = mapped_column(Integer, index=True)
+    sub: Mapped[int] = mapped_column(Integer)
     iat: Mapped[int] = mapped_column(Integer)
-    exp: Mapped[int] = mapped_column(Integer)
+    exp: Mapped[int] = mapped_column(Integer, index=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.db.model.base import Base
+
+
+class DBServicesVersion(Base):
+    """Single-row counter, incremented on every change to the services"""
+
+    __tablename__ = "services_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
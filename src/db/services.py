@@ -1,8 +1,9 @@
+import asyncio
 import re
 from http import HTTPStatus
-from typing import List, Optional, Sequence
+from typing import Any, List, Optional, Sequence, cast
 from fastapi import HTTPException
-from sqlalchemy import func, select
+from sqlalchemy import CursorResult, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.api.model.service import (
@@ -14,12 +15,43 @@ from src.api.model.service import (
 )
 from src.auth import generate_apikey
 from src.db.model.service import DBService
+from src.db.model.version import DBServicesVersion
 from src.db.session import SessionLocal
 from src.db.status_updater import update_statuses
 from src.db.utils import get_initial_services_gen
 from src.logging import error, warn, info
 
 
+SERVICES_VERSION_ID = 1
+
+services_changed = asyncio.Event()
+"""Set whenever this process changes the services"""
+
+
+async def get_services_version(session: AsyncSession) -> int:
+    """Returns a counter incremented on every change to the services"""
+    version = await session.scalar(
+        select(DBServicesVersion.version).filter_by(id=SERVICES_VERSION_ID)
+    )
+    return version or 0
+
+
+async def commit_changes(session: AsyncSession) -> None:
+    """Commits changes to the services, notifying other processes of them"""
+    result = await session.execute(
+        update(DBServicesVersion)
+        .filter_by(id=SERVICES_VERSION_ID)
+        .values(version=DBServicesVersion.version + 1)
+    )
+    # NOTE: UPDATE statements always return a CursorResult
+    if cast(CursorResult[Any], result).rowcount == 0:
+        # NOTE: the row is created by a migration, so this shouldn't happen
+        warn("Services version row was missing, creating it")
+        session.add(DBServicesVersion(id=SERVICES_VERSION_ID, version=1))
+    await session.commit()
+    services_changed.set()
+
+
 async def add_initial_services() -> None:
     """Adds initial services, overwriting on name collision"""
     async with SessionLocal() as session:
@@ -29,8 +61,8 @@ async def add_initial_services() -> None:
                     old = await get_service_by_name(session, svc.name or "")
 
                     if old is not None:
-                        old.update(**svc.dict())
-                        await session.commit()
+                        old.update(svc.name, svc.url, svc.path, svc.blocked)
+                        await commit_changes(session)
                     else:
                         _, key = await _add_service_inner(session, svc)
                         info(
@@ -45,10 +77,10 @@ async def add_initial_services() -> None:
 async def get_all_services_inner(
     session: AsyncSession,
     offset: int = 0,
-    limit: int = 100,
+    limit: Optional[int] = 100,
     blocked: Optional[bool] = None,
 ) -> Sequence[DBService]:
-    """Returns all services in DB"""
+    """Returns all services in DB. If `limit` is None, there's no limit"""
     query = select(DBService)
 
     if blocked is not None:
@@ -70,7 +102,7 @@ async def get_all_services(
     db_services = await get_all_services_inner(session, offset, limit, blocked)
     services = list(map(Service.from_orm, db_services))
 
-    await update_statuses(services)
+    update_statuses(services)
 
     if up is not None:
         services = [s for s in services if s.up == up]
@@ -104,7 +136,7 @@ async def get_service(
 
     service = Service.from_orm(db_service)
 
-    await update_statuses([service])
+    update_statuses([service])
 
     return service
 
@@ -140,6 +172,7 @@ async def add_service(
 
     added_service = ServiceWithApikey.from_orm(new_service)
     added_service.apikey = apikey
+    update_statuses([added_service])
 
     return added_service
 
@@ -155,7 +188,7 @@ async def _add_service_inner(
     new_service = DBService(apikey=apikey, **service.dict())
 
     session.add(new_service)
-    await session.commit()
+    await commit_changes(session)
 
     return new_service, apikey
 
@@ -174,11 +207,14 @@ async def patch_service(
     if patch.name is not None and patch.name != service.name:
         await check_name_is_unique(session, patch.name)
 
-    service.update(**patch.dict())
+    service.update(**patch.dict(exclude_unset=True))
 
     session.add(service)
+    await commit_changes(session)
 
-    return Service.from_orm(service)
+    patched_service = Service.from_orm(service)
+    update_statuses([patched_service])
+    return patched_service
 
 
 async def delete_service(session: AsyncSession, id: int) -> Service:
@@ -189,5 +225,8 @@ async def delete_service(session: AsyncSession, id: int) -> Service:
         raise HTTPException(HTTPStatus.NOT_FOUND, "Service not found")
 
     await session.delete(service)
+    await commit_changes(session)
 
-    return Service.from_orm(service)
+    deleted_service = Service.from_orm(service)
+    update_statuses([deleted_service])
+    return deleted_service
@@ -1,38 +1,121 @@
 import asyncio
-from typing import List
-from cachetools import TTLCache
-from httpx import AsyncClient, RequestError
+import random
+from typing import Any, Dict, List, NamedTuple, Tuple
+from httpx import RequestError, Timeout
+from sqlalchemy import select
 
+from src.api.bulkhead import bulkheads
+from src.api.circuit_breaker import circuit_breakers
+from src.api.clients import APIKEY_HEADER, client_pool
+from src.api.config import (
+    HEALTH_CHECK_CONCURRENCY,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_JITTER,
+    HEALTH_CHECK_TIMEOUT,
+)
 from src.api.model.service import Service
+from src.db.model.service import DBService
+from src.db.session import SessionLocal
 from src.logging import warn
 
 
-async def _updated_service_status(service: Service) -> bool:
+service_statuses: Dict[int, bool] = {}
+"""Result of the last health check of each service, by ID. A service is up
+if any of its URLs is"""
+
+endpoint_statuses: Dict[Tuple[int, str], bool] = {}
+"""Result of the last health check of each service URL, by ID and URL"""
+
+
+class CheckedEndpoint(NamedTuple):
+    id: int
+    name: str
+    url: str
+    apikey: str
+
+
+async def check_endpoint_status(endpoint: CheckedEndpoint) -> bool:
     try:
-        assert service.url is not None  # cannot fail
-        async with AsyncClient(base_url=service.url) as client:
-            response = await client.get("/health")
+        svc_client = client_pool.get(endpoint.id, endpoint.url)
+        request = svc_client.client.build_request(
+            "GET",
+            "/health",
+            headers={APIKEY_HEADER: endpoint.apikey},
+            timeout=Timeout(HEALTH_CHECK_TIMEOUT),
+        )
+        response = await svc_client.send(request)
         return response.is_success
     except RequestError as e:
-        warn(f"Failed to retrieve status from '{service.name}': {e}")
+        warn(f"Failed to retrieve status from '{endpoint.name}': {e}")
 
     return False
 
 
-status_cache: TTLCache[Service, bool] = TTLCache(maxsize=1024, ttl=4)
+async def get_checked_endpoints() -> List[CheckedEndpoint]:
+    async with SessionLocal() as session:
+        services = await session.scalars(
+            select(DBService).filter_by(blocked=False)
+        )
+        return [
+            CheckedEndpoint(svc.id, svc.name, url, svc.apikey)
+            for svc in services
+            for url in svc.urls
+        ]
+
 
+async def check_statuses() -> None:
+    """Checks the health of every URL of the services that aren't blocked"""
+    # NOTE: shielded so cancelling doesn't leave the DB locked
+    endpoints = await asyncio.shield(get_checked_endpoints())
+    semaphore = asyncio.Semaphore(HEALTH_CHECK_CONCURRENCY)
 
-async def updated_service_status(service: Service) -> bool:
-    if service not in status_cache:
-        status_cache[service] = await _updated_service_status(service)
+    async def check(endpoint: CheckedEndpoint) -> bool:
+        async with semaphore:
+            return await check_endpoint_status(endpoint)
 
-    return status_cache[service]
+    statuses = await asyncio.gather(*map(check, endpoints))
+
+    # blocked and deleted services are dropped
+    service_statuses.clear()
+    endpoint_statuses.clear()
+    for endpoint, status in zip(endpoints, statuses):
+        endpoint_statuses[(endpoint.id, endpoint.url)] = status
+        service_statuses[endpoint.id] = (
+            service_statuses.get(endpoint.id, False) or status
+        )
+
+
+def update_statuses(services: List[Service]) -> None:
+    """
+    Sets the services' status, as seen in the last health check, along with
+    the state of their circuits and their in-flight and queued requests.
+    """
+    for service in services:
+        assert service.url is not None  # cannot fail
+        urls = [service.url, *service.endpoints]
+        service.up = service_statuses.get(service.id, False)
+        service.circuit_state = circuit_breakers.service_state(
+            service.id, urls
+        )
+        service.in_flight = {
+            url: client_pool.in_flight(service.id, url) for url in urls
+        }
+        service.bulkhead = bulkheads.stats(service.id)
+
+
+async def monitor_health() -> None:
+    try:
+        while True:
+            try:
+                await check_statuses()
+            except Exception as e:
+                warn(f"Failed to check the services' health: {e}")
 
+            jitter = random.uniform(-HEALTH_CHECK_JITTER, HEALTH_CHECK_JITTER)
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL * (1 + jitter))
+    except asyncio.CancelledError:  # task was cancelled
+        return
 
-async def update_statuses(services: List[Service]) -> None:
-    statuses = await asyncio.gather(
-        *[updated_service_status(svc) for svc in services]
-    )
 
-    for status, service in zip(statuses, services):
-        service.up = status
+def launch_health_monitor() -> asyncio.Task[Any]:
+    return asyncio.create_task(monitor_health())
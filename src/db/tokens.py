@@ -1,18 +1,103 @@
+import asyncio
 import time
-from sqlalchemy import select, delete
+from typing import Any, Dict, Optional, Tuple, cast
+from sqlalchemy import CursorResult, select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.db.config import (
+    REVOCATION_MAX_STALENESS,
+    REVOCATION_SYNC_INTERVAL,
+    TOKEN_CLEANUP_BATCH,
+    TOKEN_CLEANUP_INTERVAL,
+)
 from src.db.model.token import DBToken
+from src.db.session import SessionLocal
+from src.logging import debug, warn
 
 
-async def token_was_invalidated(
-    session: AsyncSession,
-    sub: int,
-    iat: int,
-) -> bool:
-    invalidated_token = await session.scalar(
-        select(DBToken).filter_by(sub=sub, iat=iat).limit(1)
-    )
+# ids allocated before a sync may be committed after it, so each sync
+# re-reads this many ids below the high-water mark
+SYNC_OVERLAP = 100
+
+
+class RevocationIndex:
+    """
+    In-memory copy of the invalidated tokens that haven't expired, so
+    checking a token doesn't need a DB query.
+
+    Other replicas' invalidations are picked up by periodically reading the
+    entries past the highest ID seen (the high-water mark).
+    """
+
+    def __init__(
+        self, max_staleness: float = REVOCATION_MAX_STALENESS
+    ) -> None:
+        self.max_staleness = max_staleness
+        self.high_water_mark = 0
+        self.synced_at: Optional[float] = None
+        self._revoked: Dict[Tuple[int, int], int] = {}  # (sub, iat) -> exp
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def add(self, sub: int, iat: int, exp: int) -> None:
+        self._revoked[(sub, iat)] = exp
+
+    def was_invalidated(self, sub: int, iat: int) -> Optional[bool]:
+        """Returns None if the index is too outdated to be trusted"""
+        if (
+            self.synced_at is None
+            or time.monotonic() - self.synced_at > self.max_staleness
+        ):
+            return None
+        return (sub, iat) in self._revoked
+
+    def prune(self, now: int) -> None:
+        """Removes entries already past their expiration date"""
+        self._revoked = {
+            k: exp for k, exp in self._revoked.items() if exp >= now
+        }
+
+    async def sync(self, session: AsyncSession) -> None:
+        """Adds the entries added to the DB since the last sync"""
+        started_at = time.monotonic()
+        now = int(time.time())
+
+        rows = await session.execute(
+            select(DBToken.id, DBToken.sub, DBToken.iat, DBToken.exp).where(
+                DBToken.id > self.high_water_mark - SYNC_OVERLAP,
+                DBToken.exp >= now,
+            )
+        )
+        # NOTE: this relies on IDs never being reused, like postgres does
+        for id, sub, iat, exp in rows:
+            self.add(sub, iat, exp)
+            self.high_water_mark = max(self.high_water_mark, id)
+
+        self.prune(now)
+        self.synced_at = started_at
+
+    async def reload(self, session: AsyncSession) -> None:
+        """Replaces the index's content with the DB's"""
+        self.high_water_mark = 0
+        self.synced_at = None
+        self._revoked.clear()
+        await self.sync(session)
+
+
+revocation_index = RevocationIndex()
+
+
+async def token_was_invalidated(sub: int, iat: int) -> bool:
+    invalidated = revocation_index.was_invalidated(sub, iat)
+    if invalidated is not None:
+        return invalidated
+
+    # NOTE: the session is only held for the query, not the whole request
+    async with SessionLocal() as session:
+        invalidated_token = await session.scalar(
+            select(DBToken).filter_by(sub=sub, iat=iat).limit(1)
+        )
     return invalidated_token is not None
 
 
@@ -22,20 +107,91 @@ async def invalidate_token(
     iat: int,
     exp: int,
 ) -> None:
-    await clean_up_old_entries(session)
-
     token = DBToken(sub=sub, iat=iat, exp=exp)
 
     session.add(token)
+    revocation_index.add(sub, iat, exp)
 
 
 async def clean_up_old_entries(
-    session: AsyncSession,
-) -> None:
+    session: AsyncSession, limit: int = TOKEN_CLEANUP_BATCH
+) -> int:
     """
-    Deletes entries already past their expiration date.
+    Deletes up to `limit` entries already past their expiration date,
+    returning how many were deleted.
     Doesn't commit changes to database.
     """
-    await session.execute(
-        delete(DBToken).where(DBToken.exp < int(time.time()))
+    expired = (
+        select(DBToken.id)
+        .where(DBToken.exp < int(time.time()))
+        .limit(limit)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        delete(DBToken).where(DBToken.id.in_(expired))
     )
+    # NOTE: DELETE statements always return a CursorResult
+    return cast(CursorResult[Any], result).rowcount
+
+
+async def _clean_up_batch() -> int:
+    async with SessionLocal() as session:
+        async with session.begin():
+            return await clean_up_old_entries(session)
+
+
+async def clean_up_expired_tokens() -> None:
+    """Deletes expired tokens, in short transactions to avoid long locks"""
+    deleted = TOKEN_CLEANUP_BATCH
+    total = 0
+    while deleted == TOKEN_CLEANUP_BATCH:
+        # NOTE: shielded so cancelling doesn't leave the DB locked
+        deleted = await asyncio.shield(_clean_up_batch())
+        total += deleted
+    debug(f"Deleted {total} expired tokens")
+
+
+async def clean_up_tokens_periodically() -> None:
+    try:
+        while True:
+            # NOTE: waits first, so startup doesn't compete with the cleanup
+            await asyncio.sleep(TOKEN_CLEANUP_INTERVAL)
+            try:
+                await clean_up_expired_tokens()
+            except Exception as e:
+                warn(f"Failed to delete expired tokens: {e}")
+    except asyncio.CancelledError:  # task was cancelled
+        return
+
+
+def launch_token_cleanup() -> asyncio.Task[Any]:
+    return asyncio.create_task(clean_up_tokens_periodically())
+
+
+async def load_revocation_index() -> None:
+    async with SessionLocal() as session:
+        await revocation_index.reload(session)
+
+
+async def _sync_revocation_index() -> None:
+    async with SessionLocal() as session:
+        await revocation_index.sync(session)
+
+
+async def sync_revocation_index() -> None:
+    """Keeps the revocation index up to date with other replicas' changes"""
+    try:
+        while True:
+            await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+            try:
+                # NOTE: shielded so cancelling doesn't leave the DB locked
+                await asyncio.shield(_sync_revocation_index())
+            except Exception as e:
+                # the index falls back to the DB once it's too outdated
+                warn(f"Failed to sync the revocation index: {e}")
+    except asyncio.CancelledError:  # task was cancelled
+        return
+
+
+def launch_revocation_index_sync() -> asyncio.Task[Any]:
+    return asyncio.create_task(sync_revocation_index())
@@ -0,0 +1,80 @@
+import time
+
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from src.db.model.token import DBToken
+from src.db.session import SessionLocal
+from src.db import tokens as tokens_db
+from src.db.tokens import RevocationIndex, revocation_index
+
+
+def test_revocation_index_prunes_expired_entries() -> None:
+    index = RevocationIndex()
+    index.synced_at = time.monotonic()
+    index.add(sub=1, iat=10, exp=100)
+    index.add(sub=1, iat=20, exp=200)
+
+    index.prune(now=150)
+
+    assert len(index) == 1
+    assert index.was_invalidated(1, 10) is False
+    assert index.was_invalidated(1, 20) is True
+
+
+def test_outdated_revocation_index_is_not_trusted() -> None:
+    index = RevocationIndex(max_staleness=10)
+    index.add(sub=1, iat=10, exp=100)
+    assert index.was_invalidated(1, 10) is None
+
+    index.synced_at = time.monotonic() - 20
+    assert index.was_invalidated(1, 10) is None
+
+
+async def test_invalidated_tokens_are_indexed(client: AsyncClient) -> None:
+    exp = int(time.time()) + 60
+    async with SessionLocal() as session:
+        async with session.begin():
+            await tokens_db.invalidate_token(session, 1, 10, exp)
+
+    assert revocation_index.was_invalidated(1, 10) is True
+    assert revocation_index.was_invalidated(1, 11) is False
+
+
+async def test_revocation_index_syncs_other_replicas(
+    client: AsyncClient,
+) -> None:
+    exp = int(time.time()) + 60
+    async with SessionLocal() as session:
+        async with session.begin():
+            # as done by another replica
+            session.add(DBToken(sub=2, iat=10, exp=exp))
+
+    assert revocation_index.was_invalidated(2, 10) is False
+
+    async with SessionLocal() as session:
+        await revocation_index.sync(session)
+    assert revocation_index.was_invalidated(2, 10) is True
+
+    # the DB is used while the index can't be trusted
+    revocation_index.synced_at = None
+    assert await tokens_db.token_was_invalidated(2, 10)
+    assert not await tokens_db.token_was_invalidated(2, 11)
+
+
+async def test_clean_up_old_entries_in_batches(client: AsyncClient) -> None:
+    now = int(time.time())
+    async with SessionLocal() as session:
+        async with session.begin():
+            for iat in range(5):
+                session.add(DBToken(sub=3, iat=iat, exp=now - 1))
+            session.add(DBToken(sub=3, iat=10, exp=now + 60))
+
+    async with SessionLocal() as session:
+        async with session.begin():
+            assert await tokens_db.clean_up_old_entries(session, limit=3) == 3
+            assert await tokens_db.clean_up_old_entries(session, limit=3) == 2
+            assert await tokens_db.clean_up_old_entries(session, limit=3) == 0
+
+        remaining = await session.scalars(select(DBToken.iat))
+        assert list(remaining) == [10]
@@ -23,7 +23,10 @@ def error(msg: str) -> None:
     get_uvicorn_logger().error(msg)
 
 
-# disable /health endpoint logging
+# endpoints polled by kubernetes and prometheus, left out of the access logs
+EXCLUDED_ENDPOINTS = {"/health", "/metrics"}
+
+
 class EndpointFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         if record.args is None or len(record.args) < 3:
@@ -32,7 +35,7 @@ class EndpointFilter(logging.Filter):
         if not isinstance(record.args, tuple):
             return True
 
-        return record.args[2] != "/health"
+        return record.args[2] not in EXCLUDED_ENDPOINTS
 
 
 logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
@@ -1,34 +1,80 @@
+import asyncio
 import re
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator, Dict
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 
+from src.api.clients import client_pool
+from src.api.config import SNAPSHOT_DIR
 from src.api.proxy import launch_routing_table_generator
 from src.db.services import add_initial_services
-from src.api.schema_updater import launch_openapi_generator
+from src.db.status_updater import launch_health_monitor
+from src.db.tokens import (
+    launch_revocation_index_sync,
+    launch_token_cleanup,
+    load_revocation_index,
+)
+from src.api.encoding import encoded_response
+from src.api.metrics import CONTENT_TYPE, registry
+from src.api.schema_updater import (
+    get_openapi_document,
+    launch_openapi_generator,
+)
+from src.api.workers import WorkerCoordinator, launch_worker_coordinator
 from src.logging import info
 from src.db.migration import upgrade_db
 
 
+async def prepare_db() -> None:
+    info("Upgrading DB")
+    await upgrade_db()
+    await add_initial_services()
+
+
 @asynccontextmanager
 async def lifespan(
     app: FastAPI,
 ) -> AsyncGenerator[None, None]:
-    info("Upgrading DB")
-
-    await upgrade_db()
-    await add_initial_services()
-    openapi_generator = launch_openapi_generator(app)
-    routing_table_generator = launch_routing_table_generator()
+    if not SNAPSHOT_DIR:
+        await prepare_db()
+        await load_revocation_index()
+        background_tasks = [
+            launch_openapi_generator(app),
+            launch_routing_table_generator(),
+            launch_token_cleanup(),
+        ]
+        coordinator = None
+    else:
+        # only the leader worker prepares the DB and reads the services
+        coordinator = WorkerCoordinator()
+        if coordinator.try_lead():
+            coordinator.remove_snapshots()
+            await prepare_db()
+        elif await coordinator.wait_for_leader():
+            await prepare_db()
+        else:
+            await coordinator.follow(app)
+        await load_revocation_index()
+        background_tasks = [launch_worker_coordinator(app, coordinator)]
+
+    background_tasks += [
+        launch_revocation_index_sync(),
+        launch_health_monitor(),
+    ]
 
     yield
 
-    routing_table_generator.cancel()
-    openapi_generator.cancel()
+    for task in background_tasks:
+        task.cancel()
+    # wait for the tasks to finish, so they don't hold DB connections
+    await asyncio.wait(background_tasks)
+    await client_pool.aclose()
+    if coordinator is not None:
+        coordinator.close()
 
 
 app = FastAPI(
@@ -37,6 +83,8 @@ app = FastAPI(
     version="0.1.0",
     description="Kinetix's API gateway",
     docs_url=None,
+    # served by openapi_json, pre-encoded
+    openapi_url=None,
 )
 
 
@@ -68,6 +116,12 @@ async def health_check() -> Dict[str, str]:
     return {"status": "Alive and kicking!"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Gateway metrics, in the Prometheus text format"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon() -> FileResponse:
     return FileResponse("favicon.ico")
@@ -82,6 +136,13 @@ async def swagger_ui_html() -> HTMLResponse:
     )
 
 
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_json(request: Request) -> Response:
+    return encoded_response(
+        get_openapi_document(app), request, "application/json"
+    )
+
+
 # ----------
 # Subrouting
 # ----------
@@ -90,9 +151,11 @@ async def swagger_ui_html() -> HTMLResponse:
 def add_subrouters(app: FastAPI) -> None:
     """Set up subrouters"""
     from src.api.services import router as services_router
+    from src.api.profiler import router as profiler_router
     from src.api.proxy import router as proxy_router
 
     app.include_router(services_router)
+    app.include_router(profiler_router)
     # NOTE: the proxy_router needs to be declared last
     app.include_router(proxy_router)
 
@@ -0,0 +1,38 @@
+import gzip
+import json
+from http import HTTPStatus
+
+from httpx import AsyncClient
+
+from src.main import app
+
+
+async def test_openapi_is_served_encoded(client: AsyncClient) -> None:
+    response = await client.get(
+        "/openapi.json", headers={"accept-encoding": "identity"}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == app.openapi()
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    etag = response.headers["etag"]
+    response = await client.get(
+        "/openapi.json",
+        headers={"accept-encoding": "identity", "if-none-match": etag},
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+
+
+async def test_openapi_is_served_compressed(client: AsyncClient) -> None:
+    # NOTE: streamed, so httpx doesn't decompress the body
+    async with client.stream(
+        "GET", "/openapi.json", headers={"accept-encoding": "gzip"}
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        body = gzip.decompress(
+            b"".join([c async for c in response.aiter_raw()])
+        )
+
+    assert json.loads(body) == app.openapi()